@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Cursor pagination on (created_date, id), used by the incident list and the
+    notification inbox when ?cursor= is given.
+    Pages are fetched with a range condition on the index instead of
+    COUNT(*) and OFFSET, so deep pages cost the same as the first one.
+    The total is only computed on ?with_count=true and is cached briefly.
+    """
+    page_size = 15
+    page_size_query_param = "pageSize"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    # cached totals are keyed by this prefix, the user and the query params
+    count_cache_prefix = "keyset-count"
+    count_cache_timeout = 60
+
+    def encode_cursor(self, item):
+        position = "%s|%s" % (item.created_date.isoformat(), item.id)
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_date, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            created_date, item_id = parse_datetime(created_date), uuid.UUID(item_id)
+        except Exception:
+            raise NotFound("Invalid cursor")
+
+        # parse_datetime returns None for a well formed cursor with a bad date
+        if created_date is None:
+            raise NotFound("Invalid cursor")
+        return created_date, item_id
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param, "")
+
+        queryset = queryset.order_by("-created_date", "-id")
+        # the total is that of the whole filtered list, not of the rows after the cursor
+        page_queryset = queryset
+        if cursor:
+            created_date, item_id = self.decode_cursor(cursor)
+            page_queryset = queryset.filter(
+                Q(created_date__lt=created_date) | Q(created_date=created_date, id__lt=item_id))
+
+        results = list(page_queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_cursor = self.encode_cursor(results[-1]) if self.has_next else None
+
+        self.count = None
+        if request.query_params.get("with_count", None) == "true":
+            self.count = self.get_cached_count(queryset, request)
+
+        return results
+
+    def get_cached_count(self, queryset, request):
+        params = sorted((key, value) for key, value in request.query_params.items()
+                        if key not in (self.cursor_query_param, self.page_size_query_param))
+        cache_key = "%s:%s:%s" % (
+            self.count_cache_prefix, request.user.id, hashlib.md5(json.dumps(params).encode()).hexdigest())
+
+        count = cache.get(cache_key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(cache_key, count, self.count_cache_timeout)
+
+        return count
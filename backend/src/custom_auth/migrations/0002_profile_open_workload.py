@@ -0,0 +1,37 @@
+# Generated by Django 2.2.12 on 2026-10-17 16:15
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_open_workload(apps, schema_editor):
+    Incident = apps.get_model('incidents', 'Incident')
+    Profile = apps.get_model('custom_auth', 'Profile')
+
+    workloads = Incident.objects.exclude(assignee=None) \
+        .exclude(current_status__in=['CLOSED', 'INVALIDATED']) \
+        .values('assignee').annotate(count=Count('id')).values_list('assignee', 'count')
+
+    for user_id, count in workloads:
+        Profile.objects.filter(user_id=user_id).update(open_workload=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_auth', '0001_initial'),
+        ('incidents', '0050_incident_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='open_workload',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['division', 'level', 'open_workload'], name='profile_workload_idx'),
+        ),
+        migrations.RunPython(backfill_open_workload, migrations.RunPython.noop),
+    ]
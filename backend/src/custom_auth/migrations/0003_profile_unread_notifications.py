@@ -0,0 +1,32 @@
+# Generated by Django 2.2.12 on 2026-10-17 17:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_notifications(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    Profile = apps.get_model('custom_auth', 'Profile')
+
+    unread = Notification.objects.exclude(send_to=None).filter(is_read=False) \
+        .values('send_to').annotate(count=Count('id')).values_list('send_to', 'count')
+
+    for user_id, count in unread:
+        Profile.objects.filter(user_id=user_id).update(unread_notifications=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_auth', '0002_profile_open_workload'),
+        ('notifications', '0003_notification_inbox_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_notifications, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User, Group
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
 # User.add_to_class('is_ecstaff', models.BooleanField(default=False))
@@ -55,9 +55,20 @@ class Profile(models.Model):
     division = models.ForeignKey(Division, on_delete=models.DO_NOTHING, null=True, blank=True)
     level = models.ForeignKey(UserLevel, on_delete=models.DO_NOTHING, null=True, blank=True)
 
+    # number of open incidents assigned to the user, maintained by the incidents app
+    open_workload = models.IntegerField(default=0)
+
+    # number of unread notifications of the user, maintained by the notifications app
+    unread_notifications = models.IntegerField(default=0)
+
     def __str__(self):
         return '%s' % (self.user)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["division", "level", "open_workload"], name="profile_workload_idx"),
+        ]
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, **kwargs):
     user = kwargs['instance']
@@ -67,4 +78,20 @@ def create_user_profile(sender, **kwargs):
 
     profile = Profile()
     profile.user = user
-    profile.save()
\ No newline at end of file
+    profile.save()
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_role_permissions(sender, **kwargs):
+    from .services import invalidate_permission_cache
+
+    if kwargs['action'].startswith("post_"):
+        invalidate_permission_cache()
+
+@receiver(post_save, sender=UserLevel)
+@receiver(post_delete, sender=UserLevel)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_user_roles(sender, **kwargs):
+    from .services import invalidate_permission_cache
+
+    invalidate_permission_cache()
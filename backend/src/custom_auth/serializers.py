@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User, Permission, Group
+from .services import get_role_permissions
 
 class PermissionSerializer(serializers.ModelSerializer): 
     class Meta:
@@ -21,6 +22,17 @@ class UserSerializer(serializers.ModelSerializer):
     entity = serializers.SerializerMethodField()
     profile = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=""):
+        """ Loads the relations read by this serializer, prefix is the lookup path to the user """
+        return queryset.select_related(
+            prefix + "profile__organization",
+            prefix + "profile__division",
+            prefix + "profile__level",
+        ).prefetch_related(
+            prefix + "groups__permissions",
+        )
+
     def get_full_name(self, obj):
         return obj.first_name + " " + obj.last_name
 
@@ -56,13 +68,12 @@ class UserSerializer(serializers.ModelSerializer):
     def get_permissions(self, obj):
         if hasattr(obj, "profile"):
             if obj.profile.level is not None:
-                permissions = Permission.objects.filter(group=obj.profile.level.role)
-                permission_data = map(lambda p: p.codename, permissions)
-                return permission_data
+                return sorted(get_role_permissions(obj.profile.level.role_id))
 
-        if obj.groups.count() > 0:
-            group = obj.groups.all()[0]
-            permissions = Permission.objects.filter(group=group)
+        groups = obj.groups.all()
+        if len(groups) > 0:
+            group = groups[0]
+            permissions = group.permissions.all()
             permission_data = map(lambda p: p.codename, permissions)
             return permission_data
         
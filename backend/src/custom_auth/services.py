@@ -1,16 +1,133 @@
 from .exceptions import IdentityException
+from .models import UserLevel, Profile
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
+from django.db.models import F
+import time
+
+# role and user lookups are cached in-process and in the shared django cache,
+# both keyed by a version that is bumped whenever permissions or levels change
+PERMISSION_CACHE_VERSION_KEY = "custom-auth:permission-cache-version"
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+
+# local entries are re-read from the shared cache after a few seconds, and all of them are
+# dropped as soon as another process bumps the version
+PERMISSION_LOCAL_CACHE_TIMEOUT = 10
+
+_local_permission_cache = {}
+_local_permission_cache_version = None
+
+def get_permission_cache_version():
+    version = cache.get(PERMISSION_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(PERMISSION_CACHE_VERSION_KEY, 1, None)
+        version = cache.get(PERMISSION_CACHE_VERSION_KEY, 1)
+    return version
+
+def invalidate_permission_cache():
+    try:
+        cache.incr(PERMISSION_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(PERMISSION_CACHE_VERSION_KEY, 1, None)
+    _local_permission_cache.clear()
+
+def get_cached(key, loader):
+    global _local_permission_cache_version
+
+    version = get_permission_cache_version()
+    if version != _local_permission_cache_version:
+        # entries of older versions are never read again
+        _local_permission_cache.clear()
+        _local_permission_cache_version = version
+
+    now = time.monotonic()
+    cached = _local_permission_cache.get(key)
+    if cached is None or cached[1] <= now:
+        shared_key = "custom-auth:%s:%s" % (version, key)
+        value = cache.get(shared_key)
+        if value is None:
+            value = loader()
+            cache.set(shared_key, value, PERMISSION_CACHE_TIMEOUT)
+        cached = (value, now + PERMISSION_LOCAL_CACHE_TIMEOUT)
+        _local_permission_cache[key] = cached
+
+    return cached[0]
+
+def get_role_permissions(role_id) -> frozenset:
+    """ Returns the permission codenames granted to a role (auth group) """
+    return get_cached(
+        "role:%s" % role_id,
+        lambda: frozenset(Permission.objects.filter(group=role_id).values_list("codename", flat=True))
+    )
+
+def get_user_role_id(user: User):
+    """ Returns the role of the user's level, raises if the user has no level """
+    def load_role_id():
+        return {"role_id": user.profile.level.role_id}
+
+    return get_cached("user:%s" % user.id, load_role_id)["role_id"]
 
 def user_can(user: User, permission: str):
     try:
         if user.username == "admin":
             return True
 
-        permission = Permission.objects.get(codename=permission)
-        user_level = user.profile.level
-        user_permissions = permissions = Permission.objects.filter(group=user_level.role)
-        return permission in user_permissions
+        return permission in get_role_permissions(get_user_role_id(user))
     except:
         raise IdentityException("Unkown permission error")
 
-    return False
\ No newline at end of file
+    return False
+
+
+def get_level_ancestors(level_id):
+    """ Returns (id, code, role_id) for the parents of a user level, nearest first.
+        The level hierarchy is small and loaded once per permission cache version.
+    """
+    hierarchy = get_cached(
+        "levels",
+        lambda: {level.id: (level.code, level.parent_id, level.role_id) for level in UserLevel.objects.all()}
+    )
+
+    ancestors = []
+    visited = {level_id}
+    parent_id = hierarchy[level_id][1] if level_id in hierarchy else None
+    while parent_id is not None and parent_id not in visited:
+        visited.add(parent_id)
+        code, next_parent_id, role_id = hierarchy[parent_id]
+        ancestors.append((parent_id, code, role_id))
+        parent_id = next_parent_id
+
+    return ancestors
+
+def find_least_loaded_user(level_codes, division_code):
+    """ Returns the active user with the lowest open workload from the first of the
+        given levels (by code, in order) that has any user in the division
+    """
+    candidates = Profile.objects.filter(
+        level__code__in=level_codes,
+        level__role__isnull=False,
+        division__code=division_code,
+        user__is_active=True
+    ).order_by("open_workload", "user_id").values_list("user_id", "level__code")
+
+    least_loaded = {}
+    for user_id, level_code in candidates:
+        least_loaded.setdefault(level_code, user_id)
+
+    for level_code in level_codes:
+        if level_code in least_loaded:
+            return User.objects.get(id=least_loaded[level_code])
+
+    return None
+
+def adjust_open_workload(user_id, delta):
+    if user_id is None or delta == 0:
+        return
+
+    Profile.objects.filter(user_id=user_id).update(open_workload=F("open_workload") + delta)
+
+def set_open_workloads(workloads):
+    """ Overwrites the open workload counters with the given {user_id: count} """
+    Profile.objects.exclude(user_id__in=workloads.keys()).update(open_workload=0)
+    for user_id, count in workloads.items():
+        Profile.objects.filter(user_id=user_id).update(open_workload=count)
@@ -1,3 +1,61 @@
+from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Organization, UserLevel
+from .services import user_can, invalidate_permission_cache, PERMISSION_CACHE_VERSION_KEY
+
+
+class UserCanTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        organization = Organization.objects.create(code="org", displayName="Org")
+        cls.role = Group.objects.create(name="coordinator")
+        cls.other_role = Group.objects.create(name="manager")
+        cls.permission, cls.other_permission = Permission.objects.all()[:2]
+        cls.role.permissions.add(cls.permission)
+        cls.other_role.permissions.add(cls.other_permission)
+
+        cls.level = UserLevel.objects.create(code="coordinator", displayName="Coordinator",
+                                             organization=organization, role=cls.role)
+        cls.other_level = UserLevel.objects.create(code="manager", displayName="Manager",
+                                                   organization=organization, role=cls.other_role)
+
+        user = User.objects.create(username="coordinator")
+        user.profile.level = cls.level
+        user.profile.save()
+
+    def setUp(self):
+        invalidate_permission_cache()
+        self.user = User.objects.get(username="coordinator")
+
+    def test_steady_state_costs_no_queries(self):
+        self.assertTrue(user_can(self.user, self.permission.codename))
+
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(user_can(user, self.permission.codename))
+            self.assertFalse(user_can(user, self.other_permission.codename))
+
+    def test_group_permission_change_invalidates(self):
+        self.assertFalse(user_can(self.user, self.other_permission.codename))
+        self.role.permissions.add(self.other_permission)
+        self.assertTrue(user_can(self.user, self.other_permission.codename))
+
+    def test_profile_level_change_invalidates(self):
+        self.assertTrue(user_can(self.user, self.permission.codename))
+
+        self.user.profile.level = self.other_level
+        self.user.profile.save()
+
+        user = User.objects.get(id=self.user.id)
+        self.assertFalse(user_can(user, self.permission.codename))
+        self.assertTrue(user_can(user, self.other_permission.codename))
+
+    def test_version_bumped_by_another_process_drops_local_entries(self):
+        self.assertTrue(user_can(self.user, self.permission.codename))
+        # revoked and invalidated by another worker, which does not touch this process' local cache
+        Group.permissions.through.objects.filter(group=self.role, permission=self.permission).delete()
+        cache.incr(PERMISSION_CACHE_VERSION_KEY)
+
+        self.assertFalse(user_can(self.user, self.permission.codename))
@@ -19,7 +19,7 @@ class UserList(APIView):
         if param_user_org is not None and param_user_org != "":
             users = users.filter(groups__organization__id=param_user_org)
 
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(UserSerializer.setup_eager_loading(users), many=True)
         return Response(serializer.data)
 
 class OrganizationList(APIView):
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# database alias of the read replica used by reports and exports, see settings.DATABASES
+REPORTING_DB = "reporting"
+
+_reads = threading.local()
+_replica_health = {"checked_at": None, "healthy": False, "checking": False}
+_replica_health_lock = threading.Lock()
+
+
+def get_replica_lag(alias):
+    """ Seconds the replica is behind the primary, None when replication is not running """
+    connection = connections[alias]
+    if connection.vendor != "mysql":
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        if row is None:
+            # not a replica, the alias points to a primary
+            return 0
+        status = dict(zip([column[0] for column in cursor.description], row))
+
+    return status.get("Seconds_Behind_Master")
+
+
+def is_replica_healthy() -> bool:
+    """ Whether the replica is within REPORTING_MAX_REPLICA_LAG seconds of the primary, checked at
+        most once every REPORTING_REPLICA_CHECK_INTERVAL seconds per process
+    """
+    now = time.monotonic()
+    with _replica_health_lock:
+        checked_at = _replica_health["checked_at"]
+        if checked_at is not None and now - checked_at < settings.REPORTING_REPLICA_CHECK_INTERVAL:
+            return _replica_health["healthy"]
+        # other threads keep the last answer instead of waiting for a slow replica
+        if _replica_health["checking"]:
+            return _replica_health["healthy"]
+        _replica_health["checking"] = True
+
+    healthy = False
+    try:
+        try:
+            lag = get_replica_lag(REPORTING_DB)
+        except DatabaseError as e:
+            logger.warning("reporting replica is unavailable: %s", e)
+            lag = None
+
+        healthy = lag is not None and lag <= settings.REPORTING_MAX_REPLICA_LAG
+        if not healthy and lag is not None:
+            logger.warning("reporting replica is %ss behind, reading from the primary", lag)
+    finally:
+        with _replica_health_lock:
+            _replica_health["checked_at"] = now
+            _replica_health["healthy"] = healthy
+            _replica_health["checking"] = False
+
+    return healthy
+
+
+def get_reporting_db() -> str:
+    """ The alias report and export reads go to: the replica when one is configured and it is
+        not lagging behind, otherwise the primary
+    """
+    if REPORTING_DB not in connections.databases:
+        return DEFAULT_DB_ALIAS
+    return REPORTING_DB if is_replica_healthy() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reporting_reads():
+    """ Routes the model reads of the block to the reporting database, yields its alias """
+    previous = getattr(_reads, "alias", None)
+    _reads.alias = previous or get_reporting_db()
+    try:
+        yield _reads.alias
+    finally:
+        _reads.alias = previous
+
+
+def get_reporting_connection():
+    """ Connection for the raw report sql, the one of the enclosing reporting_reads block """
+    return connections[getattr(_reads, "alias", None) or get_reporting_db()]
+
+
+class ReportingRouter:
+    """ Sends reads inside reporting_reads blocks to the reporting database. Writes, and
+        select_for_update reads, always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_reads, "alias", None)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPORTING_DB
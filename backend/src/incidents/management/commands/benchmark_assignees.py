@@ -0,0 +1,92 @@
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ....custom_auth.models import Organization, Division, UserLevel, Profile
+from ...models import Incident
+from ...services import find_escalation_candidate, recount_open_workloads
+
+
+class Command(BaseCommand):
+    help = "Picks escalation candidates among synthetic users and incidents and reports latency and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--incidents", type=int, default=500000)
+        parser.add_argument("--divisions", type=int, default=25)
+        parser.add_argument("--levels", type=int, default=4)
+        parser.add_argument("--lookups", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        prefix = "bench-%s" % uuid.uuid4().hex[:8]
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            organization = Organization.objects.create(code=prefix[-8:], displayName=prefix)
+            divisions = [Division.objects.create(code="%s-hq" % prefix, organization=organization, is_hq=True)] + [
+                Division.objects.create(code="%s-%d" % (prefix, i), organization=organization)
+                for i in range(options["divisions"])
+            ]
+
+            # a chain of levels, the first is the lowest
+            levels = []
+            parent = None
+            for i in reversed(range(options["levels"])):
+                parent = UserLevel.objects.create(code="%s-level-%d" % (prefix, i), displayName="Level %d" % i,
+                                                  organization=organization, parent=parent,
+                                                  role=Group.objects.create(name="%s-role-%d" % (prefix, i)))
+                levels.insert(0, parent)
+
+            User.objects.bulk_create(User(username="%s-user-%d" % (prefix, i)) for i in range(options["users"]))
+            users = list(User.objects.filter(username__startswith="%s-user-" % prefix).order_by("id"))
+            Profile.objects.bulk_create(
+                Profile(user=user, organization=organization, division=divisions[i % len(divisions)],
+                        level=levels[i % len(levels)])
+                for i, user in enumerate(users)
+            )
+
+        statuses = ["NEW", "VERIFIED", "ACTION_PENDING", "CLOSED", "INVALIDATED"]
+        for batch in range(0, options["incidents"], 10000):
+            Incident.objects.bulk_create([
+                Incident(refId="%s/%07d" % (prefix, i), title="Benchmark incident %d" % i, description="d",
+                         current_status=statuses[i % len(statuses)], assignee=random.choice(users))
+                for i in range(batch, min(batch + 10000, options["incidents"]))
+            ])
+        self.stdout.write("created %d users and %d incidents in %.2fs" % (
+            options["users"], options["incidents"], time.perf_counter() - started))
+
+        try:
+            started = time.perf_counter()
+            recount_open_workloads()
+            self.stdout.write("recounted open workloads in %.2fs" % (time.perf_counter() - started))
+
+            lowest = [user for i, user in enumerate(users) if i % len(levels) == 0]
+            timings = []
+            queries = 0
+            for _ in range(options["lookups"]):
+                user = User.objects.select_related("profile__division", "profile__level", "profile__organization") \
+                    .get(id=random.choice(lowest).id)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    find_escalation_candidate(user)
+                    timings.append(time.perf_counter() - started)
+                queries += len(captured)
+
+            timings.sort()
+            self.stdout.write("%d lookups: mean %.2fms, p50 %.2fms, p99 %.2fms, %.1f queries per lookup" % (
+                len(timings), 1000 * sum(timings) / len(timings), 1000 * timings[len(timings) // 2],
+                1000 * timings[int(len(timings) * 0.99)], queries / len(timings)))
+        finally:
+            Incident.objects.filter(refId__startswith="%s/" % prefix).delete()
+            Profile.objects.filter(organization=organization).delete()
+            User.objects.filter(username__startswith="%s-user-" % prefix).delete()
+            UserLevel.objects.filter(organization=organization).update(parent=None)
+            UserLevel.objects.filter(organization=organization).delete()
+            Group.objects.filter(name__startswith="%s-role-" % prefix).delete()
+            Division.objects.filter(organization=organization).delete()
+            organization.delete()
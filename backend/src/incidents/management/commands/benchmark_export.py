@@ -0,0 +1,53 @@
+import resource
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...models import Incident
+from ...services import get_fitlered_incidents_report
+
+
+class Command(BaseCommand):
+    help = "Exports synthetic incidents as csv or xlsx and checks the peak memory against a ceiling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+        parser.add_argument("--max-rss-mb", type=int, default=300,
+                            help="fail when the peak resident memory of the process exceeds this")
+
+    def handle(self, *args, **options):
+        prefix = "BENCH/%s" % uuid.uuid4().hex[:8]
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for batch in range(0, options["rows"], 10000):
+                Incident.objects.bulk_create([
+                    Incident(refId="%s/%07d" % (prefix, i), title="Benchmark incident %d" % i,
+                             description="Benchmark description %d" % i, current_status="NEW")
+                    for i in range(batch, min(batch + 10000, options["rows"]))
+                ])
+        self.stdout.write("inserted %d incidents in %.2fs" % (options["rows"], time.perf_counter() - started))
+
+        try:
+            # memory used before the export starts is not counted against the ceiling
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+            started = time.perf_counter()
+            response = get_fitlered_incidents_report(
+                Incident.objects.filter(refId__startswith=prefix), options["format"])
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            elapsed = time.perf_counter() - started
+
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+        finally:
+            Incident.objects.filter(refId__startswith=prefix).delete()
+
+        self.stdout.write("exported %d rows (%.1fMB) as %s in %.2fs (%.0f rows/s)" % (
+            options["rows"], size / 2 ** 20, options["format"], elapsed, options["rows"] / elapsed))
+        self.stdout.write("peak rss: %dMB (before export: %dMB)" % (peak, baseline))
+
+        if peak > options["max_rss_mb"]:
+            raise CommandError("peak rss %dMB exceeds the %dMB ceiling" % (peak, options["max_rss_mb"]))
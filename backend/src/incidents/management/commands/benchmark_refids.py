@@ -0,0 +1,51 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...models import ReferenceSequence, allocate_reference_number
+
+
+class Command(BaseCommand):
+    help = "Allocates reference numbers from concurrent writers and reports latency and duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=32)
+        parser.add_argument("--count", type=int, default=100000,
+                            help="total number of reference numbers to allocate")
+
+    def handle(self, *args, **options):
+        writers = options["writers"]
+        per_writer = options["count"] // writers
+        key = "BENCH/%s" % uuid.uuid4().hex
+
+        def allocate(_):
+            numbers = []
+            timings = []
+            try:
+                for _ in range(per_writer):
+                    start = time.perf_counter()
+                    numbers.append(allocate_reference_number(key))
+                    timings.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+            return numbers, timings
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            results = list(executor.map(allocate, range(writers)))
+        elapsed = time.perf_counter() - started
+
+        numbers = [number for result in results for number in result[0]]
+        # the first and last allocations of each writer show whether cost grows with volume
+        first = [t for result in results for t in result[1][:100]]
+        last = [t for result in results for t in result[1][-100:]]
+
+        ReferenceSequence.objects.filter(key=key).delete()
+
+        self.stdout.write("allocated: %d in %.2fs (%.0f/s)" % (len(numbers), elapsed, len(numbers) / elapsed))
+        self.stdout.write("duplicates: %d" % (len(numbers) - len(set(numbers))))
+        self.stdout.write("mean latency first 100: %.3fms, last 100: %.3fms" % (
+            1000 * sum(first) / max(len(first), 1), 1000 * sum(last) / max(len(last), 1)))
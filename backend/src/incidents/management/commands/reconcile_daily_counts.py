@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import get_report_day
+from ...services import reconcile_daily_counts
+
+
+class Command(BaseCommand):
+    help = "Recomputes the daily report counts of the last closed days from the incidents table, run nightly"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=2,
+                            help="number of days to reconcile, ending yesterday")
+        parser.add_argument("--all", action="store_true",
+                            help="rebuild the counts of every day")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            counted = reconcile_daily_counts()
+            self.stdout.write("Rebuilt the daily counts of %d incidents" % counted)
+            return
+
+        # today is still counted incrementally by incident saves
+        end_day = get_report_day(timezone.now()) - timedelta(days=1)
+        start_day = end_day - timedelta(days=options["days"] - 1)
+        counted = reconcile_daily_counts(start_day, end_day)
+        self.stdout.write("Reconciled %d incidents from %s to %s" % (counted, start_day, end_day))
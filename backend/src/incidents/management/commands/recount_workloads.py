@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...services import recount_open_workloads
+
+
+class Command(BaseCommand):
+    help = "Recomputes the open workload counter of every user from the incidents table"
+
+    def handle(self, *args, **options):
+        workloads = recount_open_workloads()
+        self.stdout.write("Recounted %d open incidents for %d users" % (sum(workloads.values()), len(workloads)))
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.12 on 2026-10-17 16:08
+
+from django.db import migrations, models
+
+
+def backfill_status_projection(apps, schema_editor):
+    """ Copies the latest IncidentStatus of each incident onto the incident row """
+    Incident = apps.get_model('incidents', 'Incident')
+    IncidentStatus = apps.get_model('incidents', 'IncidentStatus')
+
+    latest = {}
+    statuses = IncidentStatus.objects.order_by('incident_id', 'created_date', 'id') \
+        .values_list('incident_id', 'current_status', 'previous_status', 'created_date')
+    for incident_id, current_status, previous_status, created_date in statuses.iterator():
+        latest[incident_id] = (current_status, previous_status, created_date)
+
+    for incident_id, (current_status, previous_status, created_date) in latest.items():
+        Incident.objects.filter(id=incident_id).update(
+            current_status=current_status,
+            previous_status=previous_status,
+            status_since=created_date
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0048_referencesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incident',
+            name='previous_status',
+            field=models.CharField(blank=True, default=None, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='status_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['current_status', 'status_since'], name='incident_status_since_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidentstatus',
+            index=models.Index(fields=['incident', 'created_date'], name='incidentstatus_history_idx'),
+        ),
+        migrations.RunPython(backfill_status_projection, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.12 on 2026-10-17 18:02
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_daily_counts(apps, schema_editor):
+    Incident = apps.get_model('incidents', 'Incident')
+    IncidentDailyCount = apps.get_model('incidents', 'IncidentDailyCount')
+
+    def severity_bucket(severity):
+        severity = severity or 0
+        return "High" if severity > 7 else "Medium" if severity > 3 else "Low"
+
+    counts = Counter()
+    rows = Incident.objects.exclude(created_date=None).values_list(
+        'created_date', 'district', 'category', 'infoChannel', 'severity', 'current_status', 'incidentType'
+    ).iterator(chunk_size=2000)
+    for created_date, district, category, channel, severity, status, incident_type in rows:
+        counts[(
+            (created_date + timedelta(hours=5, minutes=30)).date(),
+            district or "", category or "", channel or "", severity_bucket(severity), status or "",
+            incident_type or ""
+        )] += 1
+
+    IncidentDailyCount.objects.bulk_create([
+        IncidentDailyCount(day=day, district=district, category=category, channel=channel, severity=severity,
+                           status=status, incident_type=incident_type, count=count)
+        for (day, district, category, channel, severity, status, incident_type), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('incidents', '0050_incident_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentDailyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('district', models.CharField(default='', max_length=200)),
+                ('category', models.CharField(default='', max_length=200)),
+                ('channel', models.CharField(default='', max_length=200)),
+                ('severity', models.CharField(default='', max_length=10)),
+                ('status', models.CharField(default='', max_length=50)),
+                ('incident_type', models.CharField(default='', max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('day', 'district', 'category', 'channel', 'severity', 'status', 'incident_type')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_counts, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Length
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.models import User
 from django_filters import rest_framework as filters
@@ -6,9 +8,11 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 import uuid
 import enum
-from datetime import datetime
+from datetime import datetime, timedelta, time
+from django.utils import timezone
 from .permissions import *
 from ..common.models import Category
+from ..custom_auth.services import adjust_open_workload
 
 class Occurrence(enum.Enum):
     OCCURRED = "Occurred"
@@ -34,6 +38,10 @@ class StatusType(enum.Enum):
         return self.name
 
 
+# incidents in these statuses do not count towards the assignee's open workload
+CLOSED_STATUSES = (StatusType.CLOSED.name, StatusType.INVALIDATED.name)
+
+
 class SeverityType(enum.Enum):
     # CRITICAL = "CRITICAL"
     # MAJOR = "MAJOR"
@@ -132,6 +140,9 @@ class IncidentStatus(models.Model):
 
     class Meta:
         ordering = ("id",)
+        indexes = [
+            models.Index(fields=["incident", "created_date"], name="incidentstatus_history_idx"),
+        ]
 
 
 class IncidentComment(models.Model):
@@ -148,16 +159,147 @@ class IncidentComment(models.Model):
         ordering = ("id",)
 
 
+class ReferenceSequence(models.Model):
+    """ Counter backing refId generation, one row per refId prefix (ex: category code and day) """
+    key = models.CharField(max_length=200, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("id",)
+
+def allocate_reference_number(key, seed=None):
+    """ Atomically increments the sequence for the given key and returns the new value.
+
+        The row lock taken by the UPDATE serializes concurrent writers on the same key,
+        so every caller gets a distinct number at a constant cost regardless of the
+        number of incidents. `seed` is a callable returning the last number already
+        issued for the key, evaluated only when the sequence row is first created.
+    """
+    with transaction.atomic():
+        updated = ReferenceSequence.objects.filter(key=key).update(last_value=F("last_value") + 1)
+        if not updated:
+            start = (seed() if seed is not None else 0) + 1
+            try:
+                with transaction.atomic():
+                    ReferenceSequence.objects.create(key=key, last_value=start)
+                return start
+            except IntegrityError:
+                # another writer created the sequence first
+                ReferenceSequence.objects.filter(key=key).update(last_value=F("last_value") + 1)
+
+        return ReferenceSequence.objects.values_list("last_value", flat=True).get(key=key)
+
+# reports are given in Sri Lanka time, daily counts are bucketed by the local day
+REPORT_UTC_OFFSET = timedelta(hours=5, minutes=30)
+
+# reporting dimensions of an incident, as (daily count field, incident field)
+DAILY_COUNT_DIMENSIONS = (
+    ("district", "district"),
+    ("category", "category"),
+    ("channel", "infoChannel"),
+    ("severity", "severity"),
+    ("status", "current_status"),
+    ("incident_type", "incidentType"),
+)
+
+class IncidentDailyCount(models.Model):
+    """ Number of incidents created on a (local) day per combination of reporting
+        dimensions. Maintained on incident save and status change, and reconciled
+        from the incidents table by the reconcile_daily_counts command.
+        Missing values are stored as empty strings.
+    """
+    day = models.DateField()
+    district = models.CharField(max_length=200, default="")
+    category = models.CharField(max_length=200, default="")
+    channel = models.CharField(max_length=200, default="")
+    # High, Medium or Low, see get_severity_bucket
+    severity = models.CharField(max_length=10, default="")
+    status = models.CharField(max_length=50, default="")
+    incident_type = models.CharField(max_length=50, default="")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (("day", "district", "category", "channel", "severity", "status", "incident_type"),)
+
+def get_severity_bucket(severity):
+    """ Severity group used by the reports, a missing severity counts as low """
+    severity = severity or 0
+    if severity > 7:
+        return "High"
+    if severity > 3:
+        return "Medium"
+    return "Low"
+
+def get_report_day(created_date):
+    return (created_date + REPORT_UTC_OFFSET).date()
+
+def get_report_day_start(day):
+    """ UTC time at which a local report day starts """
+    return datetime.combine(day, time(), tzinfo=timezone.utc) - REPORT_UTC_OFFSET
+
+def get_daily_count_key(incident):
+    """ Daily count row of an incident, None while it has no created date """
+    if incident.created_date is None:
+        return None
+
+    key = {"day": get_report_day(incident.created_date)}
+    for count_field, incident_field in DAILY_COUNT_DIMENSIONS:
+        value = getattr(incident, incident_field)
+        if count_field == "severity":
+            value = get_severity_bucket(value)
+        # enum defaults are stored by name
+        key[count_field] = "" if value is None else str(value)
+
+    return tuple(sorted(key.items()))
+
+def adjust_daily_count(key, delta):
+    if key is None or delta == 0:
+        return
+
+    key = dict(key)
+    with transaction.atomic():
+        updated = IncidentDailyCount.objects.filter(**key).update(count=F("count") + delta)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    IncidentDailyCount.objects.create(count=delta, **key)
+            except IntegrityError:
+                # another writer created the row first
+                IncidentDailyCount.objects.filter(**key).update(count=F("count") + delta)
+
+def move_daily_count(saved_key, key):
+    if saved_key != key:
+        adjust_daily_count(saved_key, -1)
+        adjust_daily_count(key, 1)
+
+def last_issued_number(prefix):
+    """ Returns the highest sequence number already used by refIds of the given prefix """
+    # the suffix is zero padded to 4 digits and grows past 9999, so longer refIds are higher numbers
+    last_refId = Incident.objects.filter(refId__startswith=prefix + "/") \
+                    .order_by(Length("refId").desc(), "-refId").values_list("refId", flat=True).first()
+    if last_refId is None:
+        return 0
+
+    try:
+        return int(last_refId.rsplit("/", 1)[1])
+    except ValueError:
+        return 0
+
 def generate_inquiry_refId(election, category, institution):
     ''' Function to generate refId for inquiries '''
-    current_count = Incident.objects.filter(incidentType=IncidentType.INQUIRY).filter(election=election).count()
-    refID = "EC/EDR/%s/INQ/%s/%s/%0.4d" % (election, institution, category, current_count+1)
+    number = allocate_reference_number(
+        "INQ/%s" % election,
+        seed=lambda: Incident.objects.filter(incidentType=IncidentType.INQUIRY).filter(election=election).count())
+    refID = "EC/EDR/%s/INQ/%s/%s/%0.4d" % (election, institution, category, number)
     return refID
 
 def generate_complaint_refId(election, district):
     ''' Function to generate refId for complaints '''
-    current_count = Incident.objects.filter(incidentType=IncidentType.COMPLAINT).filter(election=election).count()
-    refID = "EC/EDR/%s/%s/%0.4d" % (election, district, current_count+1)
+    number = allocate_reference_number(
+        "COMPLAINT/%s" % election,
+        seed=lambda: Incident.objects.filter(incidentType=IncidentType.COMPLAINT).filter(election=election).count())
+    refID = "EC/EDR/%s/%s/%0.4d" % (election, district, number)
     return refID
 
 def generate_request_refId(category_id):
@@ -166,13 +308,13 @@ def generate_request_refId(category_id):
     today = datetime.now().replace(hour=0, minute=0, second=0)
     month = ("0" + str(today.month)) if today.month < 10 else str(today.month)
     date_info = str(today.day) + month  + str(today.year)[2:]
-    current_count = Incident.objects.filter(
-            incidentType=IncidentType.COMPLAINT,
-            created_date__gte=today
-        ).count()
-    refID = "%s/%s/%0.4d" % (category.code, date_info,current_count+1)
+    prefix = "%s/%s" % (category.code, date_info)
+    number = allocate_reference_number(prefix, seed=lambda: last_issued_number(prefix))
+    refID = "%s/%0.4d" % (prefix, number)
     return refID
 
+INCIDENT_DAILY_COUNT_FIELDS = ["created_date"] + [field for _, field in DAILY_COUNT_DIMENSIONS]
+
 class Incident(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -249,7 +391,11 @@ class Incident(models.Model):
     occured_date = models.DateTimeField(null=True, blank=True)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    # status projection of the latest IncidentStatus, see update_incident_current_status
     current_status = models.CharField(max_length=50, default=None, null=True, blank=True)
+    previous_status = models.CharField(max_length=50, default=None, null=True, blank=True)
+    status_since = models.DateTimeField(null=True, blank=True)
+
     current_severity = models.CharField(
         max_length=50,
         choices=[(tag.name, tag.value) for tag in SeverityType],
@@ -272,11 +418,53 @@ class Incident(models.Model):
         # else:
         if(not self.refId): 
             self.refId = generate_request_refId(self.category)
+
+        # the persisted assignee is unknown when the instance was loaded without it
+        is_tracked = self._state.adding or hasattr(self, "_saved_assignee_id")
+        saved_assignee_id = getattr(self, "_saved_assignee_id", None)
+        is_counted = self._state.adding or hasattr(self, "_saved_daily_count_key")
+        saved_daily_count_key = getattr(self, "_saved_daily_count_key", None)
             
         super(Incident, self).save(*args, **kwargs)
 
+        # keep the daily report counts in step with the reporting dimensions
+        daily_count_key = get_daily_count_key(self)
+        if is_counted:
+            move_daily_count(saved_daily_count_key, daily_count_key)
+        self._saved_daily_count_key = daily_count_key
+
+        # move the open workload from the previous assignee to the new one
+        if is_tracked and saved_assignee_id != self.assignee_id and self.current_status not in CLOSED_STATUSES:
+            adjust_open_workload(saved_assignee_id, -1)
+            adjust_open_workload(self.assignee_id, 1)
+
+        self._saved_assignee_id = self.assignee_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Incident, cls).from_db(db, field_names, values)
+        # remember the persisted assignee so that save() can track reassignments
+        if "assignee_id" in field_names:
+            instance._saved_assignee_id = instance.assignee_id
+        if all(field in field_names for field in INCIDENT_DAILY_COUNT_FIELDS):
+            instance._saved_daily_count_key = get_daily_count_key(instance)
+        return instance
+
     class Meta:
         ordering = ("created_date",)
+        # the incident list always orders by created_date desc, so every filter
+        # column used by get_filtered_incidents is paired with created_date
+        indexes = [
+            models.Index(fields=["current_status", "status_since"], name="incident_status_since_idx"),
+            models.Index(fields=["created_date"], name="incident_created_idx"),
+            models.Index(fields=["current_status", "created_date"], name="incident_status_created_idx"),
+            models.Index(fields=["incidentType", "created_date"], name="incident_type_created_idx"),
+            models.Index(fields=["category", "created_date"], name="incident_category_created_idx"),
+            models.Index(fields=["district", "created_date"], name="incident_district_created_idx"),
+            models.Index(fields=["institution", "created_date"], name="incident_inst_created_idx"),
+            models.Index(fields=["assignee", "created_date"], name="incident_assignee_created_idx"),
+            models.Index(fields=["current_severity", "created_date"], name="incident_severity_created_idx"),
+        ]
 
         permissions = (
             (CAN_REVIEW_INCIDENTS, "Can review created incidents"),
@@ -302,8 +490,29 @@ class Incident(models.Model):
 def update_incident_current_status(sender, **kwargs):
     incident_status = kwargs['instance']
     incident = incident_status.incident
-    incident.current_status = incident_status.current_status.name
-    incident.save()
+    was_open = incident.current_status not in CLOSED_STATUSES
+    saved_daily_count_key = get_daily_count_key(incident)
+
+    # status may be a StatusType or the stored name when re-saving a loaded row
+    incident.current_status = getattr(incident_status.current_status, "name", incident_status.current_status)
+    incident.previous_status = getattr(incident_status.previous_status, "name", incident_status.previous_status)
+    incident.status_since = incident_status.created_date
+
+    # targeted update of the projection columns, a full save would re-run refId generation
+    Incident.objects.filter(id=incident.id).update(
+        current_status=incident.current_status,
+        previous_status=incident.previous_status,
+        status_since=incident.status_since
+    )
+
+    # closing or reopening an incident changes the assignee's open workload
+    is_open = incident.current_status not in CLOSED_STATUSES
+    if was_open != is_open:
+        adjust_open_workload(incident.assignee_id, 1 if is_open else -1)
+
+    daily_count_key = get_daily_count_key(incident)
+    move_daily_count(saved_daily_count_key, daily_count_key)
+    incident._saved_daily_count_key = daily_count_key
 
 class IncidentPerson(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -23,7 +23,7 @@ from .models import (
 from ..common.serializers import DistrictSerializer, PoliceStationSerializer
 from ..common.models import PoliceStation
 from ..custom_auth.serializers import UserSerializer
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 
 class IncidentStatusSerializer(serializers.ModelSerializer):
     class Meta:
@@ -62,6 +62,8 @@ class RecipientSerializer(serializers.ModelSerializer):
 class IncidentSerializer(serializers.ModelSerializer):
 
     currentStatus = serializers.ReadOnlyField(source="current_status")
+    previousStatus = serializers.ReadOnlyField(source="previous_status")
+    statusSince = serializers.ReadOnlyField(source="status_since")
 
     # currentSeverity = serializers.ReadOnlyField(source="current_severity")
     severity = serializers.CharField(source="current_severity", required=False, allow_null=True, allow_blank=True)
@@ -107,9 +109,30 @@ class IncidentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Incident
         exclude = ["created_date", "ds_division", "grama_niladhari",
-                   "polling_division", "polling_station", "police_division", "police_station"]
+                   "polling_division", "polling_station", "police_division", "police_station",
+                   "previous_status", "status_since"]
         read_only_fields = ['recaptcha']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Loads every relation read while serializing a list of incidents, so a page
+            costs the same fixed number of queries whatever its size
+        """
+        queryset = UserSerializer.setup_eager_loading(queryset, prefix="assignee__")
+        return queryset.prefetch_related(
+            "linked_individuals",
+            Prefetch(
+                "incidents_escalateexternalworkflow_related",
+                queryset=EscalateExternalWorkflow.objects.filter(
+                    Q(is_action_completed=False) & Q(is_internal_user=True)
+                ).select_related(
+                    "actioned_user__profile__division__organization",
+                    "escalated_user__profile__division__organization",
+                ).order_by('-id'),
+                to_attr="pending_internal_escalations"
+            )
+        )
+
     def get_extra_kwargs(self):
         blocked_list = ["description"]
         extra_kwargs = super(IncidentSerializer, self).get_extra_kwargs()
@@ -123,10 +146,13 @@ class IncidentSerializer(serializers.ModelSerializer):
         return extra_kwargs
 
     def get_last_assignment(self, obj):
-        if obj.linked_individuals.count() > 0:
-            last_assignment = EscalateExternalWorkflow.objects.filter(
-                Q(incident=obj) & Q(is_action_completed=False) & Q(is_internal_user=True)
-            ).order_by('-id').first()
+        if len(obj.linked_individuals.all()) > 0:
+            if hasattr(obj, "pending_internal_escalations"):
+                last_assignment = next(iter(obj.pending_internal_escalations), None)
+            else:
+                last_assignment = EscalateExternalWorkflow.objects.filter(
+                    Q(incident=obj) & Q(is_action_completed=False) & Q(is_internal_user=True)
+                ).order_by('-id').first()
 
             if last_assignment is not None:
                 return {
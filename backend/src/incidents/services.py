@@ -1,6 +1,5 @@
 import os
 import requests
-import _thread
 
 from .models import (
     Incident,
@@ -22,36 +21,54 @@ from .models import (
     InvalidateWorkflow,
     ReopenWorkflow,
     CannedResponse,
-    SendCannedResponseWorkflow
+    SendCannedResponseWorkflow,
+    IncidentDailyCount,
+    CLOSED_STATUSES,
+    DAILY_COUNT_DIMENSIONS,
+    get_report_day,
+    get_report_day_start
 )
 from django.contrib.auth.models import User, Group, Permission
 
 from ..events import services as event_services
 from ..events.models import Event
 from ..file_upload.models import File
+from ..common.models import Category
+from ..db_router import get_reporting_db
 from ..custom_auth.models import Division, UserLevel
-from django.db import connection
+from ..custom_auth.services import (
+    user_can,
+    get_role_permissions,
+    get_level_ancestors,
+    find_least_loaded_user,
+    set_open_workloads
+)
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
 
 from .exceptions import WorkflowException, IncidentException
 import pandas as pd
-from django.http import HttpResponse
+import xlsxwriter
+import csv
+import tempfile
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 from xhtml2pdf import pisa
 import json
 from rest_framework.renderers import StaticHTMLRenderer
-from django.db.models import Q
+from django.db.models import Q, Count, Case, When, Value, CharField, Min, Max
+from django.db.models.functions import Coalesce
 from .permissions import *
 
-from ..notifications.services import add_notification
+from ..notifications.services import add_notification, enqueue_templated_email, enqueue_sms
 from ..notifications.models import NotificationType
 
-from django.core.mail import send_mail
 
 from .serializers import IncidentCommentSerializer
 
 from zeep import Client
 from zeep.wsse.username import UsernameToken
 import requests
-from django.conf import settings
 
 def get_incident_status_guest(refId):
     """This function is to annouce public on a incident status"""
@@ -119,69 +136,16 @@ def get_public_status_on_close(incident):
 
     return status
 
-def send_email(subject, message, receivers):
-    try :
-        send_mail(
-            subject,
-            message,
-            'tellpresident_noreply@lgc2.gov.lk',
-            receivers,
-            fail_silently=False,
-        )
-        print("email sent to:")
-        print(*receivers)
-
-    except Exception as e:
-        print("email sending failed to :")
-        print(*receivers)
-        print(e)
-
-
-def send_sms(number, message):
-    number = "94" + number[-9:]
-    headers = {'content-type': 'text/xml'}
-    
-    body = """<?xml version='1.0' encoding='utf-8'?>
-<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:v1="http://schemas.icta.lk/xsd/kannel/handler/v1/" soapenv:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
-<soapenv:Header>
-<govsms:authData xmlns:govsms="http://govsms.icta.lk/">
-<govsms:user>{2}</govsms:user>
-<govsms:key>{3}</govsms:key>
-</govsms:authData>
-</soapenv:Header>
-<soapenv:Body>
-<v1:SMSRequest>
-<v1:requestData>
-<v1:outSms>{1}</v1:outSms>
-<v1:recepient>{0}</v1:recepient>
-<v1:depCode>IctaTest</v1:depCode>
-<v1:smscId/>
-<v1:billable/>
-</v1:requestData>
-</v1:SMSRequest>
-</soapenv:Body>
-</soapenv:Envelope>
-""".format(number, message, settings.SMS_GATEWAY_USER, settings.SMS_GATEWAY_PASSWORD)
-
-    response = requests.post("http://lankagate.gov.lk:9080/services/GovSMSMTHandlerProxy?wsdl",data=body,headers=headers)
-    print("response")
-    print(response.status_code)
-    print(response.reason)
-
 def send_incident_created_mail(reporter_id):
     # request created email
     reporter = get_reporter_by_id(reporter_id)
     if reporter.email :
         incident = Incident.objects.get(reporter=reporter)
         print("sending request created email")
-        subject = 'Your Request Recieved'
-        message = 'We recieved your request. Reference ID' + incident.refId
         recievers = [incident.reporter.email]
-        try:
-            _thread.start_new_thread( send_email, ( subject, message, recievers) )
-        except:
-            print ("Error: unable to start thread")
-        print("request created email sent")
+        enqueue_templated_email("incident_created", {"refId": incident.refId}, recievers,
+                                "incident-created/%s" % incident.id)
+        print("request created email queued")
 
 def send_incident_created_sms(reporter_id):
     # request created sms
@@ -190,11 +154,7 @@ def send_incident_created_sms(reporter_id):
         incident = Incident.objects.get(reporter=reporter)
         print("sending request created sms")
         message = 'Your request has been received and is being attended to Ref ID: ' + incident.refId
-        try:
-            _thread.start_new_thread( send_sms, (reporter.mobile, message))
-        except Exception as e:
-            print("request created sms sending failed with exception:")
-            print(e)
+        enqueue_sms(reporter.mobile, message, "incident-created/%s" % incident.id)
 
 def is_valid_incident(incident_id: str) -> bool:
     try:
@@ -283,68 +243,104 @@ def get_guest_user():
         raise IncidentException("No guest user available")
 
 def user_level_has_permission(user_level: UserLevel, permission: Permission):
-    permissions = Permission.objects.filter(group=user_level.role)
-    return permission in permissions
+    return permission.codename in get_role_permissions(user_level.role_id)
 
 def get_user_from_level(user_level: UserLevel, division: Division) -> User:
 
     """ This function would take in a user level and find the user
         within the level that has the least workload
-        It will query the assignee counts for each user and get the
-        one with lowest assignments
+        It uses the open workload counter maintained on each user profile
     """
 
-    sql = """
-            SELECT usr.id, COUNT(incident.id) as incident_count FROM `auth_user` as usr
-            LEFT JOIN incidents_incident as incident on incident.assignee_id = usr.id
-            INNER JOIN custom_auth_profile as prf on prf.user_id = usr.id
-            INNER JOIN custom_auth_userlevel as ulvl on prf.level_id = ulvl.id
-            INNER JOIN auth_group as grp on ulvl.role_id = grp.id
-            INNER JOIN custom_auth_division as udiv on prf.division_id = udiv.id
-            WHERE ulvl.code = "%s" AND udiv.code = "%s" AND usr.is_active = true
-            GROUP BY usr.id
-            ORDER BY incident_count ASC
-          """ % (user_level.code, division.code)
-
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        row = cursor.fetchone()
-
-        if row is None:
-            return None
+    return find_least_loaded_user([user_level.code], division.code)
 
-        try:
-            assignee = User.objects.get(id=row[0])
-            return assignee
-        except:
-            return None
 
 def find_candidate_from_division(current_division: Division, current_level: UserLevel, required_permission: Permission=None):
-    parent_level = current_level.parent
+    # traverse upwards the user hierarchy (cached in memory) and keep the levels
+    # that have the required permission, nearest first
+    level_codes = [
+        code for (level_id, code, role_id) in get_level_ancestors(current_level.id)
+        if required_permission is None or required_permission.codename in get_role_permissions(role_id)
+    ]
+
+    if len(level_codes) == 0:
+        # reached the top most position of current division
+        return None
 
-    new_assignee = None
+    # pick the least loaded user from the nearest level that has any users
+    return find_least_loaded_user(level_codes, current_division.code)
 
-    while new_assignee is None:
-        if parent_level is None:
-            # reached the top most position of current division
-            break
 
-        if required_permission is None or (
-            required_permission is not None and user_level_has_permission(parent_level, required_permission)
-        ):
-            assignee = get_user_from_level(parent_level, current_division)
+def recount_open_workloads():
+    """ Recomputes the open workload counter of every user from the incidents table """
+    workloads = dict(
+        Incident.objects.exclude(assignee=None)
+        .exclude(current_status__in=CLOSED_STATUSES)
+        .values("assignee")
+        .annotate(count=Count("id"))
+        .values_list("assignee", "count")
+    )
+    set_open_workloads(workloads)
 
-            if assignee is not None:
-                new_assignee = assignee
-                break
+    return workloads
 
-        # if the current user level doesn't have the permission or no assignees from
-        # current level
-        # check the parent user level of the current parent
-        # ie: traversing upwards the user hierarchy
-        parent_level = parent_level.parent
 
-    return new_assignee
+def get_daily_count_rows(day):
+    """ Daily count rows of the incidents created on a (local) day, grouped by the database """
+    dimensions = {
+        "_%s" % count_field: Coalesce(incident_field, Value(""))
+        for count_field, incident_field in DAILY_COUNT_DIMENSIONS if count_field != "severity"
+    }
+    # same buckets as get_severity_bucket, a missing severity counts as low
+    dimensions["_severity"] = Case(When(severity__gt=7, then=Value("High")),
+                                   When(severity__gt=3, then=Value("Medium")),
+                                   default=Value("Low"), output_field=CharField())
+
+    rows = Incident.objects.filter(created_date__gte=get_report_day_start(day),
+                                   created_date__lt=get_report_day_start(day + timedelta(days=1))) \
+        .values(**dimensions).annotate(count=Count("id")).order_by()
+
+    return [
+        IncidentDailyCount(day=day, count=row.pop("count"), **{name[1:]: value for name, value in row.items()})
+        for row in rows
+    ]
+
+
+def get_daily_count_days():
+    """ First and last (local) day with incidents or daily counts, None when there are neither """
+    incidents = Incident.objects.aggregate(first=Min("created_date"), last=Max("created_date"))
+    counts = IncidentDailyCount.objects.aggregate(first=Min("day"), last=Max("day"))
+
+    first = [day for day in (counts["first"], incidents["first"] and get_report_day(incidents["first"])) if day]
+    last = [day for day in (counts["last"], incidents["last"] and get_report_day(incidents["last"])) if day]
+    if not first:
+        return None, None
+    return min(first), max(last)
+
+
+def reconcile_daily_counts(start_day=None, end_day=None):
+    """ Recomputes the daily report counts of the given (local) days from the incidents
+        table, all days when no range is given. Returns the number of counted incidents.
+        Each day is recounted while its count rows are locked, so incidents saved meanwhile
+        adjust the recomputed rows instead of being overwritten by them.
+    """
+    if start_day is None or end_day is None:
+        first, last = get_daily_count_days()
+        start_day = start_day or first
+        end_day = end_day or last
+
+    counted = 0
+    day = start_day
+    while day is not None and day <= end_day:
+        with transaction.atomic():
+            list(IncidentDailyCount.objects.select_for_update().filter(day=day).values_list("id", flat=True))
+            rows = get_daily_count_rows(day)
+            IncidentDailyCount.objects.filter(day=day).delete()
+            IncidentDailyCount.objects.bulk_create(rows, batch_size=1000)
+        counted += sum(row.count for row in rows)
+        day += timedelta(days=1)
+
+    return counted
 
 
 def find_escalation_candidate(current_user: User) -> User:
@@ -591,14 +587,10 @@ def incident_change_assignee(user: User, incident: Incident, assignee: User):
     # request assigned email
     print("sending request assigned email")
     if assignee.email:
-        subject = 'Request Assigned'
-        message = 'You have been assigned to a request. Reference ID' + incident.refId
         recievers = [assignee.email]
-        try:
-            _thread.start_new_thread( send_email, ( subject, message, recievers) )
-        except:
-            print ("Error: unable to start thread")
-        print("request assigned email sent")
+        enqueue_templated_email("incident_assigned", {"refId": incident.refId}, recievers,
+                                "incident-assigned/%s" % workflow.id)
+        print("request assigned email queued")
 
     event_services.update_workflow_event(user, incident, workflow)
 
@@ -661,23 +653,15 @@ def incident_close(user: User, incident: Incident, details: str):
     # request closed email
     if (incident.reporter.email):
         print("sending request closed email")
-        subject = 'Your Request Closed'
-        message = 'We closed your request. Reference ID' + incident.refId
         recievers = [incident.reporter.email]
-        try:
-            _thread.start_new_thread( send_email, ( subject, message, recievers) )
-        except:
-            print ("Error: unable to start thread")
-        print("request closed email sent")
+        enqueue_templated_email("incident_closed", {"refId": incident.refId}, recievers,
+                                "incident-closed/%s" % workflow.id)
+        print("request closed email queued")
 
     if (incident.reporter.mobile):
         print("sending request closed sms")
         message = 'Your request has been resolved. Ref ID: ' + incident.refId
-        try:
-            _thread.start_new_thread( send_sms, (incident.reporter.mobile, message))
-        except Exception as e:
-            print("request closed sms sending failed with exception:")
-            print(e)
+        enqueue_sms(incident.reporter.mobile, message, "incident-closed/%s" % workflow.id)
 
     event_services.update_workflow_event(user, incident, workflow)
 
@@ -910,28 +894,21 @@ def get_police_report_by_incident(incident: Incident):
     return incident_police_report
 
 def get_incidents_to_escalate():
-
-    sql = """
-        SELECT b.incident_id, b.current_status, b.created_date
-            FROM incidents_incidentstatus b
-            INNER JOIN (
-              SELECT i.incident_id, max(i.created_date) cdate
-              FROM incidents_incidentstatus i
-              GROUP BY i.incident_id
-            ) c
-            ON c.incident_id = b.incident_id AND c.cdate = b.created_date
-     	WHERE b.`created_date` >  NOW() - interval 120 minute AND
-                b.`current_status` <> 'CLOSED' AND
-                b.`current_status` <> 'ACTION_PENDING' AND
-                b.`current_status` <> 'NEW' AND
-                b.`current_status` <> 'INFORMATION_REQESTED'
+    """ Incidents whose status changed within the last 120 minutes and are not
+        waiting on someone else, as (incident_id, current_status, status_since)
     """
+    status_changed_after = timezone.now() - timedelta(minutes=120)
 
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        incidents = cursor.fetchall()
+    incidents = Incident.objects.filter(status_since__gt=status_changed_after).exclude(
+        current_status__in=[
+            StatusType.CLOSED.name,
+            StatusType.ACTION_PENDING.name,
+            StatusType.NEW.name,
+            StatusType.INFORMATION_REQESTED.name
+        ]
+    ).values_list("id", "current_status", "status_since")
 
-        return incidents
+    return list(incidents)
 
 def auto_escalate_incidents():
 
@@ -947,30 +924,150 @@ def attach_media(user:User, incident:Incident, uploaded_file:File):
     """ Method to indicate media attachment """
     event_services.media_attached_event(user, incident, uploaded_file)
 
-def get_fitlered_incidents_report(incidents: Incident, output_format: str):
+def get_filtered_incidents(user: User, params) -> Incident:
+    """ Builds the incident list queryset for the given user from the list query params.
+        The status param is expected to be validated by the caller.
+    """
+    incidents = Incident.objects.all().order_by('-created_date')
+
+    # for external entities, they can only view related incidents
+    if not user_can(user, CAN_REVIEW_ALL_INCIDENTS):
+        incidents = incidents.filter(linked_individuals__id=user.id)
+
+    # filtering
+    param_query = params.get('q', None)
+    if param_query is not None and param_query != "":
+        incidents = incidents.filter(
+            Q(refId__icontains=param_query) | Q(title__icontains=param_query) |
+            Q(description__icontains=param_query))
+
+    # filter by title
+    param_title = params.get('title', None)
+    if param_title is not None:
+        incidents = incidents.filter(title__contains=param_title)
+
+    param_incident_type = params.get('incident_type', None)
+    if param_incident_type is not None:
+        incidents = incidents.filter(incidentType=param_incident_type)
+
+    param_category = params.get('category', None)
+    if param_category is not None:
+        incidents = incidents.filter(category=param_category)
+
+    param_response_time = params.get('response_time', None)
+    if param_response_time is not None:
+        incidents = incidents.filter(response_time__lte=int(param_response_time))
+
+    param_start_date = params.get('start_date', None)
+    param_end_date = params.get('end_date', None)
+
+    if param_start_date and param_end_date:
+        incidents = incidents.filter(
+            created_date__range=(param_start_date, param_end_date))
+
+    param_assignee = params.get('assignee', None)
+    if param_assignee is not None:
+        if param_assignee == "me":
+            # get incidents of the current user
+            incidents = incidents.filter(assignee=user)
+
+    param_linked = params.get('user_linked', None)
+    if param_linked is not None:
+        if param_linked == "me":
+            # get incidents of the current user
+            incidents = incidents.filter(linked_individuals__id=user.id)
+
+    param_status = params.get('status', None)
+    if param_status is not None:
+        incidents = incidents.filter(current_status=param_status)
+
+    param_severity = params.get('severity', None)
+    if param_severity is not None:
+        try:
+            incidents = incidents.filter(current_severity=param_severity)
+        except Exception as e:
+            raise IncidentException(e)
+
+    param_closed = params.get('show_closed', None)
+    if param_closed is not None and param_closed == "true":
+        # by default CLOSED incidents are not shown, and also INVALIDATED.
+        incidents = incidents.filter(Q(current_status=StatusType.CLOSED.name) | Q(current_status=StatusType.INVALIDATED.name))
+    else:
+        incidents = incidents.exclude(current_status=StatusType.CLOSED.name).exclude(current_status=StatusType.INVALIDATED.name)
+
+    param_institution = params.get('institution', None)
+    if param_institution is not None:
+        incidents = incidents.filter(institution=param_institution)
+
+    param_district = params.get('district', None)
+    if param_district is not None:
+        incidents = incidents.filter(district=param_district)
 
-    sql = """
-            SELECT i.refId, i.title, i.description, i.current_status, i.current_severity, i.response_time, d.sub_category as category
-                FROM incidents_incident i
-                LEFT JOIN (
-                  SELECT c.id, c.sub_category
-                  FROM common_category c
-                ) d
-                ON d.id = i.category
-        """
-    with connection.cursor() as cursor:
-        cursor.execute(sql)
-        incidents = cursor.fetchall()
-        dataframe = pd.DataFrame(list(incidents))
-    dataframe.columns = ["Ref ID", "Title", "Description", "Status", "Severity", "Response Time", "Category"]
+    return incidents
+
+EXPORT_COLUMNS = ["Ref ID", "Title", "Description", "Status", "Severity", "Response Time", "Category"]
+EXPORT_CHUNK_SIZE = 2000
+
+class EchoBuffer:
+    """ File-like object that hands each written value back to the caller, used to stream csv rows """
+    def write(self, value):
+        return value
+
+def iter_export_rows(incidents):
+    """ Yields the export rows of the filtered incidents, fetched in chunks """
+    categories = dict(
+        (str(category_id), sub_category)
+        for category_id, sub_category in Category.objects.values_list("id", "sub_category")
+    )
+
+    rows = incidents.values_list(
+        "refId", "title", "description", "current_status", "current_severity", "response_time", "category"
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    for refId, title, description, current_status, current_severity, response_time, category in rows:
+        yield (refId, title, description, current_status, current_severity, response_time,
+               categories.get(category, None))
+
+def stream_incidents_csv(incidents):
+    writer = csv.writer(EchoBuffer(), delimiter=";")
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in iter_export_rows(incidents):
+        yield writer.writerow(row)
+
+def write_incidents_xlsx(incidents, output):
+    """ Writes the filtered incidents to an xlsx file. Rows are flushed to disk as
+        they are written, so memory does not grow with the number of incidents.
+    """
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Incidents")
+    worksheet.write_row(0, 0, EXPORT_COLUMNS)
+    for row_number, row in enumerate(iter_export_rows(incidents), start=1):
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
+
+def get_fitlered_incidents_report(incidents: Incident, output_format: str):
+    # exports are streamed after the view returns, so the queryset is bound to the reporting database
+    incidents = incidents.using(get_reporting_db())
 
     if output_format == "csv":
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(stream_incidents_csv(incidents), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename=incidents.csv'
-        dataframe.to_csv(path_or_buf=response,sep=';',float_format='%.2f',index=False,decimal=",")
         return response
 
+    if output_format == "xlsx":
+        output = tempfile.TemporaryFile()
+        write_incidents_xlsx(incidents, output)
+        output.seek(0)
+
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename="incidents.xlsx",
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
     if output_format == "html":
+        dataframe = pd.DataFrame(list(iter_export_rows(incidents)), columns=EXPORT_COLUMNS)
         # output = dataframe.to_html(float_format='%.2f',index=False)
         output = write_to_html_file(dataframe, "Incidents")
         output = output.encode('utf-8')
@@ -1,3 +1,433 @@
+import base64
+import os
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User, Group, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ..common.models import Category
+from ..custom_auth.models import Organization, Division, UserLevel
+from .models import (
+    Incident,
+    IncidentStatus,
+    EscalateExternalWorkflow,
+    StatusType,
+    ReferenceSequence,
+    IncidentDailyCount,
+    allocate_reference_number,
+    generate_request_refId
+)
+from ..custom_auth.services import invalidate_permission_cache
+from .services import (
+    get_incidents_to_escalate,
+    get_filtered_incidents,
+    find_escalation_candidate,
+    recount_open_workloads,
+    reconcile_daily_counts,
+    get_fitlered_incidents_report
+)
+from .serializers import IncidentSerializer
+from .views import IncidentList
+
+
+class ReferenceSequenceTestCase(TestCase):
+    def test_allocates_consecutive_numbers(self):
+        numbers = [allocate_reference_number("TEST/KEY") for _ in range(5)]
+        self.assertEqual(numbers, [1, 2, 3, 4, 5])
+        self.assertEqual(ReferenceSequence.objects.get(key="TEST/KEY").last_value, 5)
+
+    def test_seed_is_used_only_on_creation(self):
+        self.assertEqual(allocate_reference_number("TEST/SEED", seed=lambda: 41), 42)
+        self.assertEqual(allocate_reference_number("TEST/SEED", seed=lambda: 100), 43)
+
+    def test_request_refId_continues_after_existing_incidents(self):
+        category = Category.objects.create(code="C01", top_category="Top", sub_category="Sub",
+                                           sn_top_category="", sn_sub_category="",
+                                           tm_top_category="", tm_sub_category="")
+        prefix = generate_request_refId(category.id).rsplit("/", 1)[0]
+        ReferenceSequence.objects.all().delete()
+        Incident.objects.create(refId="%s/0007" % prefix, title="t", description="d", category=str(category.id))
+
+        self.assertEqual(generate_request_refId(category.id), "%s/0008" % prefix)
+
+    def test_request_refId_seed_compares_numbers_past_9999(self):
+        category = Category.objects.create(code="C02", top_category="Top", sub_category="Sub",
+                                           sn_top_category="", sn_sub_category="",
+                                           tm_top_category="", tm_sub_category="")
+        prefix = generate_request_refId(category.id).rsplit("/", 1)[0]
+        ReferenceSequence.objects.all().delete()
+        for number in ["9999", "10000", "0042"]:
+            Incident.objects.create(refId="%s/%s" % (prefix, number), title="t", description="d",
+                                    category=str(category.id))
+
+        self.assertEqual(generate_request_refId(category.id), "%s/10001" % prefix)
+
+
+class IncidentStatusProjectionTestCase(TestCase):
+    def setUp(self):
+        self.incident = Incident.objects.create(refId="TEST/0001", title="t", description="d")
+
+    def test_status_change_updates_projection(self):
+        IncidentStatus.objects.create(current_status=StatusType.NEW, incident=self.incident)
+        status = IncidentStatus.objects.create(current_status=StatusType.VERIFIED,
+                                               previous_status=StatusType.NEW.name, incident=self.incident)
+
+        incident = Incident.objects.get(id=self.incident.id)
+        self.assertEqual(incident.current_status, StatusType.VERIFIED.name)
+        self.assertEqual(incident.previous_status, StatusType.NEW.name)
+        self.assertEqual(incident.status_since, status.created_date)
+        self.assertEqual(incident.refId, "TEST/0001")
+
+    def test_incidents_to_escalate_uses_projection(self):
+        IncidentStatus.objects.create(current_status=StatusType.VERIFIED, incident=self.incident)
+        closed = Incident.objects.create(refId="TEST/0002", title="t", description="d")
+        IncidentStatus.objects.create(current_status=StatusType.CLOSED, incident=closed)
+
+        self.assertEqual([row[0] for row in get_incidents_to_escalate()], [self.incident.id])
+
+
+class IncidentListQueryPlanTestCase(TestCase):
+    """ Asserts that every supported incident list filter, apart from UNINDEXED_FILTERS, is served
+        by an index search rather than a scan.
+        Set INCIDENT_PLAN_TEST_ROWS (ex: 1000000) to check plans against a realistic
+        table size, ideally with a MySQL test database.
+    """
+    FILTERS = [
+        {},
+        {"status": "NEW"},
+        {"show_closed": "true"},
+        {"incident_type": "COMPLAINT"},
+        {"category": "3"},
+        {"district": "CMB"},
+        {"institution": "INST1"},
+        {"severity": "HIGH"},
+        {"assignee": "me"},
+        {"user_linked": "me"},
+        {"q": "road"},
+        {"response_time": "12"},
+        {"start_date": "2020-01-01 00:00", "end_date": "2020-02-01 00:00"},
+        {"category": "3", "district": "CMB"},
+        {"status": "VERIFIED", "incident_type": "INQUIRY", "assignee": "me"},
+        {"district": "CMB", "start_date": "2020-01-01 00:00", "end_date": "2020-02-01 00:00"},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="admin")
+
+        organization = Organization.objects.create(code="org", displayName="Org")
+        level = UserLevel.objects.create(code="lvl", displayName="Level", organization=organization,
+                                         role=Group.objects.create(name="restricted"))
+        cls.restricted_user = User.objects.create(username="police")
+        cls.restricted_user.profile.level = level
+        cls.restricted_user.profile.save()
+
+        rows = int(os.environ.get("INCIDENT_PLAN_TEST_ROWS", 500))
+        start = timezone.now() - timedelta(days=365)
+        statuses = ["NEW", "VERIFIED", "CLOSED", "INVALIDATED", "ACTION_PENDING"]
+        incidents = (
+            Incident(
+                refId="PLAN/%07d" % i,
+                title="incident %d" % i,
+                description="description",
+                category=str(i % 40),
+                district=["CMB", "GAM", "KAL"][i % 3],
+                institution="INST%d" % (i % 10),
+                incidentType=["COMPLAINT", "INQUIRY"][i % 2],
+                current_status=statuses[i % len(statuses)],
+                current_severity=["LOW", "MEDIUM", "HIGH"][i % 3],
+                assignee=cls.admin if i % 7 == 0 else None,
+            )
+            for i in range(rows)
+        )
+        Incident.objects.bulk_create(incidents, batch_size=5000)
+        Incident.objects.update(created_date=start)
+
+    # filters that are knowingly not served by an index, with the reason
+    UNINDEXED_FILTERS = {
+        "q": "substring search on refId, title and description",
+        "response_time": "range on a column without an index, only used by the escalation screens",
+    }
+
+    def get_full_scans(self, queryset, filtered=True):
+        """ Full scans in the plan of the queryset. Full scans of an index of incidents_incident
+            (SQLite "SCAN ... USING INDEX", MySQL type=index) touch every row as well and are
+            only accepted for the unfiltered list, which reads the first page of an index.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                details = [row[-1] for row in cursor.fetchall()]
+                return [detail for detail in details if detail.startswith("SCAN") and (
+                    "USING" not in detail or (filtered and detail.split()[1] == "incidents_incident"))]
+
+            cursor.execute("EXPLAIN " + sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return ["%s: %s" % (row["table"], row["type"]) for row in rows if row["type"] == "ALL" or (
+                filtered and row["table"] == "incidents_incident" and row["type"] == "index")]
+
+    def test_incident_list_filters_use_indexes(self):
+        for user in [self.admin, self.restricted_user]:
+            for params in self.FILTERS:
+                if set(params) & set(self.UNINDEXED_FILTERS):
+                    continue
+                with self.subTest(user=user.username, params=params):
+                    queryset = get_filtered_incidents(user, params)
+                    self.assertEqual(self.get_full_scans(queryset, filtered=bool(params)), [])
+
+    def test_keyset_page_uses_indexes(self):
+        last = Incident.objects.order_by("-created_date", "-id").first()
+        queryset = get_filtered_incidents(self.admin, {}).order_by("-created_date", "-id").filter(
+            Q(created_date__lt=last.created_date) | Q(created_date=last.created_date, id__lt=last.id))[:16]
+        self.assertEqual(self.get_full_scans(queryset), [])
+
+
+class IncidentKeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="admin")
+        Incident.objects.bulk_create(
+            Incident(refId="PAGE/%04d" % i, title="t", description="d", current_status="NEW")
+            for i in range(7)
+        )
+        # share one timestamp between several rows to exercise the id tie breaker
+        Incident.objects.filter(refId__in=["PAGE/0002", "PAGE/0003", "PAGE/0004"]) \
+            .update(created_date=timezone.now() - timedelta(hours=1))
+
+    def get_page(self, params):
+        request = APIRequestFactory().get("/incidents/", params)
+        force_authenticate(request, user=self.admin)
+        return IncidentList.as_view()(request).data
+
+    def test_pages_cover_every_incident_once_in_order(self):
+        expected = list(Incident.objects.order_by("-created_date", "-id").values_list("refId", flat=True))
+
+        seen = []
+        page = self.get_page({"cursor": "", "pageSize": 3, "with_count": "true"})
+        self.assertEqual(page["count"], 7)
+        while True:
+            seen += [incident["refId"] for incident in page["incidents"]]
+            if page["next"] is None:
+                break
+            page = self.get_page({"cursor": page["next"], "pageSize": 3})
+
+        self.assertEqual(seen, expected)
+
+    def test_count_is_the_total_on_every_page(self):
+        cache.clear()
+        page = self.get_page({"cursor": "", "pageSize": 3})
+        page = self.get_page({"cursor": page["next"], "pageSize": 3, "with_count": "true"})
+        self.assertEqual(page["count"], 7)
+
+        # the cached count is shared with the first page
+        self.assertEqual(self.get_page({"cursor": "", "pageSize": 3, "with_count": "true"})["count"], 7)
+
+    def test_invalid_cursor(self):
+        request = APIRequestFactory().get("/incidents/", {"cursor": "not-a-cursor"})
+        force_authenticate(request, user=self.admin)
+        self.assertEqual(IncidentList.as_view()(request).status_code, 404)
+
+    def test_cursor_with_an_invalid_date(self):
+        cursor = base64.urlsafe_b64encode(("garbage|%s" % uuid.uuid4()).encode()).decode()
+        request = APIRequestFactory().get("/incidents/", {"cursor": cursor})
+        force_authenticate(request, user=self.admin)
+        self.assertEqual(IncidentList.as_view()(request).status_code, 404)
+
+
+class IncidentListSerializationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        organization = Organization.objects.create(code="org", displayName="Org")
+        division = Division.objects.create(code="div", organization=organization,
+                                           division_type="District", name="Colombo")
+        role = Group.objects.create(name="coordinator")
+        role.permissions.add(*Permission.objects.all()[:3])
+        level = UserLevel.objects.create(code="lvl", displayName="Level", organization=organization, role=role)
+
+        users = []
+        for i in range(4):
+            user = User.objects.create(username="user%d" % i)
+            user.profile.organization = organization
+            user.profile.division = division
+            user.profile.level = level
+            user.profile.save()
+            users.append(user)
+
+        for i in range(25):
+            incident = Incident.objects.create(refId="SER/%04d" % i, title="t", description="d",
+                                               assignee=users[i % 4])
+            incident.linked_individuals.add(users[(i + 1) % 4])
+            EscalateExternalWorkflow.objects.create(incident=incident, actioned_user=users[i % 4],
+                                                    escalated_user=users[(i + 1) % 4],
+                                                    is_internal_user=True, comment="c")
+
+    def serialize_page(self, page_size):
+        incidents = IncidentSerializer.setup_eager_loading(Incident.objects.order_by("-created_date"))
+        return IncidentSerializer(incidents[:page_size], many=True).data
+
+    def test_query_count_is_independent_of_page_size(self):
+        # warm the role permission cache
+        self.serialize_page(1)
+
+        # incidents, group permissions, linked individuals, escalations
+        for page_size in [5, 25]:
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(4):
+                    data = self.serialize_page(page_size)
+                self.assertEqual(len(data), page_size)
+                self.assertEqual(data[0]["lastAssignment"]["assigned_to"], "Org - District: Colombo")
+                self.assertEqual(len(list(data[0]["assignee"]["userPermissions"])), 3)
+
+
+class AssigneeWorkloadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        organization = Organization.objects.create(code="org", displayName="Org")
+        cls.division = Division.objects.create(code="div", organization=organization,
+                                               division_type="District", name="Colombo")
+        role = Group.objects.create(name="role")
+
+        # a chain of levels where only the top two have users
+        parent = None
+        cls.levels = []
+        for i in range(6):
+            parent = UserLevel.objects.create(code="lvl%d" % i, displayName="Level", organization=organization,
+                                              parent=parent, role=role)
+            cls.levels.append(parent)
+
+        for name, level in [("top1", 0), ("top2", 0), ("mid1", 1), ("mid2", 1)]:
+            user = User.objects.create(username=name)
+            user.profile.division = cls.division
+            user.profile.level = cls.levels[level]
+            user.profile.save()
+
+        user = User.objects.create(username="bottom")
+        user.profile.division = cls.division
+        user.profile.level = cls.levels[-1]
+        user.profile.save()
+
+    def setUp(self):
+        invalidate_permission_cache()
+
+    def workload(self, username):
+        return User.objects.get(username=username).profile.open_workload
+
+    def test_counter_follows_assignment_close_and_reopen(self):
+        mid1 = User.objects.get(username="mid1")
+        mid2 = User.objects.get(username="mid2")
+
+        incident = Incident.objects.create(refId="WRK/0001", title="t", description="d", assignee=mid1)
+        IncidentStatus.objects.create(current_status=StatusType.NEW, incident=incident)
+        self.assertEqual(self.workload("mid1"), 1)
+
+        incident = Incident.objects.get(id=incident.id)
+        incident.assignee = mid2
+        incident.save()
+        self.assertEqual((self.workload("mid1"), self.workload("mid2")), (0, 1))
+
+        IncidentStatus.objects.create(current_status=StatusType.CLOSED, previous_status=StatusType.NEW.name,
+                                      incident=incident)
+        self.assertEqual(self.workload("mid2"), 0)
+
+        IncidentStatus.objects.create(current_status=StatusType.REOPENED, previous_status=StatusType.CLOSED.name,
+                                      incident=incident)
+        self.assertEqual(self.workload("mid2"), 1)
+
+        self.assertEqual(recount_open_workloads(), {mid2.id: 1})
+
+    def test_candidate_is_least_loaded_user_of_nearest_level(self):
+        mid1 = User.objects.get(username="mid1")
+        Incident.objects.create(refId="WRK/0002", title="t", description="d", assignee=mid1)
+        bottom = User.objects.get(username="bottom")
+
+        # warm the level hierarchy cache
+        find_escalation_candidate(bottom)
+
+        # candidate profiles and the chosen user, regardless of the hierarchy depth
+        with self.assertNumQueries(2):
+            candidate = find_escalation_candidate(bottom)
+
+        self.assertEqual(candidate.username, "mid2")
+
+
+class IncidentExportTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(code="C01", top_category="Top", sub_category="Sub; one",
+                                                sn_top_category="", sn_sub_category="",
+                                                tm_top_category="", tm_sub_category="")
+        for i in range(3):
+            Incident.objects.create(refId="TEST/%04d" % i, title="t%d" % i, description="d\n%d" % i,
+                                    category=str(self.category.id), current_status=StatusType.NEW.name,
+                                    current_severity="LOW")
+
+    def test_csv_streams_only_the_filtered_incidents(self):
+        incidents = Incident.objects.exclude(refId="TEST/0001").order_by("refId")
+        response = get_fitlered_incidents_report(incidents, "csv")
+
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content, (
+            "Ref ID;Title;Description;Status;Severity;Response Time;Category\r\n"
+            "TEST/0000;t0;\"d\n0\";NEW;LOW;12;\"Sub; one\"\r\n"
+            "TEST/0002;t2;\"d\n2\";NEW;LOW;12;\"Sub; one\"\r\n"
+        ))
+
+    def test_xlsx_is_a_streamed_workbook(self):
+        response = get_fitlered_incidents_report(Incident.objects.all(), "xlsx")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="incidents.xlsx"')
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"PK"))
+
+
+class IncidentDailyCountTestCase(TestCase):
+    def get_counts(self):
+        return sorted(
+            IncidentDailyCount.objects.exclude(count=0)
+            .values_list("district", "category", "severity", "status", "incident_type", "count")
+        )
+
+    def test_counts_follow_incident_changes(self):
+        incident = Incident.objects.create(refId="TEST/0001", title="t", description="d", district="CMB",
+                                           category="1", severity=9)
+        Incident.objects.create(refId="TEST/0002", title="t", description="d", district="CMB", category="1",
+                                severity=9)
+        self.assertEqual(self.get_counts(), [("CMB", "1", "High", "", "COMPLAINT", 2)])
+
+        incident = Incident.objects.get(id=incident.id)
+        incident.category = "2"
+        incident.save()
+        IncidentStatus.objects.create(current_status=StatusType.CLOSED, incident=incident)
+        # saving the incident again after the status change does not count it twice
+        incident.save()
+
+        expected = [("CMB", "1", "High", "", "COMPLAINT", 1), ("CMB", "2", "High", "CLOSED", "COMPLAINT", 1)]
+        self.assertEqual(self.get_counts(), expected)
+
+        self.assertEqual(reconcile_daily_counts(), 2)
+        self.assertEqual(self.get_counts(), expected)
+
+    def test_reconcile_repairs_bulk_changes(self):
+        Incident.objects.create(refId="TEST/0001", title="t", description="d", district="CMB")
+        Incident.objects.update(district="GAL")
+
+        reconcile_daily_counts()
+        self.assertEqual([row[0] for row in self.get_counts()], ["GAL"])
+
+    def test_reconcile_counts_missing_values_like_incident_saves(self):
+        Incident.objects.create(refId="TEST/0001", title="t", description="d", severity=5)
+        Incident.objects.create(refId="TEST/0002", title="t", description="d", district="CMB")
+        expected = self.get_counts()
+        self.assertEqual(expected, [("", "", "Medium", "", "COMPLAINT", 1), ("CMB", "", "Low", "", "COMPLAINT", 1)])
 
-# Create your tests here.
+        IncidentDailyCount.objects.all().delete()
+        self.assertEqual(reconcile_daily_counts(), 2)
+        self.assertEqual(self.get_counts(), expected)
@@ -9,7 +9,6 @@ from rest_framework.renderers import (
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_jwt.authentication import JSONWebTokenAuthentication
-from django.db.models import Q
 
 from .models import Incident, StatusType, SeverityType, ReopenWorkflow as Reopened, CannedResponse
 from django.contrib.auth.models import User, Group, Permission
@@ -56,6 +55,7 @@ from .services import (
     validateRecaptcha,
     send_incident_created_mail,
     get_incident_status_guest,
+    get_filtered_incidents,
     send_canned_response,
     send_incident_created_sms,
     get_incident_status_guest
@@ -70,6 +70,7 @@ from rest_framework.renderers import JSONRenderer
 import json
 from ..custom_auth.models import UserLevel
 from ..custom_auth.services import user_can
+from ..common.pagination import KeysetPagination
 from .permissions import *
 from django.conf import settings
 
@@ -79,6 +80,24 @@ class IncidentResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class IncidentKeysetPagination(KeysetPagination):
+    """
+    Cursor pagination of the incident list, used when ?cursor= is given
+    """
+    count_cache_prefix = "incident-count"
+
+    def get_paginated_response(self, data):
+        return Response(
+            dict(
+                [
+                    ("count", self.count),
+                    ("next", self.next_cursor),
+                    ("incidents", data),
+                ]
+            )
+        )
+
+
 class IncidentList(APIView, IncidentResultsSetPagination):
     # authentication_classes = (JSONWebTokenAuthentication, )
     # permission_classes = (IsAuthenticated,)
@@ -107,91 +126,25 @@ class IncidentList(APIView, IncidentResultsSetPagination):
         # election_code = settings.ELECTION
         # incidents = Incident.objects.all().filter(election=election_code).order_by('created_date').reverse()
 
-        incidents = Incident.objects.all().order_by('created_date').reverse()
-        user = request.user
-
-        # for external entities, they can only view related incidents
-        if not user_can(user, CAN_REVIEW_ALL_INCIDENTS):
-            incidents = incidents.filter(linked_individuals__id=user.id)
-
-        # filtering
-        param_query = self.request.query_params.get('q', None)
-        if param_query is not None and param_query != "":
-            incidents = incidents.filter(
-                Q(refId__icontains=param_query) | Q(title__icontains=param_query) |
-                Q(description__icontains=param_query))
-
-        # filter by title
-        param_title = self.request.query_params.get('title', None)
-        if param_title is not None:
-            incidents = incidents.filter(title__contains=param_title)
-
-        param_incident_type = self.request.query_params.get('incident_type', None)
-        if param_incident_type is not None:
-            incidents = incidents.filter(incidentType=param_incident_type)
-
-        param_category = self.request.query_params.get('category', None)
-        if param_category is not None:
-            incidents = incidents.filter(category=param_category)
-
-        param_response_time = self.request.query_params.get('response_time', None)
-        if param_response_time is not None:
-            incidents = incidents.filter(response_time__lte=int(param_response_time))
-
-        param_start_date = self.request.query_params.get('start_date', None)
-        param_end_date = self.request.query_params.get('end_date', None)
-
-        if param_start_date and param_end_date:
-            incidents = incidents.filter(
-                created_date__range=(param_start_date, param_end_date))
-
-        param_assignee = self.request.query_params.get('assignee', None)
-        if param_assignee is not None:
-            if param_assignee == "me":
-                # get incidents of the current user
-                incidents = incidents.filter(assignee=user)
-
-        param_linked = self.request.query_params.get('user_linked', None)
-        if param_linked is not None:
-            if param_linked == "me":
-                # get incidents of the current user
-                incidents = incidents.filter(linked_individuals__id=user.id)
-
         param_status = self.request.query_params.get('status', None)
-        if param_status is not None:
-            try:
-                status_type = StatusType[param_status]
-                incidents = incidents.filter(current_status=param_status)
-            except Exception as e:
-                return Response("Invalid status", status=status.HTTP_400_BAD_REQUEST)
-
-        param_severity = self.request.query_params.get('severity', None)
-        if param_severity is not None:
-            try:
-                incidents = incidents.filter(current_severity=param_severity)
-            except Exception as e:
-                raise IncidentException(e)
-
-        param_closed = self.request.query_params.get('show_closed', None)
-        if param_closed is not None and param_closed == "true":
-            # by default CLOSED incidents are not shown, and also INVALIDATED.
-            incidents = incidents.filter(Q(current_status=StatusType.CLOSED.name) | Q(current_status=StatusType.INVALIDATED.name))
-        else:
-            incidents = incidents.exclude(current_status=StatusType.CLOSED.name).exclude(current_status=StatusType.INVALIDATED.name)
+        if param_status is not None and param_status not in StatusType.__members__:
+            return Response("Invalid status", status=status.HTTP_400_BAD_REQUEST)
 
-        param_institution = self.request.query_params.get('institution', None)
-        if param_institution is not None:
-            incidents = incidents.filter(institution=param_institution)
-
-        param_district = self.request.query_params.get('district', None)
-        if param_district is not None:
-            incidents = incidents.filter(district=param_district)
+        incidents = get_filtered_incidents(request.user, self.request.query_params)
 
         param_export = self.request.query_params.get('export', None)
         if param_export is not None:
             # export path will send a different response
             return get_fitlered_incidents_report(incidents, param_export)
 
+        incidents = IncidentSerializer.setup_eager_loading(incidents)
+
+        if self.request.query_params.get('cursor', None) is not None:
+            paginator = IncidentKeysetPagination()
+            results = paginator.paginate_queryset(incidents, request, view=self)
+            serializer = IncidentSerializer(results, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
         results = self.paginate_queryset(incidents, request, view=self)
         serializer = IncidentSerializer(results, many=True)
         return self.get_paginated_response(serializer.data)
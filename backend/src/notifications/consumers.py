@@ -1,20 +1,33 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-NOTIFICATION_GROUP_NAME = "notification-group"
+def get_user_group_name(user_id) -> str:
+    """ Each user has their own group, so a notification only reaches the sockets of its recipient """
+    return "user-%s" % user_id
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    group_name = None
+
     async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = get_user_group_name(user.id)
         await self.channel_layer.group_add(
-            NOTIFICATION_GROUP_NAME,
+            self.group_name,
             self.channel_name
         )
 
         await self.accept()
 
     async def disconnect(self, close_code):
+        if self.group_name is None:
+            return
+
         await self.channel_layer.group_discard(
-            NOTIFICATION_GROUP_NAME,
+            self.group_name,
             self.channel_name
         )
 
@@ -23,7 +36,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         payload = text_data_json['payload']
 
         await self.channel_layer.group_send(
-            NOTIFICATION_GROUP_NAME,
+            get_user_group_name(1),
             {
                 'type': 'notify',
                 'payload': payload,
@@ -35,15 +48,13 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def notify(self, event):
         try:
             payload = event['payload']
-            send_to = event['send_to']
-
-            if self.scope['user'].id == send_to:
-                # Send message to WebSocket
-                await self.send(text_data=json.dumps({
-                    'type': 'notification',
-                    'payload': payload
-                }))
+
+            # Send message to WebSocket
+            await self.send(text_data=json.dumps({
+                'type': 'notification',
+                'payload': payload
+            }))
         except Exception as e:
             print("error", e)
             pass
-        
\ No newline at end of file
+        
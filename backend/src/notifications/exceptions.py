@@ -4,4 +4,10 @@ class BaseException(APIException):
     pass
 
 class NotificationException(BaseException):
-    pass
\ No newline at end of file
+    pass
+
+class SmsGatewayException(Exception):
+    pass
+
+class SmsGatewayUnavailable(SmsGatewayException):
+    pass
@@ -0,0 +1,45 @@
+import time
+import uuid
+
+from django.core.mail import get_connection, send_mail
+from django.core.management.base import BaseCommand
+
+from ....testing.fake_smtp_server import FakeSmtpServer
+from ...models import OutboundMessage, MessageChannel
+from ...services import send_email_messages, EMAIL_SENDER
+
+
+class Command(BaseCommand):
+    help = "Sends emails to a local fake smtp server and compares per-message and pooled connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500)
+
+    def handle(self, *args, **options):
+        messages = [
+            OutboundMessage(id=uuid.uuid4(), channel=MessageChannel.EMAIL.name, recipient="user%d@example.com" % i,
+                            subject="Your Request Closed", body="We closed your request. Reference ID%d" % i)
+            for i in range(options["count"])
+        ]
+
+        with FakeSmtpServer() as smtp:
+            def connect(**kwargs):
+                return get_connection("django.core.mail.backends.smtp.EmailBackend", host=smtp.host,
+                                      port=smtp.port, username="", password="", use_tls=False, use_ssl=False,
+                                      **kwargs)
+
+            started = time.perf_counter()
+            for message in messages:
+                send_mail(message.subject, message.body, EMAIL_SENDER, [message.recipient],
+                          connection=connect(fail_silently=False))
+            self.report("connection per message", smtp, started)
+
+            smtp.messages, smtp.connections = [], 0
+            started = time.perf_counter()
+            errors = send_email_messages(messages, connection=connect(fail_silently=False))
+            self.report("pooled connection", smtp, started, errors)
+
+    def report(self, name, smtp, started, errors=()):
+        elapsed = time.perf_counter() - started
+        self.stdout.write("%s: %d sent in %.2fs (%.0f messages/s), %d connections, %d errors" % (
+            name, len(smtp.messages), elapsed, len(smtp.messages) / elapsed, smtp.connections, len(errors)))
@@ -0,0 +1,57 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from ...consumers import NotificationConsumer, get_user_group_name
+
+
+class Command(BaseCommand):
+    help = "Connects simulated websocket clients and measures notification delivery latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=10000)
+        parser.add_argument("--notifications", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        async_to_sync(self.run)(options["clients"], options["notifications"])
+
+    async def run(self, client_count, notification_count):
+        channel_layer = get_channel_layer()
+
+        def consumer_for(user_id):
+            return lambda scope: NotificationConsumer(dict(scope, user=User(id=user_id)))
+
+        started = time.perf_counter()
+        clients = [WebsocketCommunicator(consumer_for(i), "ws/notifications") for i in range(client_count)]
+        for batch in range(0, client_count, 500):
+            await asyncio.gather(*[client.connect(timeout=30) for client in clients[batch:batch + 500]])
+        self.stdout.write("connected %d clients in %.2fs" % (client_count, time.perf_counter() - started))
+
+        latencies = []
+        started = time.perf_counter()
+        for i in range(notification_count):
+            user_id = random.randrange(client_count)
+            sent = time.perf_counter()
+            await channel_layer.group_send(get_user_group_name(user_id), {
+                "type": "notify",
+                "payload": {"id": i},
+                "send_to": user_id
+            })
+            await clients[user_id].receive_from(timeout=10)
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write("delivered %d notifications in %.2fs (%.0f/s)" % (
+            notification_count, elapsed, notification_count / elapsed))
+        self.stdout.write("latency p50: %.2fms, p99: %.2fms" % (
+            1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]))
+
+        for batch in range(0, client_count, 500):
+            await asyncio.gather(*[client.disconnect() for client in clients[batch:batch + 500]])
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ....testing.fake_sms_gateway import FakeSmsGateway
+from ...sms import SmsGatewayClient
+
+
+class Command(BaseCommand):
+    help = "Sends messages to a local fake sms gateway and reports throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000)
+        parser.add_argument("--connections", type=int, default=4)
+        parser.add_argument("--rate", type=float, default=100000,
+                            help="client side rate limit in messages per second")
+        parser.add_argument("--latency", type=float, default=0.005,
+                            help="simulated gateway latency in seconds")
+
+    def handle(self, *args, **options):
+        messages = [("0771%06d" % i, "Benchmark message %d" % i) for i in range(options["count"])]
+
+        with FakeSmsGateway(delay=options["latency"]) as gateway:
+            client = SmsGatewayClient(gateway.url, "user", "key", rate=options["rate"],
+                                      connections=options["connections"])
+
+            started = time.perf_counter()
+            errors = [error for error in client.send_many(messages) if error is not None]
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write("sent: %d in %.2fs (%.0f messages/s)" % (len(gateway.messages), elapsed,
+                                                                   len(gateway.messages) / elapsed))
+        self.stdout.write("errors: %d, connections opened: %d" % (len(errors), gateway.connections))
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework_jwt.settings import api_settings
+
+from ....routing import application
+from ....ws_token_auth import invalidate_ws_user
+
+
+class Command(BaseCommand):
+    help = "Opens bursts of concurrent authenticated websocket handshakes and reports connect latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 1000, 5000])
+        parser.add_argument("--users", type=int, default=50,
+                            help="number of distinct users the sockets authenticate as")
+
+    def handle(self, *args, **options):
+        users = [User.objects.get_or_create(username="ws-benchmark-%d" % i)[0] for i in range(options["users"])]
+        tokens = [api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user)) for user in users]
+
+        for concurrency in options["concurrency"]:
+            for user in users:
+                invalidate_ws_user(user.id)
+            async_to_sync(self.run)(tokens, concurrency)
+
+    async def connect(self, token):
+        communicator = WebsocketCommunicator(application, "ws/notifications?token=%s" % token)
+        started = time.perf_counter()
+        connected, code = await communicator.connect(timeout=60)
+        return communicator, connected, time.perf_counter() - started
+
+    async def run(self, tokens, concurrency):
+        started = time.perf_counter()
+        results = await asyncio.gather(*[self.connect(tokens[i % len(tokens)]) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for communicator, connected, latency in results)
+        failed = len([connected for communicator, connected, latency in results if not connected])
+        self.stdout.write("%d handshakes in %.2fs, %d rejected, p50: %.2fms, p99: %.2fms" % (
+            concurrency, elapsed, failed,
+            1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]))
+
+        await asyncio.gather(*[communicator.disconnect() for communicator, connected, latency in results])
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...services import purge_read_notifications, recount_unread_notifications
+
+
+class Command(BaseCommand):
+    help = "Deletes old read notifications and reconciles the unread notification counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90,
+                            help="read notifications older than this are deleted")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = purge_read_notifications(timedelta(days=options["days"]), batch_size=options["batch_size"])
+        self.stdout.write("Deleted %d read notifications" % deleted)
+
+        unread = recount_unread_notifications()
+        self.stdout.write("Recounted %d unread notifications for %d users" % (sum(unread.values()), len(unread)))
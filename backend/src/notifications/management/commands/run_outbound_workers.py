@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...models import MessageChannel
+from ...services import process_outbound_messages, get_outbound_metrics
+
+
+class Command(BaseCommand):
+    help = "Delivers queued email and sms messages with a fixed pool of workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="seconds to wait when the queue has no due messages")
+        parser.add_argument("--metrics-interval", type=float, default=60.0)
+        parser.add_argument("--once", action="store_true",
+                            help="drain the due messages and exit")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def work(_):
+            try:
+                while not stop.is_set():
+                    processed = sum(
+                        process_outbound_messages(channel, options["batch_size"]) for channel in MessageChannel
+                    )
+                    if processed == 0:
+                        if options["once"]:
+                            return
+                        stop.wait(options["poll_interval"])
+            finally:
+                connection.close()
+
+        executor = ThreadPoolExecutor(max_workers=options["workers"])
+        futures = [executor.submit(work, i) for i in range(options["workers"])]
+
+        try:
+            while not all(future.done() for future in futures):
+                self.write_metrics()
+                for _ in range(int(options["metrics_interval"] * 10)):
+                    if all(future.done() for future in futures):
+                        break
+                    time.sleep(0.1)
+        except KeyboardInterrupt:
+            stop.set()
+        finally:
+            executor.shutdown(wait=True)
+
+        for future in futures:
+            future.result()
+
+        self.write_metrics()
+
+    def write_metrics(self):
+        for channel, metrics in get_outbound_metrics().items():
+            self.stdout.write(
+                "%s depth=%d oldest=%.0fs failed=%d sent(1h)=%d latency=%.1fs" % (
+                    channel, metrics["depth"], metrics["oldestAge"], metrics["failed"],
+                    metrics["sent"], metrics["avgLatency"]
+                )
+            )
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.12 on 2026-10-17 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['send_to', 'is_read', 'created_date'], name='notification_inbox_idx'),
+        ),
+    ]
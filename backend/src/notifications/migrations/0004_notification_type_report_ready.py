@@ -0,0 +1,18 @@
+# Generated by Django 2.2.12 on 2026-10-17 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_notification_inbox_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('INCIDENT_ASSIGNED', 'Incident assigned'), ('REPORT_READY', 'Report ready'), ('OTHER', 'Custom notification type')], max_length=50),
+        ),
+    ]
@@ -1,10 +1,12 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import enum
 import uuid
 
 class NotificationType(enum.Enum):
     INCIDENT_ASSIGNED="Incident assigned"
+    REPORT_READY = "Report ready"
     OTHER = "Custom notification type"
 
 class Notification(models.Model):
@@ -25,4 +27,55 @@ class Notification(models.Model):
 
     created_date = models.DateTimeField(auto_now_add=True)
 
-    
\ No newline at end of file
+    class Meta:
+        indexes = [
+            models.Index(fields=["send_to", "is_read", "created_date"], name="notification_inbox_idx"),
+        ]
+
+
+class MessageChannel(enum.Enum):
+    EMAIL = "Email"
+    SMS = "SMS"
+
+    def __str__(self):
+        return self.name
+
+class MessageStatus(enum.Enum):
+    PENDING = "Pending"
+    SENDING = "Sending"
+    SENT = "Sent"
+    FAILED = "Failed"
+
+    def __str__(self):
+        return self.name
+
+class OutboundMessage(models.Model):
+    """ Email and SMS messages waiting to be delivered by the outbound workers """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    channel = models.CharField(max_length=10, choices=[(tag.name, tag.value) for tag in MessageChannel])
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, null=True, blank=True)
+    body = models.TextField()
+
+    # enqueueing the same key twice results in a single message
+    idempotency_key = models.CharField(max_length=200, unique=True)
+
+    status = models.CharField(max_length=10, choices=[(tag.name, tag.value) for tag in MessageStatus],
+                              default=MessageStatus.PENDING.name)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # when a pending message is due, or when the claim of a sending message expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_date = models.DateTimeField(auto_now_add=True)
+    sent_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["channel", "status", "next_attempt_at"], name="outbound_due_idx"),
+        ]
+
+    def __str__(self):
+        return "%s to %s" % (self.channel, self.recipient)
@@ -1,10 +1,28 @@
-from .models import Notification, NotificationType
+import asyncio
+import logging
+import smtplib
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from .models import Notification, NotificationType, OutboundMessage, MessageChannel, MessageStatus
 from .exceptions import NotificationException
+from .sms import SmsGatewayClient
 from channels.layers import get_channel_layer
-from .consumers import NOTIFICATION_GROUP_NAME
+from .consumers import get_user_group_name
 from asgiref.sync import async_to_sync
 from .serializers import NotificationSerializer
 from rest_framework.renderers import JSONRenderer
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template import Context, Engine
+from django.db import connection, transaction
+from django.db.models import F, Min, Count
+from django.utils import timezone
+from ..custom_auth.models import Profile
+
+logger = logging.getLogger(__name__)
 
 def get_notification_by_id(notification_id: str) -> Notification:
     try:
@@ -17,28 +35,353 @@ def get_notification_by_id(notification_id: str) -> Notification:
     return incident
 
 def read_notification(notification: Notification):
+    mark_notifications_read(notification.send_to, [notification.id])
     notification.is_read = True
-    notification.save()
-
-def add_notification(notification_type: NotificationType, actioned_by, send_to, incident=None):
-    print(notification_type)
-    notification = Notification(
-        notification_type=notification_type.name,
-        send_to=send_to,
-        actioned_by=actioned_by,
-        incident=incident
+
+def adjust_unread_notifications(user_id, delta):
+    if user_id is None or delta == 0:
+        return
+
+    Profile.objects.filter(user_id=user_id).update(unread_notifications=F("unread_notifications") + delta)
+
+def get_unread_count(user) -> int:
+    return Profile.objects.filter(user=user).values_list("unread_notifications", flat=True).first() or 0
+
+def get_inbox(user, unread_only=False):
+    """ Notifications of a user, newest first """
+    notifications = Notification.objects.filter(send_to=user)
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+
+    return notifications.order_by("-created_date", "-id")
+
+def mark_notifications_read(user, notification_ids=None) -> int:
+    """ Marks the given unread notifications of a user, or all of them, as read
+        with a single update. Returns the number of notifications marked.
+    """
+    notifications = Notification.objects.filter(send_to=user, is_read=False)
+    if notification_ids is not None:
+        notifications = notifications.filter(id__in=notification_ids)
+
+    with transaction.atomic():
+        count = notifications.update(is_read=True)
+        adjust_unread_notifications(getattr(user, "id", None), -count)
+
+    return count
+
+def recount_unread_notifications():
+    """ Recomputes the unread notification counter of every user """
+    unread = dict(
+        Notification.objects.exclude(send_to=None)
+        .filter(is_read=False)
+        .values("send_to")
+        .annotate(count=Count("id"))
+        .values_list("send_to", "count")
     )
-    notification.save()
 
-    serializer = NotificationSerializer(notification)
-    print(serializer.data)
+    Profile.objects.exclude(user_id__in=unread.keys()).update(unread_notifications=0)
+    for user_id, count in unread.items():
+        Profile.objects.filter(user_id=user_id).update(unread_notifications=count)
+
+    return unread
+
+def purge_read_notifications(older_than: timedelta, batch_size=1000) -> int:
+    """ Deletes read notifications older than the given age in batches,
+        returns the number of deleted notifications
+    """
+    cutoff = timezone.now() - older_than
+    deleted = 0
+    while True:
+        ids = list(
+            Notification.objects.filter(is_read=True, created_date__lt=cutoff)
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if len(ids) == 0:
+            return deleted
+
+        deleted += Notification.objects.filter(id__in=ids).delete()[0]
+
+def add_notification(notification_type: NotificationType, actioned_by, send_to, incident=None, custom_message=None):
+    return add_notifications(notification_type, actioned_by, [send_to], incident, custom_message)[0]
+
+def add_notifications(notification_type: NotificationType, actioned_by, recipients, incident=None,
+                      custom_message=None):
+    """ Notifies several users of the same event with a single insert. The notifications
+        are pushed to the recipients' sockets in one batch once the transaction commits.
+    """
+    started = time.perf_counter()
+    notifications = Notification.objects.bulk_create([
+        Notification(
+            notification_type=notification_type.name,
+            send_to=send_to,
+            actioned_by=actioned_by,
+            incident=incident,
+            custom_messsage=custom_message
+        ) for send_to in recipients
+    ])
+
+    # recipients notified the same number of times share one counter update
+    recipients_by_count = defaultdict(list)
+    for user_id, count in Counter(send_to.id for send_to in recipients if send_to is not None).items():
+        recipients_by_count[count].append(user_id)
+    for count, user_ids in recipients_by_count.items():
+        Profile.objects.filter(user_id__in=user_ids).update(unread_notifications=F("unread_notifications") + count)
 
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        NOTIFICATION_GROUP_NAME,
-        {
+    messages = [
+        (get_user_group_name(notification.send_to_id), {
             'type': 'notify',
-            'payload': serializer.data,
-            'send_to': send_to.id
+            'payload': payload,
+            'send_to': notification.send_to_id
+        })
+        for notification, payload in zip(notifications, NotificationSerializer(notifications, many=True).data)
+        if notification.send_to_id is not None
+    ]
+    inserted = time.perf_counter()
+
+    transaction.on_commit(lambda: push_notifications(messages, inserted - started))
+
+    return notifications
+
+def push_notifications(messages, insert_time=0.0):
+    """ Sends (group, event) messages to the channel layer with one sync to async hop """
+    started = time.perf_counter()
+    if len(messages) > 0:
+        async_to_sync(group_send_many)(get_channel_layer(), messages)
+
+    logger.info("notification batch of %d: insert %.1fms, push %.1fms",
+                len(messages), 1000 * insert_time, 1000 * (time.perf_counter() - started))
+
+async def group_send_many(channel_layer, messages):
+    await asyncio.gather(*[channel_layer.group_send(group, event) for group, event in messages])
+
+
+# outbound email and sms are queued in the OutboundMessage table and
+# delivered by the run_outbound_workers management command
+OUTBOUND_MAX_ATTEMPTS = 6
+OUTBOUND_BACKOFF_SECONDS = 30
+OUTBOUND_MAX_BACKOFF_SECONDS = 60 * 60
+OUTBOUND_CLAIM_SECONDS = 5 * 60
+
+EMAIL_SENDER = 'tellpresident_noreply@lgc2.gov.lk'
+
+# plain text email templates, as (subject, body)
+EMAIL_TEMPLATES = {
+    "incident_created": ("Your Request Recieved", "We recieved your request. Reference ID{{ refId }}"),
+    "incident_assigned": ("Request Assigned", "You have been assigned to a request. Reference ID{{ refId }}"),
+    "incident_closed": ("Your Request Closed", "We closed your request. Reference ID{{ refId }}"),
+}
+
+_email_engine = Engine(autoescape=False)
+_compiled_email_templates = {}
+
+def enqueue_message(channel: MessageChannel, recipient: str, body: str, idempotency_key: str, subject=None):
+    message, created = OutboundMessage.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={
+            "channel": channel.name,
+            "recipient": recipient,
+            "subject": subject,
+            "body": body
         }
     )
+
+    return message
+
+def enqueue_email(subject, message, receivers, idempotency_key):
+    for receiver in receivers:
+        enqueue_message(MessageChannel.EMAIL, receiver, message, "%s/email/%s" % (idempotency_key, receiver),
+                        subject=subject)
+
+def get_email_template(name: str):
+    """ Returns the compiled subject and body templates, compiled once per process """
+    if name not in _compiled_email_templates:
+        subject, body = EMAIL_TEMPLATES[name]
+        _compiled_email_templates[name] = (_email_engine.from_string(subject), _email_engine.from_string(body))
+
+    return _compiled_email_templates[name]
+
+def render_email(name: str, context: dict):
+    subject, body = get_email_template(name)
+    return subject.render(Context(context)), body.render(Context(context))
+
+def enqueue_templated_email(name: str, context: dict, receivers, idempotency_key):
+    subject, message = render_email(name, context)
+    enqueue_email(subject, message, receivers, idempotency_key)
+
+def enqueue_sms(number, message, idempotency_key):
+    enqueue_message(MessageChannel.SMS, number, message, "%s/sms" % idempotency_key)
+
+_sms_client = None
+_sms_client_lock = threading.Lock()
+
+def get_sms_client() -> SmsGatewayClient:
+    global _sms_client
+    with _sms_client_lock:
+        if _sms_client is None:
+            _sms_client = SmsGatewayClient(
+                settings.SMS_GATEWAY_URL,
+                settings.SMS_GATEWAY_USER,
+                settings.SMS_GATEWAY_PASSWORD,
+                rate=settings.SMS_GATEWAY_RATE,
+                connections=settings.SMS_GATEWAY_CONNECTIONS
+            )
+
+    return _sms_client
+
+def send_sms(number, message):
+    get_sms_client().send(number, message)
+
+def send_email_messages(messages, connection=None):
+    """ Delivers a batch of queued emails over a single smtp connection, returns the
+        error for each failed message
+    """
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        return {message.id: e for message in messages}
+
+    errors = {}
+    try:
+        for message in messages:
+            email = EmailMessage(message.subject, message.body, EMAIL_SENDER, [message.recipient],
+                                 connection=connection)
+            try:
+                email.send()
+            except smtplib.SMTPServerDisconnected as e:
+                errors[message.id] = e
+                # the remaining messages need a fresh connection
+                connection.close()
+                connection.open()
+            except smtplib.SMTPException as e:
+                # refused by the server, the connection is still usable
+                errors[message.id] = e
+            except OSError as e:
+                errors[message.id] = e
+                connection.close()
+                connection.open()
+            except Exception as e:
+                errors[message.id] = e
+    except Exception as e:
+        # the connection could not be reopened, retry the rest of the batch later
+        for message in messages:
+            errors.setdefault(message.id, e)
+    finally:
+        connection.close()
+
+    return errors
+
+def send_sms_messages(messages):
+    """ Delivers a batch of queued sms, returns the error for each failed message """
+    results = get_sms_client().send_many([(message.recipient, message.body) for message in messages])
+
+    return {message.id: error for message, error in zip(messages, results) if error is not None}
+
+OUTBOUND_SENDERS = {
+    MessageChannel.EMAIL.name: send_email_messages,
+    MessageChannel.SMS.name: send_sms_messages,
+}
+
+def claim_outbound_messages(channel: MessageChannel, batch_size: int):
+    """ Claims due messages of a channel for delivery. Workers skip rows locked by
+        other workers, and an expired claim makes a message due again, unless it
+        used up its attempts: a message that keeps crashing its worker fails.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboundMessage.objects.select_for_update(
+                skip_locked=connection.features.has_select_for_update_skip_locked
+            ).filter(
+                channel=channel.name,
+                status__in=[MessageStatus.PENDING.name, MessageStatus.SENDING.name],
+                next_attempt_at__lte=now
+            ).order_by("next_attempt_at")[:batch_size]
+        )
+
+        exhausted_ids = [message.id for message in messages
+                         if message.status == MessageStatus.SENDING.name and message.attempts >= OUTBOUND_MAX_ATTEMPTS]
+        if exhausted_ids:
+            OutboundMessage.objects.filter(id__in=exhausted_ids).update(
+                status=MessageStatus.FAILED.name,
+                last_error="claim expired after the last attempt"
+            )
+            messages = [message for message in messages if message.id not in exhausted_ids]
+
+        OutboundMessage.objects.filter(id__in=[message.id for message in messages]).update(
+            status=MessageStatus.SENDING.name,
+            attempts=F("attempts") + 1,
+            next_attempt_at=now + timedelta(seconds=OUTBOUND_CLAIM_SECONDS)
+        )
+
+    for message in messages:
+        message.attempts += 1
+
+    return messages
+
+def get_retry_delay(attempts: int) -> timedelta:
+    seconds = OUTBOUND_BACKOFF_SECONDS * (2 ** (attempts - 1))
+    return timedelta(seconds=min(seconds, OUTBOUND_MAX_BACKOFF_SECONDS))
+
+def process_outbound_messages(channel: MessageChannel, batch_size=50):
+    """ Delivers one batch of due messages of a channel, returns the number of claimed messages """
+    messages = claim_outbound_messages(channel, batch_size)
+    if len(messages) == 0:
+        return 0
+
+    errors = OUTBOUND_SENDERS[channel.name](messages)
+
+    now = timezone.now()
+    sent_ids = [message.id for message in messages if message.id not in errors]
+    OutboundMessage.objects.filter(id__in=sent_ids).update(
+        status=MessageStatus.SENT.name,
+        sent_date=now,
+        last_error=None
+    )
+
+    for message in messages:
+        if message.id not in errors:
+            continue
+
+        if message.attempts >= OUTBOUND_MAX_ATTEMPTS:
+            status = MessageStatus.FAILED.name
+        else:
+            status = MessageStatus.PENDING.name
+
+        OutboundMessage.objects.filter(id=message.id).update(
+            status=status,
+            next_attempt_at=now + get_retry_delay(message.attempts),
+            last_error=str(errors[message.id])
+        )
+
+    return len(messages)
+
+def get_outbound_metrics(window=timedelta(hours=1)):
+    """ Queue depth, age of the oldest due message and delivery latency per channel """
+    now = timezone.now()
+    metrics = {}
+    for channel in MessageChannel:
+        queued = OutboundMessage.objects.filter(
+            channel=channel.name,
+            status__in=[MessageStatus.PENDING.name, MessageStatus.SENDING.name]
+        ).aggregate(depth=Count("id"), oldest=Min("created_date"))
+
+        sent = OutboundMessage.objects.filter(
+            channel=channel.name,
+            status=MessageStatus.SENT.name,
+            sent_date__gte=now - window
+        )
+        # latency is averaged over the most recent deliveries, date arithmetic in
+        # aggregates is not portable across database backends
+        recent = sent.order_by("-sent_date").values_list("created_date", "sent_date")[:1000]
+        latencies = [(sent_date - created_date).total_seconds() for created_date, sent_date in recent]
+
+        metrics[channel.name] = {
+            "depth": queued["depth"],
+            "oldestAge": (now - queued["oldest"]).total_seconds() if queued["oldest"] else 0,
+            "failed": OutboundMessage.objects.filter(channel=channel.name, status=MessageStatus.FAILED.name).count(),
+            "sent": sent.count(),
+            "avgLatency": sum(latencies) / len(latencies) if latencies else 0,
+        }
+
+    return metrics
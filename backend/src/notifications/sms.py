@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .exceptions import SmsGatewayException, SmsGatewayUnavailable
+
+# the gateway accepts a single recipient per request, the envelope is built once
+# per client with the credentials and only the recipient and message vary
+SMS_ENVELOPE = """<?xml version='1.0' encoding='utf-8'?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:v1="http://schemas.icta.lk/xsd/kannel/handler/v1/" soapenv:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">
+<soapenv:Header>
+<govsms:authData xmlns:govsms="http://govsms.icta.lk/">
+<govsms:user>{user}</govsms:user>
+<govsms:key>{key}</govsms:key>
+</govsms:authData>
+</soapenv:Header>
+<soapenv:Body>
+<v1:SMSRequest>
+<v1:requestData>
+<v1:outSms>{{message}}</v1:outSms>
+<v1:recepient>{{number}}</v1:recepient>
+<v1:depCode>IctaTest</v1:depCode>
+<v1:smscId/>
+<v1:billable/>
+</v1:requestData>
+</v1:SMSRequest>
+</soapenv:Body>
+</soapenv:Envelope>
+"""
+
+
+def format_number(number: str) -> str:
+    return "94" + number[-9:]
+
+
+class TokenBucket:
+    """ Allows `rate` acquisitions per second on average with bursts of up to `capacity` """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """ Opens after `threshold` consecutive failures and lets a single trial request
+        through once `cooldown` seconds have passed
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise SmsGatewayUnavailable("SMS gateway circuit is open")
+            # half open, the next failure opens the circuit again
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class SmsGatewayClient:
+    """ Sends sms through the government sms gateway over a pooled keep-alive session """
+
+    def __init__(self, url, user, key, rate=10, connections=4, timeout=10,
+                 failure_threshold=5, cooldown=30):
+        self.url = url
+        self.timeout = timeout
+        self.connections = connections
+        self.envelope = SMS_ENVELOPE.format(user=escape(user or ""), key=escape(key or ""))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'content-type': 'text/xml'})
+
+        self.rate_limiter = TokenBucket(rate)
+        self.circuit_breaker = CircuitBreaker(failure_threshold, cooldown)
+
+    def send(self, number: str, message: str):
+        self.circuit_breaker.before_call()
+        self.rate_limiter.acquire()
+
+        body = self.envelope.format(number=escape(format_number(number)), message=escape(message))
+        try:
+            response = self.session.post(self.url, data=body.encode("utf-8"), timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.circuit_breaker.record_failure()
+            raise SmsGatewayException(str(e))
+
+        self.circuit_breaker.record_success()
+
+    def send_many(self, messages):
+        """ Sends (number, message) pairs over the pooled connections, returns a list
+            with the exception raised for each pair or None when it was sent
+        """
+        def send(pair):
+            try:
+                self.send(*pair)
+            except SmsGatewayException as e:
+                return e
+            return None
+
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            return list(executor.map(send, messages))
@@ -0,0 +1,282 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User, AnonymousUser
+from django.core import mail
+from django.core.mail import get_connection
+from django.db import transaction
+from django.test import TestCase, SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_jwt.settings import api_settings
+
+from ..routing import application
+from ..ws_token_auth import invalidate_ws_user
+
+from .consumers import NotificationConsumer, get_user_group_name
+from .exceptions import SmsGatewayException, SmsGatewayUnavailable
+from ..testing.fake_sms_gateway import FakeSmsGateway
+from ..testing.fake_smtp_server import FakeSmtpServer
+from .sms import SmsGatewayClient, TokenBucket
+from .models import Notification, NotificationType, OutboundMessage, MessageChannel, MessageStatus
+from .views import NotificationList
+from .services import (
+    add_notification,
+    add_notifications,
+    get_unread_count,
+    mark_notifications_read,
+    purge_read_notifications,
+    recount_unread_notifications,
+    enqueue_email,
+    enqueue_message,
+    enqueue_templated_email,
+    send_email_messages,
+    process_outbound_messages,
+    get_outbound_metrics,
+    OUTBOUND_MAX_ATTEMPTS,
+    OUTBOUND_SENDERS
+)
+
+
+class OutboundMessageTestCase(TestCase):
+    def test_enqueue_is_idempotent(self):
+        enqueue_email("Subject", "Body", ["a@example.com", "b@example.com"], "incident-closed/1")
+        enqueue_email("Subject", "Body", ["a@example.com"], "incident-closed/1")
+
+        self.assertEqual(OutboundMessage.objects.count(), 2)
+
+    def test_due_emails_are_delivered(self):
+        enqueue_email("Subject", "Body", ["a@example.com", "b@example.com"], "incident-closed/1")
+
+        self.assertEqual(process_outbound_messages(MessageChannel.EMAIL), 2)
+        self.assertEqual(process_outbound_messages(MessageChannel.EMAIL), 0)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["a@example.com", "b@example.com"])
+        self.assertEqual(OutboundMessage.objects.filter(status=MessageStatus.SENT.name).count(), 2)
+        self.assertEqual(get_outbound_metrics()["EMAIL"]["sent"], 2)
+
+    def test_failures_are_retried_with_backoff(self):
+        message = enqueue_message(MessageChannel.SMS, "0771234567", "Body", "incident-closed/1/sms")
+        failing_sender = lambda messages: {message.id: Exception("gateway down") for message in messages}
+
+        with mock.patch.dict(OUTBOUND_SENDERS, {MessageChannel.SMS.name: failing_sender}):
+            for attempt in range(1, OUTBOUND_MAX_ATTEMPTS + 1):
+                self.assertEqual(process_outbound_messages(MessageChannel.SMS), 1)
+
+                message.refresh_from_db()
+                self.assertEqual(message.attempts, attempt)
+                self.assertEqual(message.last_error, "gateway down")
+                self.assertGreater(message.next_attempt_at, timezone.now())
+
+                # not due again until the backoff has passed
+                self.assertEqual(process_outbound_messages(MessageChannel.SMS), 0)
+                OutboundMessage.objects.filter(id=message.id).update(
+                    next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, MessageStatus.FAILED.name)
+        self.assertEqual(process_outbound_messages(MessageChannel.SMS), 0)
+        self.assertEqual(get_outbound_metrics()["SMS"]["failed"], 1)
+
+    def test_expired_claims_fail_after_the_last_attempt(self):
+        message = enqueue_message(MessageChannel.SMS, "0771234567", "Body", "incident-closed/1/sms")
+        # a worker crashed while sending the last attempt, its claim expired
+        OutboundMessage.objects.filter(id=message.id).update(
+            status=MessageStatus.SENDING.name, attempts=OUTBOUND_MAX_ATTEMPTS,
+            next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(process_outbound_messages(MessageChannel.SMS), 0)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, MessageStatus.FAILED.name)
+        self.assertEqual(message.attempts, OUTBOUND_MAX_ATTEMPTS)
+
+
+class SmsGatewayClientTestCase(SimpleTestCase):
+    def test_messages_reuse_pooled_connections(self):
+        messages = [("0771234%03d" % i, "Ref <%d> & done" % i) for i in range(20)]
+
+        with FakeSmsGateway() as gateway:
+            client = SmsGatewayClient(gateway.url, "user", "key", rate=1000, connections=2)
+            self.assertEqual(client.send_many(messages), [None] * 20)
+
+        self.assertEqual(sorted(gateway.messages), sorted(("94" + number[-9:], message) for number, message in messages))
+        self.assertLessEqual(gateway.connections, 2)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        with FakeSmsGateway(status=500) as gateway:
+            client = SmsGatewayClient(gateway.url, "user", "key", rate=1000, connections=1,
+                                      failure_threshold=3, cooldown=60)
+            results = client.send_many([("0771234567", "Body")] * 5)
+
+        self.assertEqual([type(error) for error in results],
+                         [SmsGatewayException] * 3 + [SmsGatewayUnavailable] * 2)
+        self.assertEqual(gateway.connections, 1)
+
+    def test_rate_limit(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+class EmailDeliveryTestCase(TestCase):
+    def test_templated_email_is_rendered(self):
+        enqueue_templated_email("incident_closed", {"refId": "C01/010120/0001"}, ["a@example.com"], "closed/1")
+
+        message = OutboundMessage.objects.get()
+        self.assertEqual(message.subject, "Your Request Closed")
+        self.assertEqual(message.body, "We closed your request. Reference IDC01/010120/0001")
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(5):
+            enqueue_templated_email("incident_closed", {"refId": str(i)}, ["user%d@example.com" % i], "closed/%d" % i)
+        messages = list(OutboundMessage.objects.order_by("recipient"))
+
+        with FakeSmtpServer(reject=["user2@example.com"]) as smtp:
+            connection = get_connection("django.core.mail.backends.smtp.EmailBackend", host=smtp.host,
+                                        port=smtp.port, username="", password="", use_tls=False, use_ssl=False)
+            errors = send_email_messages(messages, connection=connection)
+
+        self.assertEqual(list(errors.keys()), [messages[2].id])
+        self.assertEqual([recipients for recipients, data in smtp.messages],
+                         [["user0@example.com"], ["user1@example.com"], ["user3@example.com"], ["user4@example.com"]])
+        self.assertEqual(smtp.connections, 1)
+
+
+def consumer_for(user):
+    return lambda scope: NotificationConsumer(dict(scope, user=user))
+
+class NotificationConsumerTestCase(SimpleTestCase):
+    @async_to_sync
+    async def test_notification_reaches_only_its_recipient(self):
+        recipient = WebsocketCommunicator(consumer_for(User(id=1)), "ws/notifications")
+        other = WebsocketCommunicator(consumer_for(User(id=2)), "ws/notifications")
+        self.assertTrue((await recipient.connect())[0])
+        self.assertTrue((await other.connect())[0])
+
+        await get_channel_layer().group_send(get_user_group_name(1), {
+            "type": "notify",
+            "payload": {"id": "n1"},
+            "send_to": 1
+        })
+
+        self.assertEqual(await recipient.receive_json_from(), {"type": "notification", "payload": {"id": "n1"}})
+        self.assertTrue(await other.receive_nothing())
+
+        await recipient.disconnect()
+        await other.disconnect()
+
+    @async_to_sync
+    async def test_anonymous_sockets_are_rejected(self):
+        communicator = WebsocketCommunicator(consumer_for(AnonymousUser()), "ws/notifications")
+        self.assertFalse((await communicator.connect())[0])
+
+
+def token_for(user):
+    return api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user))
+
+class TokenAuthMiddlewareTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="ws-user")
+        invalidate_ws_user(self.user.id)
+
+    @async_to_sync
+    async def test_token_connects_and_user_is_cached(self):
+        path = "ws/notifications?token=%s" % token_for(self.user)
+
+        communicator = WebsocketCommunicator(application, path)
+        self.assertTrue((await communicator.connect())[0])
+        await communicator.disconnect()
+
+        # a reconnect within the cache timeout does not touch the database
+        with mock.patch.object(User.objects, "filter", side_effect=AssertionError("queried")):
+            communicator = WebsocketCommunicator(application, path)
+            self.assertTrue((await communicator.connect())[0])
+            await communicator.disconnect()
+
+    @async_to_sync
+    async def test_invalid_token_is_rejected(self):
+        communicator = WebsocketCommunicator(application, "ws/notifications?token=invalid")
+        self.assertFalse((await communicator.connect())[0])
+
+
+class NotificationInboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="staff")
+        self.other = User.objects.create(username="other")
+        for _ in range(5):
+            add_notification(NotificationType.OTHER, self.other, self.user)
+        add_notification(NotificationType.OTHER, self.user, self.other)
+
+    def get_page(self, params):
+        request = APIRequestFactory().get("/notifications", params)
+        force_authenticate(request, user=self.user)
+        return NotificationList.as_view()(request).data
+
+    def test_unread_counter_follows_mark_read(self):
+        self.assertEqual(get_unread_count(self.user), 5)
+
+        ids = list(Notification.objects.filter(send_to=self.user).values_list("id", flat=True)[:2])
+        self.assertEqual(mark_notifications_read(self.user, ids), 2)
+        # already read notifications are not counted twice
+        self.assertEqual(mark_notifications_read(self.user, ids), 0)
+        self.assertEqual(get_unread_count(self.user), 3)
+
+        # notifications of other users are left alone
+        self.assertEqual(mark_notifications_read(self.user, [Notification.objects.get(send_to=self.other).id]), 0)
+        self.assertEqual(mark_notifications_read(self.user), 3)
+        self.assertEqual(get_unread_count(self.user), 0)
+        self.assertEqual(get_unread_count(self.other), 1)
+
+        self.assertEqual(recount_unread_notifications(), {self.other.id: 1})
+
+    def test_inbox_pages_cover_all_notifications(self):
+        page = self.get_page({"cursor": "", "pageSize": 2})
+        self.assertEqual(page["unreadCount"], 5)
+        seen = [notification["id"] for notification in page["notifications"]]
+        while page["next"]:
+            page = self.get_page({"cursor": page["next"], "pageSize": 2})
+            seen += [notification["id"] for notification in page["notifications"]]
+
+        expected = Notification.objects.filter(send_to=self.user).order_by("-created_date", "-id")
+        self.assertEqual(seen, [str(notification.id) for notification in expected])
+
+    def test_purge_removes_only_old_read_notifications(self):
+        mark_notifications_read(self.user)
+        Notification.objects.filter(send_to__in=[self.user, self.other]).update(
+            created_date=timezone.now() - timedelta(days=100))
+
+        self.assertEqual(purge_read_notifications(timedelta(days=90), batch_size=2), 5)
+        self.assertEqual(list(Notification.objects.values_list("send_to", flat=True)), [self.other.id])
+
+
+class NotificationFanOutTestCase(TestCase):
+    def test_recipients_are_notified_in_one_batch(self):
+        actioned_by = User.objects.create(username="actioned-by")
+        recipients = [User.objects.create(username="recipient%d" % i) for i in range(3)]
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(get_user_group_name(recipients[1].id), channel)
+
+        with mock.patch.object(transaction, "on_commit") as on_commit:
+            with self.assertNumQueries(2):
+                notifications = add_notifications(NotificationType.OTHER, actioned_by, recipients)
+
+        self.assertEqual([notification.send_to for notification in notifications], recipients)
+        self.assertEqual([get_unread_count(recipient) for recipient in recipients], [1, 1, 1])
+
+        # nothing reaches the sockets before the transaction commits
+        on_commit.assert_called_once()
+        on_commit.call_args[0][0]()
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event["send_to"], recipients[1].id)
+        self.assertEqual(event["payload"]["id"], str(notifications[1].id))
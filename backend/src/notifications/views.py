@@ -1,19 +1,73 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework import status
+
+import uuid
 
-from .models import Notification
 from .serializers import NotificationSerializer
-from .services import get_notification_by_id, read_notification
+from .services import (
+    get_notification_by_id,
+    read_notification,
+    get_inbox,
+    get_unread_count,
+    mark_notifications_read
+)
+from ..common.pagination import KeysetPagination
+
+class NotificationKeysetPagination(KeysetPagination):
+    """
+    Cursor pagination of the notification inbox on (created_date, id)
+    """
+    page_size = 20
+    count_cache_prefix = "notification-count"
+
+    def get_paginated_response(self, data):
+        return Response(
+            dict(
+                [
+                    ("count", self.count),
+                    ("next", self.next_cursor),
+                    ("unreadCount", get_unread_count(self.request.user)),
+                    ("notifications", data),
+                ]
+            )
+        )
 
 class NotificationList(APIView):
     serializer_class = NotificationSerializer
 
     def get(self, request, format=None):
         user = request.user
-        notifications = Notification.objects.all().filter(send_to=user)
+        notifications = get_inbox(user, unread_only=request.query_params.get("unread", None) == "true")
+
+        # the inbox is paginated when ?cursor= is given, an empty cursor is the first page
+        if request.query_params.get("cursor", None) is not None:
+            paginator = NotificationKeysetPagination()
+            results = paginator.paginate_queryset(notifications, request, view=self)
+            serializer = NotificationSerializer(results, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
         serializer = NotificationSerializer(notifications, many=True)
         return Response(serializer.data)
 
+class NotificationUnreadCount(APIView):
+    def get(self, request, format=None):
+        return Response({ "unreadCount": get_unread_count(request.user) })
+
+class NotificationBulkRead(APIView):
+    def post(self, request, format=None):
+        """ Marks the notifications in "ids" as read, or all of them when no ids are given """
+        notification_ids = request.data.get("ids", None)
+        if notification_ids is not None:
+            try:
+                notification_ids = [uuid.UUID(str(notification_id)) for notification_id in notification_ids]
+            except (TypeError, ValueError):
+                return Response("ids must be a list of notification ids", status=status.HTTP_400_BAD_REQUEST)
+
+        count = mark_notifications_read(request.user, notification_ids)
+
+        return Response({ "message": "Notifications read", "count": count })
+
 class NotificationRead(APIView):
     serializer_class = NotificationSerializer
 
@@ -21,4 +75,4 @@ class NotificationRead(APIView):
         notification = get_notification_by_id(notification_id)
         read_notification(notification)
 
-        return Response({ "message": "Notification read" })
\ No newline at end of file
+        return Response({ "message": "Notification read" })
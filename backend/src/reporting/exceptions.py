@@ -0,0 +1,7 @@
+class PdfServiceException(Exception):
+    """ The pdf-service failed to generate a pdf, status_code and text are those of its response """
+
+    def __init__(self, status_code, text):
+        super().__init__("pdf-service returned %s" % status_code)
+        self.status_code = status_code
+        self.text = text
@@ -1,7 +1,24 @@
-from django.db import connection
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+import csv
+import io
+import numpy as np
 import pandas as pd
-from ..reporting.models import SeveritySegment
-from ..common.models import Category
+from ..common.models import District
+from ..incidents.models import (
+    Incident,
+    IncidentDailyCount,
+    IncidentType,
+    DAILY_COUNT_DIMENSIONS,
+    REPORT_UTC_OFFSET,
+    get_report_day,
+    get_report_day_start
+)
+
+# daily count dimension => incident field
+DAILY_COUNT_FIELDS = dict(DAILY_COUNT_DIMENSIONS)
 
 
 def incident_type_title(complain, inquiry):
@@ -14,165 +31,236 @@ def incident_type_title(complain, inquiry):
     return ""
 
 
-def incident_type_query(complain, inquiry):
-    if complain and inquiry:
-        return "(incidents_incident.incidentType LIKE 'COMPLAINT' OR incidents_incident.incidentType LIKE 'INQUIRY')"
-    if complain:
-        return "incidents_incident.incidentType LIKE 'COMPLAINT'"
-    if inquiry:
-        return "incidents_incident.incidentType LIKE 'INQUIRY'"
-    return "(incidents_incident.incidentType LIKE 'COMPLAINT' OR incidents_incident.incidentType LIKE 'INQUIRY')"
-
-
-def incident_list_query(start_date, end_date, incident_type):
-    return """WHERE  incidents_incident.created_date BETWEEN CONVERT_TZ('%s','+05:30','+00:00') AND
-                                                                   CONVERT_TZ('%s','+05:30','+00:00') AND %s""" % (
-        start_date, end_date, incident_type)
-
-
-def get_data_frame(sql, columns):
-    dataframe = pd.read_sql_query(sql, connection)
-
-    dataframe.sort_values(by=['district'], inplace=True)
-    dataframe.set_index(['district'], inplace=True)
-    dataframe.fillna(value=0, inplace=True)
-    dataframe.columns = columns
-
-    dataframe['Total'] = dataframe.sum(axis=1)
-
-    dataframe.index.names = ["District"]
-
-    return dataframe.to_html()
-
-
-def get_subcategory_categorized_report(incident_list, category_name):
-    columns = list(Category.objects.filter(top_category__exact=category_name).values_list("sub_category", flat=True))
-    columns.insert(0, "Unassigned")
-    sql = ", ".join(
-        map(lambda c: "(CASE WHEN ifnull(%s,'Unassigned') LIKE '%s' THEN 1 ELSE 0 END) AS '%s'" % (
-            'sub_category', c, encode_value(c)), columns))
-    sql1 = """
-                                    SELECT district,
-                                               %s
-                                              ,
-                                              1       AS Total
-                                       FROM   incidents_incident
-                                       LEFT JOIN common_category ON category=common_category.id
-                                       %s AND top_category LIKE '%s'
-                                    """ % (sql, incident_list, category_name)
-    columns = encode_column_names(columns)
-    return """<b>Category: %s</b>""" % category_name + get_detailed_report(sql1, columns)
-
-
-def get_subcategory_report(field_name, field_label, field_table, count_field, map_field, start_date, end_date,
-                           incident_type):
-    incident_list = incident_list_query(start_date, end_date, incident_type)
-    sql = """
-            SELECT %s, Total FROM (SELECT %s,
-                   Sum(Total) AS Total
-            FROM   (SELECT ifnull(concat(top_category,' -> ',%s), '(Unassigned)') AS %s,
-                           Sum(Total)                 AS Total
-                    FROM   %s AS d
-                           RIGHT JOIN (SELECT %s,
-                                              '1' AS Total
-                                       FROM   incidents_incident
-                                       %s) AS
-                                      incidents
-                                   ON incidents.%s = d.%s
-                    GROUP  BY incidents.%s
-                    UNION ALL
-                    SELECT concat(top_category,' -> ',sub_category)  AS %s,
-                           '0'
-                    FROM   %s) AS result
-            GROUP  BY result.%s
-            ORDER  BY Field(%s, '(Unassigned)') DESC,Total DESC) as result2
-            UNION
-            SELECT '(Total No. of Incidents)',
-                   Count(id)
-            FROM   incidents_incident
-           %s
-           
-        """ % (
-        field_label, field_label, field_name, field_label, field_table, count_field, incident_list, count_field,
-        map_field, count_field, field_name, field_table, field_label, field_label, incident_list)
-    dataframe = pd.read_sql_query(sql, connection)
-    dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
-
-
-def get_general_report(field_name, field_label, field_table, count_field, map_field, start_date, end_date,
-                       incident_type):
-    incident_list = incident_list_query(start_date, end_date, incident_type)
-    sql = """
-            SELECT %s, Total FROM (SELECT %s,
-                   Sum(Total) AS Total
-            FROM   (SELECT Ifnull(%s, '(Unassigned)') AS %s,
-                           Sum(Total)                 AS Total
-                    FROM   %s AS d
-                           RIGHT JOIN (SELECT %s,
-                                              '1' AS Total
-                                       FROM   incidents_incident
-                                       %s) AS
-                                      incidents
-                                   ON incidents.%s = d.%s
-                    GROUP  BY incidents.%s
-                    UNION ALL
-                    SELECT %s,
-                           '0'
-                    FROM   %s) AS result
-            GROUP  BY result.%s
-            ORDER  BY Field(%s,'(Unassigned)') DESC,Total DESC) as result2
-            UNION
-            SELECT '(Total No. of Incidents)',
-                   Count(id)
-            FROM   incidents_incident
-            %s
-        """ % (
-        field_label, field_label, field_name, field_label, field_table, count_field, incident_list, count_field,
-        map_field, count_field, field_name, field_table, field_label, field_label, incident_list)
-    dataframe = pd.read_sql_query(sql, connection)
-    dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
-
-
-def get_detailed_report(sql1, columns):
-    sql2 = ", ".join(map(lambda c: "Sum(%s) AS %s" % (c, c), columns))
-    sql3 = ", ".join(map(lambda c: "%s" % c, columns))
-    sql4 = ", ".join(map(lambda c: "'0'", columns))
-    sql = """
-            SELECT District,
-                    %s
-                   ,
-                   Total
-            FROM   (SELECT District,
-                           %s,
-                           Sum(Total)  AS Total
-                    FROM   (SELECT Ifnull(name, '(Unassigned)') AS District,
-                                   %s,
-                                   Sum(Total)                   AS Total
-                            FROM   common_district AS d
-                                   RIGHT JOIN (%s) AS
-                                              incidents
-                                           ON incidents.district = d.code
-                            GROUP  BY incidents.district
-                            UNION ALL
-                            SELECT name,
-                                   %s,
-                                   '0'
-                            FROM   common_district) AS result
-                    GROUP  BY result.District
-                    ORDER  BY Total DESC) AS result2
-            UNION ALL
-            SELECT '(Total No. of Incidents)',
-                   %s,
-                   Sum(Total)
-            FROM   (%s)
-                   AS
-                   result3 
-        """ % (sql3, sql2, sql2, sql1, sql4, sql2, sql1)
-    dataframe = pd.read_sql_query(sql, connection)
-    dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
+def get_incident_types(complain, inquiry):
+    if complain and not inquiry:
+        return [IncidentType.COMPLAINT.name]
+    if inquiry and not complain:
+        return [IncidentType.INQUIRY.name]
+    return [IncidentType.COMPLAINT.name, IncidentType.INQUIRY.name]
+
+
+def incident_list_query(start_date, end_date, complain, inquiry):
+    """ WHERE clause selecting the incidents of a report and its parameters """
+    incident_types = get_incident_types(complain, inquiry)
+    sql = """WHERE  incidents_incident.created_date BETWEEN CONVERT_TZ(%%s,'+05:30','+00:00') AND
+                                                           CONVERT_TZ(%%s,'+05:30','+00:00') AND
+                   incidents_incident.incidentType IN (%s)""" % ", ".join(["%s"] * len(incident_types))
+    return sql, [start_date, end_date] + incident_types
+
+
+def parse_report_date(value):
+    """ Report dates are given in Sri Lanka time unless they carry an offset, a date alone is its
+        start. Returns the UTC datetime, None when the value is not a date.
+    """
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.combine(day, time())
+    except (TypeError, ValueError):
+        return None
+
+    if timezone.is_aware(parsed):
+        return parsed.astimezone(timezone.utc)
+    return parsed.replace(tzinfo=timezone.utc) - REPORT_UTC_OFFSET
+
+
+def get_raw_incident_counts(start, end, incident_types, dimensions, include_end):
+    """ Counts incidents created in [start, end) (or [start, end]) from the incidents table """
+    expressions = {}
+    for dimension in dimensions:
+        if dimension == "severity":
+            expressions["dimension_severity"] = Case(
+                When(severity__gt=7, then=Value("High")),
+                When(severity__gt=3, then=Value("Medium")),
+                default=Value("Low"),
+                output_field=CharField()
+            )
+        else:
+            expressions["dimension_%s" % dimension] = F(DAILY_COUNT_FIELDS[dimension])
+
+    incidents = Incident.objects.filter(created_date__gte=start, incidentType__in=incident_types)
+    if include_end:
+        incidents = incidents.filter(created_date__lte=end)
+    else:
+        incidents = incidents.filter(created_date__lt=end)
+
+    return list(
+        incidents.order_by().annotate(**expressions)
+        .values(*expressions.keys())
+        .annotate(total=Count("id"))
+        .values_list(*expressions.keys(), "total")
+    )
+
+
+def get_incident_counts(start_date, end_date, complain, inquiry, dimensions):
+    """ Number of incidents created between two report dates for each combination of the
+        given dimensions (see DAILY_COUNT_DIMENSIONS), as a DataFrame with one column per
+        dimension and a count column. Whole days are read from the daily counts, only the
+        incidents of the partial days at either end are counted from the incidents table.
+    """
+    start = parse_report_date(start_date)
+    end = parse_report_date(end_date)
+    incident_types = get_incident_types(complain, inquiry)
+
+    rows = []
+    if start <= end:
+        first_day = get_report_day(start)
+        if get_report_day_start(first_day) < start:
+            first_day += timedelta(days=1)
+        # the range includes its end, so the day of the end is always partial
+        last_day = get_report_day(end) - timedelta(days=1)
+
+        if first_day <= last_day:
+            rows += list(
+                IncidentDailyCount.objects.filter(day__range=(first_day, last_day), incident_type__in=incident_types)
+                .order_by().values(*dimensions)
+                .annotate(total=Sum("count"))
+                .values_list(*dimensions, "total")
+            )
+            rows += get_raw_incident_counts(start, get_report_day_start(first_day), incident_types, dimensions,
+                                            include_end=False)
+            rows += get_raw_incident_counts(get_report_day_start(last_day + timedelta(days=1)), end, incident_types,
+                                            dimensions, include_end=True)
+        else:
+            rows += get_raw_incident_counts(start, end, incident_types, dimensions, include_end=True)
+
+    counts = pd.DataFrame(rows, columns=list(dimensions) + ["count"])
+    if len(counts) == 0:
+        return counts
+
+    # the daily counts store missing values as empty strings
+    counts[list(dimensions)] = counts[list(dimensions)].fillna("")
+
+    return counts.groupby(list(dimensions), as_index=False)["count"].sum()
+
+
+def get_total_incident_count(complain, inquiry):
+    """ Number of incidents of the given types ever reported """
+    total = IncidentDailyCount.objects.filter(incident_type__in=get_incident_types(complain, inquiry)) \
+        .aggregate(total=Sum("count"))["total"]
+    return total or 0
+
+
+def count_conditions(queryset, conditions, group_by=None):
+    """ Number of rows of the queryset matching each of the named Q conditions, counted with
+        conditional aggregation in a single query. Returns a DataFrame with a column per
+        condition and a row per value of group_by, or a single row when not grouped.
+    """
+    aggregates = dict((name, Count("id", filter=condition)) for name, condition in conditions.items())
+    if group_by is None:
+        return pd.DataFrame([queryset.aggregate(**aggregates)], columns=list(conditions))
+
+    rows = queryset.order_by().values(group_by).annotate(**aggregates).values_list(group_by, *conditions)
+    return pd.DataFrame(list(rows), columns=[group_by] + list(conditions)).set_index(group_by)
+
+
+def get_general_table(values, counts, label, names):
+    """ Table of the number of incidents per name, values maps each count row to its name
+        (None when unassigned). Names without incidents are listed with 0, unassigned
+        incidents first and then the rest by number of incidents.
+    """
+    totals = counts["count"].groupby(values.fillna("(Unassigned)")).sum()
+    table = pd.Series(0, index=pd.Index(list(dict.fromkeys(names)), dtype=object)).add(totals, fill_value=0)
+
+    unassigned = table.index == "(Unassigned)"
+    table = pd.concat([
+        table[unassigned],
+        table[~unassigned].sort_values(ascending=False, kind="mergesort")
+    ])
+    table["(Total No. of Incidents)"] = counts["count"].sum()
+
+    return pd.DataFrame({label: table.index, "Total": table.values.astype(int)})
+
+
+def get_segment_table(values, counts, label, names, order):
+    """ Table of the number of incidents per report segment (ex: severity), in the given order """
+    totals = counts["count"].groupby(values).sum()
+    table = pd.Series([totals.get(name, 0) for name in names], index=names, dtype=int)
+
+    # segments outside of the order come first, as with mysql's FIELD()
+    position = {name: order.index(name) + 1 if name in order else 0 for name in names}
+    table = table[sorted(names, key=lambda name: position[name])]
+    table["(Total No. of Incidents)"] = counts["count"].sum()
+
+    return pd.DataFrame({label: table.index, "Total": table.values.astype(int)})
+
+
+def pivot_district_counts(values, counts):
+    """ Number of incidents per district (rows) and value (columns) in a single pass over the
+        counts, values maps each count row to its column (None when unassigned). All districts
+        are listed, with the incidents of unknown districts as (Unassigned).
+    """
+    districts = dict(District.objects.values_list("code", "name"))
+    rows = counts["district"].map(districts).fillna("(Unassigned)")
+    values = values.fillna("Unassigned")
+
+    row_codes, row_names = pd.factorize(rows)
+    column_codes, column_names = pd.factorize(values)
+    cells = np.bincount(row_codes * len(column_names) + column_codes, weights=counts["count"],
+                        minlength=len(row_names) * len(column_names))
+    pivot = pd.DataFrame(cells.reshape(len(row_names), len(column_names)).astype(int),
+                         index=pd.Index(row_names, dtype=object), columns=pd.Index(column_names, dtype=object))
+
+    names = list(dict.fromkeys(list(districts.values()) + list(row_names)))
+    return pivot.reindex(index=names, fill_value=0)
+
+
+def get_detailed_table(pivot, columns):
+    """ Table of the given columns of a district pivot (see pivot_district_counts), ordered by
+        number of incidents and followed by a row of totals. Incidents of values outside the
+        columns are still counted in the Total column.
+    """
+    table = pivot.reindex(columns=columns, fill_value=0)
+    table["Total"] = pivot.sum(axis=1)
+
+    # the (Unassigned) row is only listed when it has incidents
+    if "(Unassigned)" in table.index and table.loc["(Unassigned)", "Total"] == 0:
+        table = table.drop(index="(Unassigned)")
+
+    table = table.sort_values(by="Total", ascending=False, kind="mergesort")
+    table.loc["(Total No. of Incidents)"] = table.sum()
+
+    table.index.name = "District"
+    return table.reset_index()
+
+
+def render_report_html(tables):
+    """ Html of the (caption, dataframe) tables of a report, column names are encoded
+        for decode_column_names
+    """
+    html = ""
+    for caption, table in tables:
+        if caption is not None:
+            html += "<br><br><br><br><b>%s</b>" % caption
+        html += table.rename(columns=encode_value).to_html(index=False)
+    return html
+
+
+def render_report_csv(tables):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for caption, table in tables:
+        if caption is not None:
+            writer.writerow([caption])
+        writer.writerow(table.columns)
+        writer.writerows(table.itertuples(index=False))
+        writer.writerow([])
+    return output.getvalue()
+
+
+def render_report_json(tables):
+    return [
+        {
+            "caption": caption,
+            "columns": list(table.columns),
+            "rows": [[value.item() if hasattr(value, "item") else value for value in row]
+                     for row in table.itertuples(index=False)]
+        }
+        for caption, table in tables
+    ]
 
 
 def encode_value(text):
@@ -209,6 +297,15 @@ def apply_style(html, title, incident_type, layout, total):
                         size: %s;
                         margin: 2cm;
                     }
+                    body{
+                        font-family: NotoSans;
+                    }
+                    .sinhala{
+                        font-family: Sinhala;
+                    }
+                    .tamil{
+                        font-family: Tamil;
+                    }
                     .dataframe{
                         text-align: center;
                         table-layout: fixed;
@@ -257,116 +354,16 @@ def apply_style(html, title, incident_type, layout, total):
     return html
 
 
-def date_list_query(start_date, end_date):
-    return """
-    SELECT * 
-                        FROM   (SELECT Adddate('2018-01-01', 
-                                       t4.i * 10000 + t3.i * 1000 
-                                       + 
-                                       t2.i * 100 + 
-                                               t1.i * 10 + 
-                                       t0.i) selected_date 
-                                FROM   (SELECT 0 i 
-                                        UNION 
-                                        SELECT 1 
-                                        UNION 
-                                        SELECT 2 
-                                        UNION 
-                                        SELECT 3 
-                                        UNION 
-                                        SELECT 4 
-                                        UNION 
-                                        SELECT 5 
-                                        UNION 
-                                        SELECT 6 
-                                        UNION 
-                                        SELECT 7 
-                                        UNION 
-                                        SELECT 8 
-                                        UNION 
-                                        SELECT 9) t0, 
-                                       (SELECT 0 i 
-                                        UNION 
-                                        SELECT 1 
-                                        UNION 
-                                        SELECT 2 
-                                        UNION 
-                                        SELECT 3 
-                                        UNION 
-                                        SELECT 4 
-                                        UNION 
-                                        SELECT 5 
-                                        UNION 
-                                        SELECT 6 
-                                        UNION 
-                                        SELECT 7 
-                                        UNION 
-                                        SELECT 8 
-                                        UNION 
-                                        SELECT 9) t1, 
-                                       (SELECT 0 i 
-                                        UNION 
-                                        SELECT 1 
-                                        UNION 
-                                        SELECT 2 
-                                        UNION 
-                                        SELECT 3 
-                                        UNION 
-                                        SELECT 4 
-                                        UNION 
-                                        SELECT 5 
-                                        UNION 
-                                        SELECT 6 
-                                        UNION 
-                                        SELECT 7 
-                                        UNION 
-                                        SELECT 8 
-                                        UNION 
-                                        SELECT 9) t2, 
-                                       (SELECT 0 i 
-                                        UNION 
-                                        SELECT 1 
-                                        UNION 
-                                        SELECT 2 
-                                        UNION 
-                                        SELECT 3 
-                                        UNION 
-                                        SELECT 4 
-                                        UNION 
-                                        SELECT 5 
-                                        UNION 
-                                        SELECT 6 
-                                        UNION 
-                                        SELECT 7 
-                                        UNION 
-                                        SELECT 8 
-                                        UNION 
-                                        SELECT 9) t3, 
-                                       (SELECT 0 i 
-                                        UNION 
-                                        SELECT 1 
-                                        UNION 
-                                        SELECT 2 
-                                        UNION 
-                                        SELECT 3 
-                                        UNION 
-                                        SELECT 4 
-                                        UNION 
-                                        SELECT 5 
-                                        UNION 
-                                        SELECT 6 
-                                        UNION 
-                                        SELECT 7 
-                                        UNION 
-                                        SELECT 8 
-                                        UNION 
-                                        SELECT 9) t4) v 
-                        WHERE  selected_date BETWEEN 
-                               Date_format(CONVERT_TZ('%s','+05:30','+00:00'), 
-                               '%s' 
-                               ) 
-                               AND 
-                               Date_format(CONVERT_TZ('%s','+05:30','+00:00'), 
-                               '%s'
-                               )
-    """ % (start_date, "%Y-%m-%d", end_date, "%Y-%m-%d")
+def fill_date_gaps(totals, start_day, end_day):
+    """ Totals indexed by "%Y-%m-%d" dates, with every day from start_day to end_day added
+        with 0, sorted by date. The total of incidents without a date (None) comes first.
+    """
+    days = pd.date_range(start_day, end_day, freq="D").strftime("%Y-%m-%d")
+    dated = totals[totals.index.notnull()].groupby(level=0).sum()
+    filled = dated.reindex(sorted(set(days) | set(dated.index)), fill_value=0)
+
+    undated = totals.index.isnull()
+    if undated.any():
+        filled = pd.concat([pd.Series([totals[undated].sum()], index=[None]), filled])
+
+    return filled
@@ -0,0 +1,66 @@
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...services import get_incident_date_summary
+
+
+def legacy_date_summary(start_date, end_date):
+    """ The previous implementation, which generated every date since 2018-01-01 with a
+        five way cross join of digit tables and filtered it to the requested range
+    """
+    digits = " UNION ".join("SELECT %d %s" % (i, "i" if i == 0 else "") for i in range(10))
+    date_list = """
+        SELECT * FROM (SELECT Adddate('2018-01-01', t4.i * 10000 + t3.i * 1000 + t2.i * 100 + t1.i * 10 + t0.i)
+                              selected_date
+                       FROM (%s) t0, (%s) t1, (%s) t2, (%s) t3, (%s) t4) v
+        WHERE selected_date BETWEEN Date_format(CONVERT_TZ('%s','+05:30','+00:00'), '%%Y-%%m-%%d')
+                                AND Date_format(CONVERT_TZ('%s','+05:30','+00:00'), '%%Y-%%m-%%d')
+        """ % (digits, digits, digits, digits, digits, start_date, end_date)
+    incident_list = """WHERE incidents_incident.created_date BETWEEN CONVERT_TZ('%s','+05:30','+00:00') AND
+                                                               CONVERT_TZ('%s','+05:30','+00:00')""" % (
+        start_date, end_date)
+    sql = """
+        SELECT incident_date as 'Incident Date', Total
+        FROM (SELECT incident_date, Sum(Total) AS Total
+              FROM (SELECT Date_format(occured_date + INTERVAL 8 HOUR, '%%Y-%%m-%%d') AS incident_date, '1' AS Total
+                    FROM incidents_incident
+                    %s
+                    UNION ALL
+                    SELECT selected_date, '0' FROM (%s) AS dateranges) AS result
+              GROUP BY result.incident_date
+              ORDER BY incident_date) AS result2
+        UNION
+        SELECT '(Total No. of Incidents)', Count(id) FROM incidents_incident %s
+        """ % (incident_list, date_list, incident_list)
+    return pd.read_sql_query(sql, connection).fillna(0).to_html(index=False)
+
+
+class Command(BaseCommand):
+    help = "Compares the incident date summary against the previous synthetic date list query"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, nargs="+", default=[1, 30, 365])
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **options):
+        end = date.today()
+
+        for days in options["days"]:
+            start_date = (end - timedelta(days=days)).strftime("%Y-%m-%d 16:00:00")
+            end_date = end.strftime("%Y-%m-%d 16:00:00")
+
+            timings = {}
+            for name, summary in [
+                ("before", lambda: legacy_date_summary(start_date, end_date)),
+                ("after", lambda: get_incident_date_summary(start_date, end_date, False, False, False)),
+            ]:
+                started = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    summary()
+                timings[name] = 1000 * (time.perf_counter() - started) / options["repeat"]
+
+            self.stdout.write("%4d days: before %.1fms, after %.1fms" % (days, timings["before"], timings["after"]))
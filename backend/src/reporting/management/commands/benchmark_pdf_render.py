@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from ... import pdf
+from ...functions import apply_style, decode_column_names, render_report_html
+
+
+def get_sample_report(columns):
+    """ A detailed report the size of the A3 landscape subcategory report """
+    rows = ["District %d" % i for i in range(26)] + ["(Total No. of Incidents)"]
+    names = ["Subcategory %d" % i for i in range(columns)]
+    table = pd.DataFrame(np.random.randint(0, 100, size=(len(rows), columns)), columns=names)
+    table.insert(0, "District", rows)
+    table["Total"] = table[names].sum(axis=1)
+
+    html = decode_column_names(render_report_html([("Category: %d" % i, table) for i in range(3)]))
+    return apply_style(html, "from 2020-01-01 to 2020-01-31 by District and Subcategory", "", "A3 landscape",
+                       table["Total"].sum())
+
+
+class Command(BaseCommand):
+    help = "Renders sample reports inline and in the pdf render pool and reports PDFs/min per core"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reports", type=int, default=40)
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+        parser.add_argument("--columns", type=int, default=30)
+
+    def handle(self, *args, **options):
+        html = get_sample_report(options["columns"])
+
+        started = time.perf_counter()
+        for _ in range(options["reports"]):
+            pdf.render_pdf_bytes(html)
+        self.report("inline", options["reports"], time.perf_counter() - started, 1)
+
+        for workers in options["workers"]:
+            with override_settings(PDF_RENDER_WORKERS=workers):
+                pool = pdf.get_pdf_pool()
+                # font loading and process start up are not counted
+                list(pool.map(pdf.render_pdf_bytes, [html] * workers))
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as requests:
+                    list(requests.map(pdf.render_pdf, [html] * options["reports"]))
+                self.report("pool", options["reports"], time.perf_counter() - started, workers)
+
+                pool.shutdown()
+                pdf._pool = None
+
+    def report(self, name, reports, elapsed, cores):
+        per_minute = 60 * reports / elapsed
+        self.stdout.write("%s, %d core(s): %d pdfs in %.2fs, %.1f pdfs/min, %.1f pdfs/min per core" % (
+            name, cores, reports, elapsed, per_minute, per_minute / cores))
@@ -0,0 +1,46 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...services import process_report_job
+
+
+class Command(BaseCommand):
+    help = "Renders queued pdf reports with a fixed pool of workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="seconds to wait when no report is queued")
+        parser.add_argument("--once", action="store_true",
+                            help="render the queued reports and exit")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def work(_):
+            try:
+                while not stop.is_set():
+                    if not process_report_job():
+                        if options["once"]:
+                            return
+                        stop.wait(options["poll_interval"])
+            finally:
+                connection.close()
+
+        executor = ThreadPoolExecutor(max_workers=options["workers"])
+        futures = [executor.submit(work, i) for i in range(options["workers"])]
+
+        try:
+            while not all(future.done() for future in futures):
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            stop.set()
+        finally:
+            executor.shutdown(wait=True)
+
+        for future in futures:
+            future.result()
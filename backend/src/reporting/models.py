@@ -1,4 +1,11 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+import enum
+import uuid
+
+from ..common.models import Category
 
 # Create your models here.
 
@@ -15,4 +22,52 @@ class StatusSegment(models.Model):
     name = models.CharField(max_length=30)
 
     class Meta:
-        ordering = ("id",)
\ No newline at end of file
+        ordering = ("id",)
+
+class ReportJobStatus(enum.Enum):
+    PENDING = "Pending"
+    RUNNING = "Running"
+    DONE = "Done"
+    FAILED = "Failed"
+
+    def __str__(self):
+        return self.name
+
+
+class ReportJob(models.Model):
+    """ A summary report rendered to pdf by the report workers """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    # hash of the report parameters, jobs with the same key render the same pdf
+    key = models.CharField(max_length=64, db_index=True)
+
+    report = models.CharField(max_length=100)
+    start_date = models.CharField(max_length=30)
+    end_date = models.CharField(max_length=30)
+    detailed_report = models.BooleanField(default=False)
+    complain = models.BooleanField(default=False)
+    inquiry = models.BooleanField(default=False)
+
+    status = models.CharField(max_length=10, choices=[(tag.name, tag.value) for tag in ReportJobStatus],
+                              default=ReportJobStatus.PENDING.name)
+    title = models.CharField(max_length=500, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    # a running job whose claim expired is picked up again by another worker
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    requested_by = models.ForeignKey(User, on_delete=models.DO_NOTHING, null=True, blank=True)
+
+    created_date = models.DateTimeField(auto_now_add=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("created_date",)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    from .services import invalidate_category_tree
+
+    invalidate_category_tree()
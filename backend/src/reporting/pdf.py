@@ -0,0 +1,90 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# font family => file in settings.PDF_FONT_ROOT, usable in report css as font-family
+PDF_FONTS = {
+    "NotoSans": "NotoSans.ttf",
+    "Sinhala": "font.ttf",
+    "Tamil": "tamil.ttf",
+}
+
+# render time of the largest reports (A3 landscape subcategory) is well below this
+PDF_RENDER_TIMEOUT = 5 * 60
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_pdf_worker(font_root):
+    """ Runs once in every render process: registers the report fonts with reportlab and
+        makes them known to xhtml2pdf, so they are not parsed again for every pdf
+    """
+    import xhtml2pdf.default
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    for family, file_name in PDF_FONTS.items():
+        path = os.path.join(font_root, file_name)
+        if not os.path.exists(path):
+            logger.warning("pdf font %s not found at %s", family, path)
+            continue
+        pdfmetrics.registerFont(TTFont(family, path))
+        xhtml2pdf.default.DEFAULT_FONT[family.lower()] = family
+
+
+def render_pdf_bytes(html) -> bytes:
+    """ Renders html to a pdf in the calling process """
+    from xhtml2pdf import pisa
+
+    output = io.BytesIO()
+    result = pisa.CreatePDF(html, dest=output)
+    if result.err:
+        logger.warning("pdf rendered with %d errors", result.err)
+    return output.getvalue()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """ The render processes of this process, started on first use """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawned rather than forked, the web and worker processes hold threads and db connections
+            _pool = ProcessPoolExecutor(max_workers=settings.PDF_RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_pdf_worker, initargs=(settings.PDF_FONT_ROOT,))
+        return _pool
+
+
+def reset_pdf_pool(pool):
+    """ Drops a broken pool, the next render starts a new one. Other threads may have
+        replaced the pool already, that one is kept. The broken pool is not shut down,
+        its workers are gone and its management thread already cleaned up after them.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def render_pdf(html) -> bytes:
+    """ Renders html to a pdf in the render pool, so the rendering does not hold the GIL of
+        the calling process and reports are rendered in parallel across cores
+    """
+    pool = get_pdf_pool()
+    try:
+        return pool.submit(render_pdf_bytes, html).result(timeout=PDF_RENDER_TIMEOUT)
+    except BrokenProcessPool:
+        # a render process died, e.g. killed for its memory, which breaks the whole pool
+        logger.warning("pdf render pool is broken, retrying in a new pool")
+        reset_pdf_pool(pool)
+
+    return get_pdf_pool().submit(render_pdf_bytes, html).result(timeout=PDF_RENDER_TIMEOUT)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .exceptions import PdfServiceException
+
+# bytes read from the pdf-service per chunk of a download
+PDF_SERVICE_CHUNK_SIZE = 64 * 1024
+
+# the cache directory is scanned for pdfs to evict at most this often, in seconds
+PDF_SERVICE_EVICT_INTERVAL = 60
+
+
+class PdfServiceClient:
+    """ Generates pdfs with the pdf-service (https://github.com/ECLK/pdf-service) over a pooled
+        keep-alive session. Pdfs are cached on disk by the hash of their json payload, so the
+        same slip or report is only generated once while its data does not change. Cached pdfs
+        not used for max_age seconds are evicted, as are the least recently used ones while the
+        cache is larger than max_size bytes.
+    """
+
+    def __init__(self, url, cache_root, connections=4, timeout=(5, 120), max_age=None, max_size=None):
+        self.url = url
+        self.cache_root = cache_root
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_size = max_size
+        self.evicted_at = None
+        self.evict_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_cache_path(self, payload) -> str:
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        return os.path.join(self.cache_root, "%s.pdf" % key)
+
+    def open_pdf(self, payload):
+        """ The pdf generated for the payload, as an open file when it is cached, otherwise as an
+            iterator over its chunks, streamed from the pdf-service while they are cached
+        """
+        path = self.get_cache_path(payload)
+        try:
+            pdf = open(path, "rb")
+        except FileNotFoundError:
+            return self.download_pdf(payload)
+
+        # the modification time is the last use of the pdf, see evict
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return pdf
+
+    def get_pdf(self, payload) -> str:
+        """ Returns the path of the pdf generated for the payload """
+        path = self.get_cache_path(payload)
+        if not os.path.exists(path):
+            for _ in self.download_pdf(payload):
+                pass
+
+        return path
+
+    def download_pdf(self, payload):
+        """ Generates the pdf of the payload and starts its download. Failures of the pdf-service
+            are raised here, before anything is read, as a PdfServiceException.
+        """
+        try:
+            response = self.session.post(self.url, data=json.dumps(payload, default=str),
+                                         headers={'content-type': 'application/json'}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise PdfServiceException(502, str(e))
+        if response.status_code != 200:
+            raise PdfServiceException(response.status_code, response.text)
+
+        try:
+            url = response.json()["url"]
+        except (ValueError, KeyError, TypeError):
+            raise PdfServiceException(502, "pdf-service returned no pdf url: %s" % response.text)
+
+        try:
+            download = self.session.get(url, stream=True, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise PdfServiceException(502, str(e))
+        if download.status_code != 200:
+            download.close()
+            raise PdfServiceException(download.status_code, download.text)
+
+        return self.write_through(download, self.get_cache_path(payload))
+
+    def write_through(self, download, path):
+        """ Yields the chunks of a download while writing them to the cache. The pdf is written
+            next to the cached file and renamed once complete, so a half downloaded pdf is never
+            served, also not when the client goes away in the middle of the download.
+        """
+        os.makedirs(self.cache_root, exist_ok=True)
+        temp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        try:
+            with download, open(temp_path, "wb") as output:
+                for chunk in download.iter_content(PDF_SERVICE_CHUNK_SIZE):
+                    output.write(chunk)
+                    yield chunk
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self.evict()
+
+    def evict(self, force=False):
+        """ Removes the cached pdfs over max_age and max_size, at most once per
+            PDF_SERVICE_EVICT_INTERVAL unless forced
+        """
+        if self.max_age is None and self.max_size is None:
+            return
+
+        now = time.time()
+        with self.evict_lock:
+            if not force and self.evicted_at is not None and now - self.evicted_at < PDF_SERVICE_EVICT_INTERVAL:
+                return
+            self.evicted_at = now
+
+        files = []
+        with os.scandir(self.cache_root) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # downloads in progress are only removed when left behind by a killed process
+                    if self.max_age is not None and now - stat.st_mtime > self.max_age:
+                        self.remove(entry.path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # least recently used first
+        files.sort()
+        size = sum(file_size for _, file_size, _ in files)
+        for modified_at, file_size, path in files:
+            expired = self.max_age is not None and now - modified_at > self.max_age
+            oversized = self.max_size is not None and size > self.max_size
+            if not expired and not oversized:
+                break
+            self.remove(path)
+            size -= file_size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # evicted by another process
+            pass
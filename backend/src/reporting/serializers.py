@@ -0,0 +1,26 @@
+from rest_framework import serializers
+from .models import ReportJob
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    startDate = serializers.CharField(source="start_date")
+    endDate = serializers.CharField(source="end_date")
+    detailedReport = serializers.BooleanField(source="detailed_report")
+    createdDate = serializers.DateTimeField(source="created_date")
+    finishedDate = serializers.DateTimeField(source="finished_date")
+
+    class Meta:
+        model = ReportJob
+        fields = (
+            "id",
+            "report",
+            "startDate",
+            "endDate",
+            "detailedReport",
+            "complain",
+            "inquiry",
+            "status",
+            "title",
+            "error",
+            "createdDate",
+            "finishedDate"
+        )
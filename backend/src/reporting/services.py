@@ -1,6 +1,15 @@
 """Reports"""
 
-from django.db import connection
+from django.db import connection, transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
 import pandas as pd
 import numpy as np
 from datetime import date, timedelta, datetime, time
@@ -8,15 +17,22 @@ from django.utils.timezone import get_current_timezone
 from django.utils.dateparse import parse_datetime
 
 from ..common.models import Category, Channel, District
+from ..db_router import reporting_reads, get_reporting_connection
 from ..incidents.models import Incident, IncidentType, CloseWorkflow, StatusType
-from django.contrib.auth.models import User
 from ..incidents.services import get_incident_by_id
-from .functions import get_detailed_report, get_general_report, encode_column_names, get_subcategory_report, \
-    incident_type_query, incident_list_query, date_list_query, encode_value, get_subcategory_categorized_report
+from ..notifications.services import add_notification
+from ..notifications.models import NotificationType
+from .models import ReportJob, ReportJobStatus, SeveritySegment, StatusSegment
+from .pdf import render_pdf
+from .pdf_service import PdfServiceClient
+from .functions import incident_list_query, fill_date_gaps, parse_report_date, apply_style, decode_column_names, \
+    incident_type_title, get_incident_counts, get_total_incident_count, get_general_table, get_segment_table, \
+    pivot_district_counts, get_detailed_table, render_report_html, count_conditions
 from ..common.data.Institutions import institutions
 # from django.conf import settings
-from django.db.models import Count
-import collections, functools, operator
+from django.db.models import Count, Max, Q
+
+logger = logging.getLogger(__name__)
 
 
 def get_daily_incidents():
@@ -46,47 +62,18 @@ def parse_date_timezone(datetimeValue):
     return datetimeValue
 
 
-def map_category(cat_voilence, cat_law, cat_other, total_list):
-    totals = {"disputes": 0, "violationOfLaws": 0, "others": 0, "amount": 0}
-
-    for total in total_list:
-        key = total["category"]
-        val = total["category__count"]
-
-        if key == cat_voilence:
-            totals["disputes"] = val
-
-        if key == cat_law:
-            totals["violationOfLaws"] = val
-
-        if key == cat_other:
-            totals["others"] = val
-
-        totals["amount"] += val
-
-    return totals
-
-
-def map_severity(total_list):
-    totals = {"minor": 0, "general": 0, "major": 0, "total": 0}
-
-    for total in total_list:
-        key = total["severity"]
-        val = total["severity__count"]
+def get_top_category_conditions():
+    """ Conditions matching the incidents of each top category of the daily reports """
+    categories = dict((top_category, []) for top_category in ["Violence", "Violation of election law", "Other"])
+    for category_id, top_category in Category.objects.filter(top_category__in=list(categories)) \
+            .values_list("id", "top_category"):
+        categories[top_category].append(str(category_id))
 
-        # severity = 0 is unset
-        if key >= 0 and key <= 3:
-            totals["minor"] += val
-
-        elif key > 3 and key <= 7:
-            totals["general"] += val
-
-        elif key > 7:
-            totals["major"] += val
-
-        totals["total"] += val
-
-    return totals
+    return {
+        "disputes": Q(category__in=categories["Violence"]),
+        "violationOfLaws": Q(category__in=categories["Violation of election law"]),
+        "others": Q(category__in=categories["Other"]),
+    }
 
 
 def get_daily_summary_data():
@@ -96,70 +83,38 @@ def get_daily_summary_data():
     file_dict["template"] = "/incidents/complaints/daily_summary_report.js"
     file_dict["date"] = date.today().strftime("%Y/%m/%d")
 
-    # get incident list
-    incidents = get_daily_incidents()
+    # today and the past 24 hours
+    current_date = datetime.now(tz=get_current_timezone())
+    start_date = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    periods = {
+        "complaintsSummary": Q(created_date__range=(start_date, start_date + timedelta(1))),
+        "complaintsPast24hours": Q(created_date__gte=current_date - timedelta(hours=24)),
+    }
 
-    # preload categories
-    cat_voilence = Category.objects.all().filter(top_category='Violence')
-    cat_law = Category.objects.all().filter(
-        top_category='Violation of election law')
-    cat_other = Category.objects.all().filter(top_category='Other')
-
-    # find eclk complaints
-    eclk_users = User.objects.all().filter(profile__organization__code="pslk")
-    eclk_hq_users = eclk_users.filter(profile__division__is_hq=True)
-    eclk_district_users = eclk_users.filter(profile__division__is_hq=False)
-
-    # filter incidents by created
-    eclk_incidents = incidents.filter(created_by__in=eclk_users)
-    eclk_hq_incidents = incidents.filter(created_by__in=eclk_hq_users)
-    eclk_district_incidents = incidents.filter(
-        created_by__in=eclk_district_users)
-
-    # for total summary
-    file_dict["complaintsSummary"] = {
-        "national":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_hq_incidents.values('category').annotate(
-                Count("category")).order_by()),
-        "district":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_district_incidents.values('category').annotate(
-                Count("category")).order_by()),
-        "totals":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_incidents.values('category').annotate(
-                Count("category")).order_by())
+    # eclk complaints, by the hq and by the district offices
+    scopes = {
+        "national": Q(created_by__profile__division__is_hq=True),
+        "district": Q(created_by__profile__division__is_hq=False),
+        "totals": Q(),
     }
+    incidents = Incident.objects.filter(created_by__profile__organization__code="pslk",
+                                        created_date__gte=min(start_date, current_date - timedelta(hours=24)))
 
-    # past 24 hours
-    eclk_incidents = eclk_incidents.filter(created_date__range=(start_datetime,
-                                                                end_datetime))
-    eclk_hq_incidents = eclk_hq_incidents.filter(
-        created_date__range=(start_datetime, end_datetime))
-    eclk_district_incidents = eclk_district_incidents.filter(
-        created_date__range=(start_datetime, end_datetime))
+    categories = get_top_category_conditions()
+    categories["amount"] = Q()
 
-    file_dict["complaintsPast24hours"] = {
-        "national":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_hq_incidents.values('category').annotate(
-                Count("category")).order_by()),
-        "district":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_district_incidents.values('category').annotate(
-                Count("category")).order_by()),
-        "totals":
-        map_category(
-            cat_voilence, cat_law, cat_other,
-            eclk_incidents.values('category').annotate(
-                Count("category")).order_by())
-    }
+    conditions = {}
+    for period, period_condition in periods.items():
+        for scope, scope_condition in scopes.items():
+            for key, category_condition in categories.items():
+                conditions["%s_%s_%s" % (period, scope, key)] = period_condition & scope_condition & category_condition
+
+    counts = count_conditions(incidents, conditions).iloc[0]
+    for period in periods:
+        file_dict[period] = dict(
+            (scope, dict((key, int(counts["%s_%s_%s" % (period, scope, key)])) for key in categories))
+            for scope in scopes
+        )
 
     return file_dict
 
@@ -172,12 +127,6 @@ def get_daily_district_data():
         "template"] = "/incidents/complaints/daily_summary_report_districtwise.js"
     file_dict["delectionDateate"] = date.today().strftime("%Y/%m/%d")
 
-    # preload categories
-    cat_voilence = str(Category.objects.get(top_category='Violence').id)
-    cat_law = str(
-        Category.objects.get(top_category='Violation of election law').id)
-    cat_other = str(Category.objects.get(top_category='Other').id)
-
     # for time / date ranges
     start_datetime = (date.today() -
                       timedelta(days=100)).strftime("%Y-%m-%d 16:00:00")
@@ -187,46 +136,26 @@ def get_daily_district_data():
         incidentType=IncidentType.COMPLAINT.name,
         created_date__range=(start_datetime, end_datetime))
 
-    file_dict["complaintByDistrict"] = []
-
-    districts = District.objects.all()
-    for district in districts:
-        district_incidents = incidents.filter(district=district.code)
-
-        category_counts = map_category(
-            cat_voilence, cat_law, cat_other,
-            district_incidents.values('category').annotate(
-                Count("category")).order_by())
-        severity_counts = map_severity(
-            district_incidents.values('severity').annotate(
-                Count("severity")).order_by())
-
-        file_dict["complaintByDistrict"].append({
-            "violence":
-            category_counts["disputes"],
-            "breachOfElectionLaws":
-            category_counts["violationOfLaws"],
-            "other":
-            category_counts["others"],
-            "minor":
-            severity_counts["minor"],
-            "general":
-            severity_counts["general"],
-            "major":
-            severity_counts["major"],
-            "total":
-            severity_counts["total"]
-        })
+    categories = get_top_category_conditions()
+    conditions = {
+        "violence": categories["disputes"],
+        "breachOfElectionLaws": categories["violationOfLaws"],
+        "other": categories["others"],
+        # an unset severity counts as minor
+        "minor": Q(severity__isnull=True) | Q(severity__lte=3),
+        "general": Q(severity__gt=3, severity__lte=7),
+        "major": Q(severity__gt=7),
+        "total": Q(),
+    }
 
-    file_dict["complaintTotalsByType"] = dict(
-        functools.reduce(
-            operator.add,
-            map(collections.Counter, file_dict["complaintByDistrict"])))
+    # all districts and dimensions in one query, districts without incidents are 0
+    district_codes = list(District.objects.values_list("code", flat=True))
+    counts = count_conditions(incidents, conditions, group_by="district") \
+        .reindex(index=district_codes, fill_value=0)
+    values = counts.values.astype(int)
 
-    # just fixing the case of not having a specific total
-    for key in file_dict["complaintByDistrict"][0]:
-        if key not in file_dict["complaintTotalsByType"]:
-            file_dict["complaintTotalsByType"][key] = 0
+    file_dict["complaintByDistrict"] = [dict(zip(conditions, row)) for row in values.tolist()]
+    file_dict["complaintTotalsByType"] = dict(zip(conditions, values.sum(axis=0).tolist()))
 
     return file_dict
 
@@ -249,51 +178,56 @@ def get_slip_data(incident_id):
     return template_dict
 
 
+# categories of the pdf payloads grouped by top category, see get_category_tree
+CATEGORY_TREE_CACHE_KEY = "reporting:category-tree:%d:%d"
+CATEGORY_TREE_CACHE_TIMEOUT = 60 * 60
+
+
+def get_category_tree_cache_key():
+    """ Cache key of the current categories, a category added or removed in any process changes it """
+    version = Category.objects.aggregate(count=Count("id"), last=Max("id"))
+    return CATEGORY_TREE_CACHE_KEY % (version["count"], version["last"] or 0)
+
+
+def get_category_tree():
+    """ Categories grouped by top category, as (top category, sinhala name, tamil name,
+        [(category id, sinhala subcategory name)]) in the order of the category ids
+    """
+    key = get_category_tree_cache_key()
+    tree = cache.get(key)
+    if tree is None:
+        top_categories = collections.OrderedDict()
+        for category in Category.objects.order_by("id"):
+            if category.top_category not in top_categories:
+                top_categories[category.top_category] = (
+                    category.top_category, category.sn_top_category, category.tm_top_category, [])
+            top_categories[category.top_category][3].append((str(category.id), category.sn_sub_category))
+
+        tree = list(top_categories.values())
+        cache.set(key, tree, CATEGORY_TREE_CACHE_TIMEOUT)
+
+    return tree
+
+
+def invalidate_category_tree():
+    """ Drops the tree of edited categories, edits do not change the cache key """
+    cache.delete(get_category_tree_cache_key())
+
+
 def get_category_dict(incidents):
     """returns the category dictionary with counts on given incidents"""
 
     # get incident count per category
-    category_count = {}
-    for incident in incidents:
-        if incident.category in category_count:
-            category_count[incident.category] += 1
-        else:
-            category_count[incident.category] = 1
-
-    # collecting all category data
+    category_count = dict(incidents.order_by().values_list("category").annotate(total=Count("id")))
+
     category_dict = []
-    categories = Category.objects.all()
-
-    temp_category_dict = {}
-    top_categories = []
-    for category in categories:
-        if category.top_category in temp_category_dict:
-            sub_cat = {}
-            sub_cat["name"] = category.sn_sub_category
-            if str(category.id) in category_count:
-                sub_cat["count"] = category_count[str(category.id)]
-            else:
-                sub_cat["count"] = 0
-            temp_category_dict[category.top_category]["subCategories"].append(
-                sub_cat)
-        else:
-            top_cat = {}
-            top_cat["categoryNameSinhala"] = category.sn_top_category
-            top_cat["categoryNameTamil"] = category.tm_top_category
-            top_categories.append(category.top_category)
-
-            sub_cat = {}
-            sub_cat["name"] = category.sn_sub_category
-            if str(category.id) in category_count:
-                sub_cat["count"] = category_count[str(category.id)]
-            else:
-                sub_cat["count"] = 0
-            top_cat["subCategories"] = []
-            top_cat["subCategories"].append(sub_cat)
-            temp_category_dict[category.top_category] = top_cat
-
-    for category in top_categories:
-        category_dict.append(temp_category_dict[category])
+    for top_category, sn_top_category, tm_top_category, sub_categories in get_category_tree():
+        category_dict.append({
+            "categoryNameSinhala": sn_top_category,
+            "categoryNameTamil": tm_top_category,
+            "subCategories": [{"name": name, "count": category_count.get(category_id, 0)}
+                              for category_id, name in sub_categories]
+        })
 
     return category_dict
 
@@ -386,222 +320,117 @@ def get_total_requests_by_category_for_a_selected_time(start_time, end_time):
     return file_dict
 
 
+def get_category_names():
+    """ Top and sub category of each category id, as stored on incidents """
+    return dict((str(category_id), (top_category, sub_category)) for category_id, top_category, sub_category in
+                Category.objects.values_list("id", "top_category", "sub_category"))
+
+
 def get_category_summary(start_date, end_date, detailed_report, complain,
                          inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
+    categories = get_category_names()
+    top_categories = list(dict.fromkeys(top_category for top_category, _ in categories.values()))
     if detailed_report:
-        columns = list(
-            set(Category.objects.all().values_list("top_category", flat=True)))
-        columns.insert(0, "Unassigned")
-        sql2 = ", ".join(
-            map(
-                lambda c:
-                "(CASE WHEN ifnull(%s,'Unassigned') LIKE '%s' THEN 1 ELSE 0 END) AS '%s'"
-                % ('top_category', c, encode_value(c)), columns))
-        sql1 = """
-                        SELECT district,
-                                   %s
-                                  ,
-                                  1       AS Total
-                           FROM   incidents_incident
-                           LEFT JOIN common_category ON category=common_category.id
-                           %s
-                        """ % (sql2, incident_list)
-        columns = encode_column_names(columns)
-        return get_detailed_report(sql1, columns)
-    return get_general_report("top_category", "Category", "common_category",
-                              "category", "id", start_date, end_date, sql3)
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "category"])
+        values = counts["category"].map(lambda c: categories[c][0] if c in categories else None)
+        return [(None, get_detailed_table(pivot_district_counts(values, counts), ["Unassigned"] + top_categories))]
+
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["category"])
+    values = counts["category"].map(lambda c: categories[c][0] if c in categories else None)
+    return [(None, get_general_table(values, counts, "Category", top_categories))]
 
 
 def get_subcategory_summary(start_date, end_date, detailed_report, complain,
                             inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
+    categories = get_category_names()
     if detailed_report:
-        tables = ""
-        for category in list(Category.objects.order_by().values_list(
-                "top_category", flat=True).distinct()):
-            tables += "<br><br><br><br>" + (get_subcategory_categorized_report(
-                incident_list, category))
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "category"])
+        # pivoted once by category id, each top category is a slice of the same pivot
+        pivot = pivot_district_counts(counts["category"], counts)
+        tables = []
+        for category in dict.fromkeys(top_category for top_category, _ in categories.values()):
+            ids = [c for c in categories if categories[c][0] == category]
+            sub_categories = [categories[c][1] for c in ids]
+            category_pivot = pivot.reindex(columns=ids, fill_value=0).T.groupby(sub_categories, sort=False).sum().T
+            columns = ["Unassigned"] + list(dict.fromkeys(sub_categories))
+            tables.append(("Category: %s" % category, get_detailed_table(category_pivot, columns)))
         return tables
-    return get_subcategory_report("sub_category", "Subcategory",
-                                  "common_category", "category", "id",
-                                  start_date, end_date, sql3)
+
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["category"])
+    values = counts["category"].map(lambda c: "%s -> %s" % categories[c] if c in categories else None)
+    return [(None, get_general_table(values, counts, "Subcategory",
+                                     ["%s -> %s" % category for category in categories.values()]))]
 
 
 def get_mode_summary(start_date, end_date, detailed_report, complain, inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
+    channels = dict((str(channel_id), name) for channel_id, name in Channel.objects.values_list("id", "name"))
+    names = list(dict.fromkeys(channels.values()))
     if detailed_report:
-        columns = list(
-            set(Channel.objects.all().values_list("name", flat=True)))
-        columns.insert(0, "Unassigned")
-        sql2 = ", ".join(
-            map(
-                lambda c:
-                "(CASE WHEN ifnull(%s,'Unassigned') LIKE '%s' THEN 1 ELSE 0 END) AS '%s'"
-                % ('name', c, encode_value(c)), columns))
-        sql1 = """
-                SELECT district,
-                           %s
-                          ,
-                          1       AS Total
-                   FROM   incidents_incident
-                   LEFT JOIN common_channel ON infoChannel=common_channel.id
-                   %s
-                """ % (sql2, incident_list)
-        columns = encode_column_names(columns)
-        return get_detailed_report(sql1, columns)
-    return get_general_report("name", "Mode", "common_channel", "infoChannel",
-                              "id", start_date, end_date, sql3)
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "channel"])
+        pivot = pivot_district_counts(counts["channel"].map(channels), counts)
+        return [(None, get_detailed_table(pivot, ["Unassigned"] + names))]
+
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["channel"])
+    return [(None, get_general_table(counts["channel"].map(channels), counts, "Mode", names))]
 
 
 def get_incident_date_summary(start_date, end_date, detailed_report, complain,
                               inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
+    incident_list, params = incident_list_query(start_date, end_date, complain, inquiry)
     sql = """
-            SELECT incident_date as 'Incident Date',
-       Total
-FROM   (SELECT incident_date,
-               Sum(Total) AS Total
-        FROM   (SELECT Date_format(occured_date + INTERVAL 8 HOUR, '%s')
-                       AS
-                       incident_date
-                               ,
-                       '1'
-                               AS Total
-                FROM   incidents_incident
-                %s
-                UNION ALL
-                SELECT selected_date,
-                       '0'
-                FROM   (%s) AS dateranges) AS result
-        GROUP  BY result.incident_date
-        ORDER  BY incident_date) AS result2
-UNION
-SELECT '(Total No. of Incidents)',
-       Count(id)
-FROM   incidents_incident
-%s
-            """ % ("%Y-%m-%d", incident_list,
-                   date_list_query(start_date, end_date), incident_list)
-    dataframe = pd.read_sql_query(sql, connection)
+            SELECT Date_format(occured_date + INTERVAL 8 HOUR, '%%%%Y-%%%%m-%%%%d') AS incident_date,
+                   Count(id)                                                AS Total
+            FROM   incidents_incident
+            %s
+            GROUP  BY incident_date
+            """ % incident_list
+    dataframe = pd.read_sql_query(sql, get_reporting_connection(), params=params)
+
+    # every day of the requested range is listed, including days without incidents
+    dates = fill_date_gaps(dataframe.set_index("incident_date")["Total"],
+                           parse_report_date(start_date).date(), parse_report_date(end_date).date())
+    dates["(Total No. of Incidents)"] = dataframe["Total"].sum()
+
+    dataframe = pd.DataFrame({"Incident Date": dates.index, "Total": dates.values.astype(int)})
     dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
+    return [(None, dataframe)]
 
 
 def get_district_summary(start_date, end_date, detailed_report, complain,
                          inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    return get_general_report("name", "District", "common_district",
-                              "district", "code", start_date, end_date, sql3)
+    districts = dict(District.objects.values_list("code", "name"))
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district"])
+    return [(None, get_general_table(counts["district"].map(districts), counts, "District",
+                                     list(districts.values())))]
 
 
 def get_severity_summary(start_date, end_date, detailed_report, complain,
                          inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
     if detailed_report:
-        sql1 = """
-        SELECT district,
-                  ( CASE
-                      WHEN Ifnull(severity, 0) > 7 THEN
-                      1
-                      ELSE 0
-                    end ) AS High,
-                  ( CASE
-                      WHEN Ifnull(severity, 0) > 3
-                           AND Ifnull(severity, 0) < 8
-                    THEN 1
-                      ELSE 0
-                    end ) AS Medium,
-                  ( CASE
-                      WHEN Ifnull(severity, 0) < 4 THEN
-                      1
-                      ELSE 0
-                    end ) AS Low,
-                  1       AS Total
-           FROM   incidents_incident
-           %s
-        """ % incident_list
-        columns = ["High", "Medium", "Low"]
-        return get_detailed_report(sql1, columns)
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "severity"])
+        pivot = pivot_district_counts(counts["severity"], counts)
+        return [(None, get_detailed_table(pivot, ["High", "Medium", "Low"]))]
 
     # if general report
-    sql = """ # if general report
-         SELECT    Ifnull(name,'Unassigned') AS Severity,
-                   Ifnull(subtotal,0)        AS Total
-         FROM      reporting_severitysegment AS d
-         LEFT JOIN
-                   (
-                            SELECT   (
-                                     CASE
-                                              WHEN severity > 7 THEN 'High'
-                                              WHEN severity > 3 THEN 'Medium'
-                                              ELSE 'Low'
-                                     END)                                           AS currentstate,
-                                     Count(Ifnull(incidents_incident.severity,0)) AS subtotal
-                            FROM     incidents_incident
-                            %s
-                            GROUP BY currentstate) AS incidents
-         ON        currentstate = d.name
-         UNION ALL
-        SELECT '(Total No. of Incidents)',
-               Count(id)
-        FROM   incidents_incident
-        %s
-        ORDER  BY Field(Severity, 'High', 'Medium', 'Low', '(Total No. of Incidents)')
-    """ % (incident_list, incident_list)
-    dataframe = pd.read_sql_query(sql, connection)
-    dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["severity"])
+    return [(None, get_segment_table(counts["severity"], counts, "Severity",
+                                     list(SeveritySegment.objects.values_list("name", flat=True)),
+                                     ["High", "Medium", "Low"]))]
 
 
 def get_status_summary(start_date, end_date, detailed_report, complain,
                        inquiry):
-    sql3 = incident_type_query(complain, inquiry)
-    incident_list = incident_list_query(start_date, end_date, sql3)
     if detailed_report:
-        sql1 = """
-        SELECT district,(
-               CASE WHEN Ifnull(current_status, 'Unassigned') LIKE 'CLOSED' THEN 1 ELSE 0 END )AS Resolved,
-               (CASE WHEN Ifnull(current_status, 'Unassigned')  NOT LIKE 'CLOSED' THEN 1 ELSE 0 END )AS Unresolved,
-                             1 AS Total
-                      FROM   incidents_incident
-                     %s
-        """ % incident_list
-        columns = ["Resolved", "Unresolved"]
-        return get_detailed_report(sql1, columns)
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "status"])
+        values = counts["status"].map(lambda status: "Resolved" if status == "CLOSED" else "Unresolved")
+        return [(None, get_detailed_table(pivot_district_counts(values, counts), ["Resolved", "Unresolved"]))]
 
     # if general report
-    sql = """
-        SELECT name                  AS Status,
-               Ifnull(subtotal, '0') AS Total
-        FROM   reporting_statussegment AS d
-               LEFT JOIN (SELECT ( CASE
-                                     WHEN Ifnull(current_status, 'Unassigned') LIKE
-                                          'CLOSED'
-                                                                       THEN
-                                     'Resolved'
-                                     ELSE 'Unresolved'
-                                   END )                          AS currentState,
-                                 Count(Ifnull(current_status, 1)) AS subtotal
-                          FROM   incidents_incident
-                          %s
-                          GROUP  BY currentstate) AS incidents
-                      ON currentstate = d.name
-        UNION ALL
-        SELECT '(Total No. of Incidents)',
-               Count(id)
-        FROM   incidents_incident
-        %s
-        ORDER  BY Field(status, 'Resolved', 'Unresolved', '(Total No. of Incidents)')
-    """ % (incident_list, incident_list)
-    dataframe = pd.read_sql_query(sql, connection)
-    dataframe = dataframe.fillna(0)
-    return dataframe.to_html(index=False)
+    counts = get_incident_counts(start_date, end_date, complain, inquiry, ["status"])
+    values = counts["status"].map(lambda status: "Resolved" if status == "CLOSED" else "Unresolved")
+    return [(None, get_segment_table(values, counts, "Status",
+                                     list(StatusSegment.objects.values_list("name", flat=True)),
+                                     ["Resolved", "Unresolved"]))]
 
 
 def get_police_division_summary():
@@ -612,27 +441,17 @@ def get_police_division_summary():
             incident.police_division,
             COUNT(incident.police_station) AS police_station_count,
             COUNT(incident.id) AS division_total,
-            COUNT(CASE WHEN cs.current_status <> "CLOSED" THEN 1 ELSE NULL END) AS open_total,
-            COUNT(CASE WHEN cs.current_status = "CLOSED" THEN 1 ELSE NULL END) AS closed_total
-          FROM incidents_incident incident,
-          (
-            SELECT b.incident_id, b.current_status
-            FROM incidents_incidentstatus b
-            INNER JOIN (
-              SELECT i.incident_id, max(i.created_date) cdate
-              FROM incidents_incidentstatus i
-              GROUP BY i.incident_id
-            ) c
-            ON c.incident_id = b.incident_id AND c.cdate = b.created_date
-          ) AS cs
-          WHERE cs.incident_id = incident.id
+            COUNT(CASE WHEN incident.current_status <> "CLOSED" THEN 1 ELSE NULL END) AS open_total,
+            COUNT(CASE WHEN incident.current_status = "CLOSED" THEN 1 ELSE NULL END) AS closed_total
+          FROM incidents_incident incident
+          WHERE incident.current_status IS NOT NULL
           GROUP BY incident.province, incident.di_division, incident.police_division
         """
     headers = [
         "Police Stations Count", "Incidents Received", "Incidents Pending",
         "Incidents Closed", "Other", "Total Count", "Province Total"
     ]
-    dataframe = pd.read_sql_query(sql, connection)
+    dataframe = pd.read_sql_query(sql, get_reporting_connection())
     dataframe.sort_values(by=['province', 'di_division'], inplace=True)
     dataframe.set_index(['province', 'di_division', 'police_division'],
                         inplace=True)
@@ -646,3 +465,189 @@ def get_police_division_summary():
     dataframe.index.names = ["Province", "DI Division", "Police Division"]
 
     return dataframe.to_html()
+
+
+# report name => (summary function, (layout, title) of the summary, (layout, title) of the detailed report)
+SUMMARY_REPORTS = {
+    "category_wise_summary_report": (
+        get_category_summary, ("A4 portrait", "Category"), ("A4 portrait", "District and Category")),
+    "mode_wise_summary_report": (
+        get_mode_summary, ("A4 portrait", "Mode"), ("A4 landscape", "District and Mode")),
+    "district_wise_summary_report": (
+        get_district_summary, ("A4 portrait", "District"), ("A4 portrait", "District")),
+    "severity_wise_summary_report": (
+        get_severity_summary, ("A4 portrait", "Severity"), ("A4 portrait", "District and Severity")),
+    "subcategory_wise_summary_report": (
+        get_subcategory_summary, ("A4 portrait", "Subcategory"), ("A3 landscape", "District and Subcategory")),
+    "incident_date_wise_summary_report": (
+        get_incident_date_summary, ("A4 portrait", "Incident Date"), ("A4 portrait", "Incident Date")),
+    "status_wise_summary_report": (
+        get_status_summary, ("A4 portrait", "Status"), ("A4 portrait", "District and Status")),
+}
+
+
+def get_summary_report_tables(report, start_date, end_date, detailed_report, complain, inquiry):
+    """ Returns the (caption, dataframe) tables of a summary report, None for unknown reports """
+    if report not in SUMMARY_REPORTS:
+        return None
+
+    summary = SUMMARY_REPORTS[report][0]
+    return summary(start_date, end_date, detailed_report, complain, inquiry)
+
+
+def get_summary_report_html(report, start_date, end_date, detailed_report, complain, inquiry):
+    """ Returns the styled html of a summary report and its title, None for unknown reports """
+    if report not in SUMMARY_REPORTS:
+        return None
+
+    summary, summary_layout, detailed_layout = SUMMARY_REPORTS[report]
+    layout, table_title = detailed_layout if detailed_report else summary_layout
+    table_title = """from %s to %s by %s""" % (start_date, end_date, table_title)
+    incident_type_string = incident_type_title(complain, inquiry)
+
+    table_html = render_report_html(summary(start_date, end_date, detailed_report, complain, inquiry))
+
+    # Prepare report header
+    total_count = get_total_incident_count(complain, inquiry)
+
+    table_html = apply_style(
+        decode_column_names(table_html)
+            .replace(".0", "", -1)
+            .replace("(Total No. of Incidents)",
+                     """<strong>(Total No. of Incidents from %s to %s)</strong>""" % (start_date, end_date), -1)
+            .replace("(Unassigned)", "<strong>(Unassigned)</strong>", -1)
+        , table_title, incident_type_string, layout, total_count)
+
+    title = """Incidents reported within the period %s %s %s.pdf""" % (
+        table_title, incident_type_string, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    return table_html, title
+
+
+# rendered reports are kept on disk and named by the hash of their parameters
+REPORT_JOB_CLAIM_SECONDS = 10 * 60
+
+
+def get_report_key(report, start_date, end_date, detailed_report, complain, inquiry) -> str:
+    params = [report, start_date, end_date, detailed_report, complain, inquiry]
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+def get_report_path(key) -> str:
+    return os.path.join(settings.REPORT_ROOT, "%s.pdf" % key)
+
+
+def is_closed_period(end_date) -> bool:
+    """ Whether the period of a report has ended, reports of open periods can still change """
+    end = parse_report_date(end_date)
+    return end is not None and end <= timezone.now()
+
+
+def submit_report_job(user, report, start_date, end_date, detailed_report, complain, inquiry) -> ReportJob:
+    """ Queues a summary report for rendering. A rendered report of a closed period, or a
+        job for the same report that is still queued, is returned instead of a new job.
+    """
+    key = get_report_key(report, start_date, end_date, detailed_report, complain, inquiry)
+
+    jobs = ReportJob.objects.filter(key=key).order_by("-created_date")
+    queued = jobs.filter(status__in=[ReportJobStatus.PENDING.name, ReportJobStatus.RUNNING.name]).first()
+    if queued is not None:
+        return queued
+
+    if is_closed_period(end_date):
+        done = jobs.filter(status=ReportJobStatus.DONE.name).first()
+        if done is not None and os.path.exists(get_report_path(key)):
+            return done
+
+    return ReportJob.objects.create(
+        key=key,
+        report=report,
+        start_date=start_date,
+        end_date=end_date,
+        detailed_report=detailed_report,
+        complain=complain,
+        inquiry=inquiry,
+        requested_by=user
+    )
+
+
+def claim_report_job():
+    """ Claims the oldest queued report job, or one whose claim has expired """
+    now = timezone.now()
+    with transaction.atomic():
+        job = ReportJob.objects.select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked
+        ).filter(
+            Q(status=ReportJobStatus.PENDING.name) |
+            Q(status=ReportJobStatus.RUNNING.name, claimed_until__lt=now)
+        ).order_by("created_date").first()
+
+        if job is not None:
+            job.status = ReportJobStatus.RUNNING.name
+            job.claimed_until = now + timedelta(seconds=REPORT_JOB_CLAIM_SECONDS)
+            job.save(update_fields=["status", "claimed_until"])
+
+    return job
+
+
+def render_report_job(job: ReportJob):
+    with reporting_reads():
+        report = get_summary_report_html(job.report, job.start_date, job.end_date, job.detailed_report,
+                                         job.complain, job.inquiry)
+    if report is None:
+        raise ValueError("Report not found")
+
+    table_html, title = report
+    path = get_report_path(job.key)
+    os.makedirs(settings.REPORT_ROOT, exist_ok=True)
+
+    # written next to the final file and renamed, so a half written pdf is never served
+    temp_path = "%s.%s.tmp" % (path, job.id)
+    with open(temp_path, "wb") as output:
+        output.write(render_pdf(table_html))
+    os.replace(temp_path, path)
+
+    return title
+
+
+def process_report_job() -> bool:
+    """ Renders one queued report, returns False when there was nothing to do """
+    job = claim_report_job()
+    if job is None:
+        return False
+
+    try:
+        job.title = render_report_job(job)
+        job.status = ReportJobStatus.DONE.name
+    except Exception as e:
+        logger.exception("report job %s failed", job.id)
+        job.status = ReportJobStatus.FAILED.name
+        job.error = str(e)
+
+    job.finished_date = timezone.now()
+    job.save(update_fields=["title", "status", "error", "finished_date"])
+
+    # a failed job is only shown on its status, there is nothing to download
+    if job.status == ReportJobStatus.DONE.name and job.requested_by_id is not None:
+        add_notification(NotificationType.REPORT_READY, None, job.requested_by, custom_message=str(job.id))
+
+    return True
+
+
+_pdf_service_client = None
+_pdf_service_client_lock = threading.Lock()
+
+
+def get_pdf_service_client() -> PdfServiceClient:
+    global _pdf_service_client
+    with _pdf_service_client_lock:
+        if _pdf_service_client is None:
+            _pdf_service_client = PdfServiceClient(
+                settings.PDF_SERVICE_ENDPOINT,
+                settings.PDF_SERVICE_CACHE_ROOT,
+                connections=settings.PDF_SERVICE_CONNECTIONS,
+                max_age=settings.PDF_SERVICE_CACHE_MAX_AGE,
+                max_size=settings.PDF_SERVICE_CACHE_MAX_SIZE
+            )
+
+    return _pdf_service_client
@@ -1,3 +1,551 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connections
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ..common.models import Category, District
+from ..custom_auth.models import Organization, Division
+from ..incidents.models import Incident, IncidentType
+from ..incidents.services import reconcile_daily_counts
+from .. import db_router
+from ..db_router import ReportingRouter, get_reporting_db, reporting_reads
+from ..notifications.models import Notification, NotificationType
+from ..testing.fake_pdf_service import FakePdfService, PDF_CONTENT
+from .functions import get_incident_counts, get_total_incident_count, parse_report_date, fill_date_gaps, \
+    incident_list_query, render_report_html, render_report_csv, render_report_json, decode_column_names, \
+    pivot_district_counts, get_detailed_table
+from .models import ReportJob, ReportJobStatus
+from . import services
+from . import pdf
+from .pdf import render_pdf
+from .pdf_service import PdfServiceClient
+from .exceptions import PdfServiceException
+from .views import ReportingView
+from .services import submit_report_job, process_report_job, get_report_path, is_closed_period, get_daily_district_data, \
+    get_daily_summary_data, get_category_dict
+
+
+class ReportJobTestCase(TestCase):
+    def setUp(self):
+        self.report_root = tempfile.mkdtemp()
+        settings_override = override_settings(REPORT_ROOT=self.report_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.report_root)
+
+        self.user = User.objects.create(username="reporter")
+
+    def submit(self, end_date="2020-01-31 16:00:00"):
+        return submit_report_job(self.user, "category_wise_summary_report", "2020-01-01 16:00:00", end_date,
+                                 False, True, False)
+
+    def render(self, job):
+        with open(get_report_path(job.key), "wb") as output:
+            output.write(b"%PDF")
+        return "report.pdf"
+
+    def test_closed_period_is_rendered_once(self):
+        job = self.submit()
+        self.assertEqual(self.submit().id, job.id)
+
+        with mock.patch.object(services, "render_report_job", side_effect=self.render) as render:
+            self.assertTrue(process_report_job())
+            self.assertFalse(process_report_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJobStatus.DONE.name)
+        self.assertEqual(job.title, "report.pdf")
+        self.assertEqual(render.call_count, 1)
+
+        notification = Notification.objects.get(send_to=self.user)
+        self.assertEqual(notification.notification_type, NotificationType.REPORT_READY.name)
+        self.assertEqual(notification.custom_messsage, str(job.id))
+
+        # served from disk without a new job
+        self.assertEqual(self.submit().id, job.id)
+
+        os.remove(get_report_path(job.key))
+        self.assertNotEqual(self.submit().id, job.id)
+
+    def test_open_period_is_rendered_again(self):
+        job = self.submit(end_date="2999-01-01 16:00:00")
+        with mock.patch.object(services, "render_report_job", side_effect=self.render):
+            process_report_job()
+
+        self.assertNotEqual(self.submit(end_date="2999-01-01 16:00:00").id, job.id)
+
+    def test_closed_period_accepts_offsets(self):
+        self.assertTrue(is_closed_period("2020-01-31 16:00:00"))
+        self.assertTrue(is_closed_period("2020-01-31T16:00:00+05:30"))
+        self.assertTrue(is_closed_period("2020-01-31T10:30:00Z"))
+        self.assertFalse(is_closed_period("2999-01-01T00:00:00Z"))
+        self.assertFalse(is_closed_period("not a date"))
+
+    def test_failed_render_is_recorded(self):
+        job = self.submit()
+        with mock.patch.object(services, "render_report_job", side_effect=ValueError("Report not found")), \
+                self.assertLogs(services.logger, "ERROR") as logs:
+            process_report_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJobStatus.FAILED.name)
+        self.assertEqual(job.error, "Report not found")
+        self.assertEqual(ReportJob.objects.count(), 1)
+        # the traceback is logged and the requester is not told the report is ready
+        self.assertIn("Traceback", logs.output[0])
+        self.assertFalse(Notification.objects.filter(send_to=self.user).exists())
+
+
+class ReportingViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reporter")
+
+    def get(self, **params):
+        request = APIRequestFactory().get("/reports/", dict({"report": "category_wise_summary_report",
+                                                             "complain": "true", "output": "json"}, **params))
+        force_authenticate(request, user=self.user)
+        return ReportingView.as_view()(request)
+
+    def test_dates_without_a_time_start_at_midnight(self):
+        self.assertEqual(parse_report_date("2020-01-01"), parse_report_date("2020-01-01 00:00:00"))
+
+        response = self.get(start_date="2020-01-01", end_date="2020-01-31")
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_dates_are_rejected(self):
+        self.assertIsNone(parse_report_date("2020-13-01"))
+
+        self.assertEqual(self.get(start_date="garbage", end_date="2020-01-31").status_code, 400)
+        self.assertEqual(self.get(**{"start_date": "2020-01-01", "end_date": "2020-13-01", "async": "true"}).status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+
+class IncidentCountsTestCase(TestCase):
+    def create(self, created_date, **fields):
+        incident = Incident.objects.create(title="t", description="d", refId=str(created_date), **fields)
+        Incident.objects.filter(id=incident.id).update(created_date=parse_report_date(created_date))
+
+    def setUp(self):
+        self.create("2020-01-01 08:00:00", district="CMB", severity=9)
+        self.create("2020-01-01 20:00:00", district="CMB", severity=5)
+        self.create("2020-01-02 12:00:00", district="GAL")
+        self.create("2020-01-03 00:00:00", district="GAL", incidentType=IncidentType.INQUIRY.name)
+        self.create("2020-01-04 06:00:00", district="CMB")
+        self.create("2020-01-05 16:00:00", district="GAL")
+        reconcile_daily_counts()
+
+    def get_counts(self, start_date, end_date, complain=False, inquiry=False):
+        counts = get_incident_counts(start_date, end_date, complain, inquiry, ["district", "severity"])
+        return sorted(tuple(row) for row in counts.itertuples(index=False))
+
+    def test_partial_days_are_counted_from_incidents(self):
+        self.assertEqual(self.get_counts("2020-01-01 16:00:00", "2020-01-05 16:00:00"), [
+            ("CMB", "Low", 1), ("CMB", "Medium", 1), ("GAL", "Low", 3)
+        ])
+        self.assertEqual(self.get_counts("2020-01-01 00:00:00", "2020-01-03 00:00:00", complain=True), [
+            ("CMB", "High", 1), ("CMB", "Medium", 1), ("GAL", "Low", 1)
+        ])
+        self.assertEqual(self.get_counts("2020-01-03 00:00:00", "2020-01-03 00:00:00", inquiry=True), [
+            ("GAL", "Low", 1)
+        ])
+
+    def test_counts_match_a_scan_of_the_incidents(self):
+        for start_date, end_date in [("2020-01-01 00:00:00", "2020-01-06 00:00:00"),
+                                     ("2020-01-01 09:30:00", "2020-01-04 06:00:00"),
+                                     ("2020-01-02 00:00:00", "2020-01-02 23:59:59")]:
+            expected = Incident.objects.filter(
+                created_date__gte=parse_report_date(start_date),
+                created_date__lte=parse_report_date(end_date)
+            ).count()
+            counts = get_incident_counts(start_date, end_date, False, False, ["district"])
+            self.assertEqual(counts["count"].sum() if len(counts) else 0, expected)
+
+        self.assertEqual(get_total_incident_count(True, False), 5)
+
+
+class FillDateGapsTestCase(SimpleTestCase):
+    def test_days_without_incidents_are_listed(self):
+        totals = pd.Series([2, 1, 4], index=["2020-01-03", None, "2019-12-30"])
+        filled = fill_date_gaps(totals, date(2020, 1, 1), date(2020, 1, 3))
+
+        self.assertEqual(list(filled.index), [None, "2019-12-30", "2020-01-01", "2020-01-02", "2020-01-03"])
+        self.assertEqual(list(filled.values), [1, 4, 0, 0, 2])
+
+
+class ReportRenderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tables = [
+            (None, pd.DataFrame({"District": ["Colombo"], "Law/Order": [2], "Total": [2]})),
+            ("Category: Violence", pd.DataFrame({"District": ["Galle"], "Total": [1]})),
+        ]
+
+    def test_query_parameters_are_not_formatted_into_the_sql(self):
+        sql, params = incident_list_query("2020-01-01 16:00:00", "2020-01-02' OR '1", True, False)
+
+        self.assertNotIn("2020", sql)
+        self.assertEqual(sql.count("%s"), len(params))
+        self.assertEqual(params, ["2020-01-01 16:00:00", "2020-01-02' OR '1", IncidentType.COMPLAINT.name])
+
+    def test_html_keeps_encoded_column_names_and_captions(self):
+        html = render_report_html(self.tables)
+
+        self.assertIn("<th>Law__Order</th>", html)
+        self.assertIn("<br><br><br><br><b>Category: Violence</b>", html)
+        self.assertIn("<th>Law/Order</th>", decode_column_names(html))
+
+    def test_csv_and_json_share_the_tables(self):
+        self.assertEqual(render_report_csv(self.tables).splitlines(), [
+            "District,Law/Order,Total", "Colombo,2,2", "", "Category: Violence", "District,Total", "Galle,1", ""
+        ])
+        self.assertEqual(render_report_json(self.tables), [
+            {"caption": None, "columns": ["District", "Law/Order", "Total"], "rows": [["Colombo", 2, 2]]},
+            {"caption": "Category: Violence", "columns": ["District", "Total"], "rows": [["Galle", 1]]},
+        ])
+
+
+class DistrictPivotTestCase(TestCase):
+    def setUp(self):
+        for code, name in [("CMB", "Colombo"), ("GAL", "Galle"), ("KAN", "Kandy")]:
+            District.objects.create(code=code, name=name)
+        self.counts = pd.DataFrame([("CMB", "a", 2), ("GAL", "b", 3), ("CMB", None, 1), ("XXX", "a", 1)],
+                                   columns=["district", "value", "count"])
+
+    def get_rows(self, pivot, columns):
+        return [tuple(row) for row in get_detailed_table(pivot, columns).itertuples(index=False)]
+
+    def test_pivot_has_margins_and_all_districts(self):
+        pivot = pivot_district_counts(self.counts["value"], self.counts)
+
+        self.assertEqual(self.get_rows(pivot, ["Unassigned", "a", "b"]), [
+            ("Colombo", 1, 2, 0, 3),
+            ("Galle", 0, 0, 3, 3),
+            ("(Unassigned)", 0, 1, 0, 1),
+            ("Kandy", 0, 0, 0, 0),
+            ("(Total No. of Incidents)", 1, 3, 3, 7),
+        ])
+
+    def test_slices_only_list_unassigned_districts_with_incidents(self):
+        pivot = pivot_district_counts(self.counts["value"], self.counts)
+
+        self.assertEqual(self.get_rows(pivot[["b"]], ["b"]), [
+            ("Galle", 3, 3),
+            ("Colombo", 0, 0),
+            ("Kandy", 0, 0),
+            ("(Total No. of Incidents)", 3, 3),
+        ])
+
+    def test_empty_counts(self):
+        counts = self.counts.iloc[:0]
+        pivot = pivot_district_counts(counts["value"], counts)
+
+        self.assertEqual(self.get_rows(pivot, ["a"]), [
+            ("Colombo", 0, 0), ("Galle", 0, 0), ("Kandy", 0, 0), ("(Total No. of Incidents)", 0, 0)
+        ])
+
+
+class PdfRenderTestCase(SimpleTestCase):
+    def test_reports_are_rendered_in_the_pool(self):
+        html = "<html><body><p style='font-family: NotoSans'>Report</p></body></html>"
+        self.assertTrue(render_pdf(html).startswith(b"%PDF"))
+
+    def test_broken_pool_is_replaced(self):
+        broken = pdf.get_pdf_pool()
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result(timeout=60)
+
+        self.assertTrue(render_pdf("<html><body><p>Report</p></body></html>").startswith(b"%PDF"))
+        self.assertIsNot(pdf.get_pdf_pool(), broken)
+
+
+class PdfServiceClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_root)
+
+    def read(self, path):
+        with open(path, "rb") as pdf:
+            return pdf.read()
+
+    def test_same_payload_is_generated_once(self):
+        with FakePdfService() as service:
+            client = PdfServiceClient(service.url, self.cache_root, connections=1)
+            first = client.get_pdf({"file": {"template": "slip.js", "id": 1}})
+            second = client.get_pdf({"file": {"id": 1, "template": "slip.js"}})
+            other = client.get_pdf({"file": {"template": "slip.js", "id": 2}})
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(self.read(first), PDF_CONTENT)
+        self.assertEqual(len(service.payloads), 2)
+        # the generate and download requests share one keep-alive connection
+        self.assertEqual(service.connections, 1)
+
+    def test_failures_are_not_cached(self):
+        with FakePdfService(status=500) as service:
+            client = PdfServiceClient(service.url, self.cache_root)
+            with self.assertRaises(PdfServiceException) as raised:
+                client.get_pdf({"file": {}})
+
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(os.listdir(self.cache_root), [])
+
+    def test_malformed_responses_are_service_errors(self):
+        with FakePdfService(body=b"<html>Bad Gateway</html>") as service:
+            client = PdfServiceClient(service.url, self.cache_root)
+            with self.assertRaises(PdfServiceException) as raised:
+                client.get_pdf({"file": {}})
+
+        self.assertEqual(raised.exception.status_code, 502)
+
+    def test_new_pdfs_are_streamed_while_cached(self):
+        payload = {"file": {"template": "slip.js", "id": 1}}
+        with FakePdfService() as service:
+            client = PdfServiceClient(service.url, self.cache_root)
+            chunks = client.open_pdf(payload)
+            self.assertFalse(os.path.exists(client.get_cache_path(payload)))
+            self.assertEqual(b"".join(chunks), PDF_CONTENT)
+
+            with client.open_pdf(payload) as cached:
+                self.assertEqual(cached.read(), PDF_CONTENT)
+
+        self.assertEqual(len(service.payloads), 1)
+
+    def test_unused_and_oversized_pdfs_are_evicted(self):
+        with FakePdfService() as service:
+            client = PdfServiceClient(service.url, self.cache_root, max_age=3600, max_size=2 * len(PDF_CONTENT))
+            paths = [client.get_pdf({"file": {"id": i}}) for i in range(4)]
+            old = time.time() - 7200
+            os.utime(paths[0], (old, old))
+            os.utime(paths[1], (old + 5400, old + 5400))
+            client.evict(force=True)
+
+        # the first is unused for too long, the second the least recently used above the size
+        self.assertEqual([os.path.exists(path) for path in paths], [False, False, True, True])
+
+
+class DailyReportTestCase(TestCase):
+    def setUp(self):
+        for code, name in [("CMB", "Colombo"), ("GAL", "Galle")]:
+            District.objects.create(code=code, name=name)
+        self.violence = Category.objects.create(code="1", top_category="Violence", sub_category="a")
+        self.law = Category.objects.create(code="2", top_category="Violation of election law", sub_category="b")
+        self.other = Category.objects.create(code="3", top_category="Other", sub_category="c")
+
+        organization = Organization.objects.create(code="pslk", displayName="ECLK")
+        self.hq = User.objects.create(username="hq")
+        self.hq.profile.organization = organization
+        self.hq.profile.division = Division.objects.create(code="hq", organization=organization, is_hq=True)
+        self.hq.profile.save()
+
+    def create(self, category, **fields):
+        return Incident.objects.create(title="t", description="d", refId=str(Incident.objects.count()),
+                                       incidentType=IncidentType.COMPLAINT.name, category=str(category.id), **fields)
+
+    def test_district_counts_are_counted_in_one_query(self):
+        incidents = [
+            self.create(self.violence, district="CMB", severity=2),
+            self.create(self.violence, district="CMB", severity=9),
+            self.create(self.law, district="CMB", severity=5),
+            self.create(self.other, district="XXX", severity=5),
+            self.create(self.other, district="CMB"),
+        ]
+        Incident.objects.filter(id__in=[incident.id for incident in incidents]) \
+            .update(created_date=timezone.now() - timedelta(days=2))
+
+        # the categories, the districts and the counts
+        with self.assertNumQueries(3):
+            data = get_daily_district_data()
+
+        self.assertEqual(data["complaintByDistrict"], [
+            {"violence": 2, "breachOfElectionLaws": 1, "other": 1, "minor": 2, "general": 1, "major": 1, "total": 4},
+            {"violence": 0, "breachOfElectionLaws": 0, "other": 0, "minor": 0, "general": 0, "major": 0, "total": 0},
+        ])
+        self.assertEqual(data["complaintTotalsByType"], data["complaintByDistrict"][0])
+
+    def test_summary_counts_eclk_complaints(self):
+        self.create(self.violence, created_by=self.hq)
+        self.create(self.other, created_by=self.hq)
+        self.create(self.other)
+
+        data = get_daily_summary_data()
+
+        for period in ["complaintsSummary", "complaintsPast24hours"]:
+            self.assertEqual(data[period]["national"], {"disputes": 1, "violationOfLaws": 0, "others": 1, "amount": 2})
+            self.assertEqual(data[period]["district"], {"disputes": 0, "violationOfLaws": 0, "others": 0, "amount": 0})
+            self.assertEqual(data[period]["totals"], data[period]["national"])
+
+
+def legacy_category_dict(incidents):
+    """ get_category_dict before the counting moved to the database """
+    category_count = {}
+    for incident in incidents:
+        category_count[incident.category] = category_count.get(incident.category, 0) + 1
+
+    temp_category_dict = {}
+    top_categories = []
+    for category in Category.objects.all():
+        sub_cat = {"name": category.sn_sub_category, "count": category_count.get(str(category.id), 0)}
+        if category.top_category in temp_category_dict:
+            temp_category_dict[category.top_category]["subCategories"].append(sub_cat)
+        else:
+            top_categories.append(category.top_category)
+            temp_category_dict[category.top_category] = {
+                "categoryNameSinhala": category.sn_top_category,
+                "categoryNameTamil": category.tm_top_category,
+                "subCategories": [sub_cat]
+            }
+
+    return [temp_category_dict[category] for category in top_categories]
+
+
+class CategoryDictTestCase(TestCase):
+    def setUp(self):
+        categories = []
+        for i, top_category in enumerate(["Violence", "Other", "Violence", "Violation of election law", "Other"]):
+            categories.append(Category.objects.create(
+                code=str(i), top_category=top_category, sub_category="sub %d" % i,
+                sn_top_category="sn %s" % top_category, tm_top_category="tm %s" % top_category,
+                sn_sub_category="sn sub %d" % i))
+
+        for i, category in enumerate([categories[0], categories[0], categories[2], categories[4], None, "999"]):
+            Incident.objects.create(title="t", description="d", refId=str(i),
+                                    category=category if category in [None, "999"] else str(category.id))
+
+    def test_output_is_identical_to_the_python_count(self):
+        for incidents in [Incident.objects.all(), Incident.objects.filter(refId__in=["0", "3"]),
+                          Incident.objects.none()]:
+            self.assertEqual(get_category_dict(incidents), legacy_category_dict(incidents))
+
+    def test_category_tree_is_cached_until_categories_change(self):
+        get_category_dict(Incident.objects.all())
+        # the category version and the counts
+        with self.assertNumQueries(2):
+            get_category_dict(Incident.objects.all())
+
+        Category.objects.create(code="new", top_category="New", sn_sub_category="sn new")
+        self.assertEqual(get_category_dict(Incident.objects.all()), legacy_category_dict(Incident.objects.all()))
+
+    def test_categories_added_by_other_processes_are_not_served_stale(self):
+        get_category_dict(Incident.objects.all())
+        # bulk_create sends no post_save, like a category saved by another process
+        Category.objects.bulk_create([Category(code="new", top_category="New", sn_sub_category="sn new")])
+
+        self.assertEqual(get_category_dict(Incident.objects.all()), legacy_category_dict(Incident.objects.all()))
+
+
+@override_settings(REPORTING_MAX_REPLICA_LAG=30, REPORTING_REPLICA_CHECK_INTERVAL=60)
+class ReportingRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        db_router._replica_health.update(checked_at=None, healthy=False)
+        self.addCleanup(db_router._replica_health.update, checked_at=None, healthy=False)
+
+    def with_replica(self, lag):
+        """ Configures a reporting database that is lag seconds behind (or raises lag) """
+        databases = mock.patch.dict(connections.databases, {"reporting": dict(connections.databases["default"])})
+        databases.start()
+        self.addCleanup(databases.stop)
+        patch = mock.patch.object(db_router, "get_replica_lag", side_effect=[lag])
+        self.lag = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_reads_stay_on_the_primary_without_a_replica(self):
+        router = ReportingRouter()
+        self.assertIsNone(router.db_for_read(Incident))
+
+        with mock.patch.dict(connections.databases):
+            connections.databases.pop("reporting", None)
+            with reporting_reads() as alias:
+                self.assertEqual(alias, "default")
+                self.assertEqual(router.db_for_read(Incident), "default")
+
+    def test_reads_go_to_a_replica_within_the_lag_threshold(self):
+        self.with_replica(5)
+        router = ReportingRouter()
+
+        with reporting_reads():
+            self.assertEqual(router.db_for_read(Incident), "reporting")
+            self.assertEqual(router.db_for_write(Incident), "default")
+        self.assertIsNone(router.db_for_read(Incident))
+
+        # the lag is checked once per interval
+        self.assertEqual(get_reporting_db(), "reporting")
+        self.assertEqual(self.lag.call_count, 1)
+
+    def test_lagging_or_broken_replicas_fall_back_to_the_primary(self):
+        for lag in [120, None, DatabaseError("gone away")]:
+            with self.subTest(lag=lag):
+                db_router._replica_health["checked_at"] = None
+                self.with_replica(lag)
+                self.assertEqual(get_reporting_db(), "default")
+
+    def test_other_threads_do_not_wait_for_a_running_check(self):
+        self.with_replica(5)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_lag(alias):
+            started.set()
+            release.wait(10)
+            return 5
+        self.lag.side_effect = slow_lag
+
+        check = threading.Thread(target=db_router.is_replica_healthy)
+        check.start()
+        started.wait(10)
+        # the last answer, the primary, while the replica is being checked
+        self.assertEqual(get_reporting_db(), "default")
+        release.set()
+        check.join(10)
+
+        self.assertEqual(get_reporting_db(), "reporting")
+        self.assertEqual(self.lag.call_count, 1)
+
+
+@override_settings(REPORTING_MAX_REPLICA_LAG=30, REPORTING_REPLICA_CHECK_INTERVAL=60)
+class ReportingReplicaTestCase(TestCase):
+    """ Runs reports with a second database alias, a mirror of the test database like the
+        reporting database of settings.py in tests
+    """
+    databases = {"default", "reporting"}
+
+    @classmethod
+    def setUpClass(cls):
+        default = connections.databases["default"]
+        cls.reporting = mock.patch.dict(connections.databases, {
+            "reporting": dict(default, TEST=dict(default["TEST"], MIRROR="default"))
+        })
+        cls.reporting.start()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections["reporting"].close()
+        del connections["reporting"]
+        cls.reporting.stop()
+
+    def setUp(self):
+        db_router._replica_health.update(checked_at=None, healthy=False)
+        self.addCleanup(db_router._replica_health.update, checked_at=None, healthy=False)
+
+    def test_report_reads_go_to_the_reporting_database(self):
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["reporting"]) as replica:
+            with reporting_reads() as alias:
+                services.get_summary_report_html("category_wise_summary_report", "2020-01-01 16:00:00",
+                                                 "2020-01-31 16:00:00", False, True, False)
+
+        self.assertEqual(alias, "reporting")
+        self.assertGreater(len(replica), 0)
+        self.assertEqual([query["sql"] for query in primary], [])
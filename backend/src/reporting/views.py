@@ -1,24 +1,23 @@
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
-from django.http import HttpResponse
-from xhtml2pdf import pisa
+from django.http import HttpResponse, FileResponse
+from django.shortcuts import get_object_or_404
 import datetime
-from django.db import connection
-import pandas as pd
-import requests
-import json
-from django.conf import settings
-import urllib
 import os
 
-from .services import get_police_division_summary, get_category_summary, \
-    get_mode_summary, get_severity_summary, get_status_summary, get_subcategory_summary, get_district_summary, \
-    get_incident_date_summary, get_slip_data, get_daily_category_data, get_daily_summary_data, get_daily_district_data, \
+from .services import get_slip_data, get_daily_category_data, get_daily_summary_data, get_daily_district_data, \
     get_weekly_closed_complain_category_data, get_weekly_closed_complain_organization_data, \
     get_organizationwise_data_with_timefilter, \
-    get_total_requests_by_category_for_a_selected_time, get_category_data_by_date_range
-from .functions import apply_style, decode_column_names, incident_type_title, incident_type_query
+    get_total_requests_by_category_for_a_selected_time, get_category_data_by_date_range, \
+    get_summary_report_html, get_summary_report_tables, submit_report_job, get_report_path, get_pdf_service_client, \
+    SUMMARY_REPORTS
+from .functions import render_report_csv, render_report_json, parse_report_date
+from .pdf import render_pdf
+from .exceptions import PdfServiceException
+from ..db_router import reporting_reads
+from .models import ReportJob, ReportJobStatus
+from .serializers import ReportJobSerializer
 
 '''
 middleware to access PDF-service
@@ -36,8 +35,7 @@ class ReportingAccessView(APIView):
     '''
     permission_classes = []
 
-    def get(self, request):
-        endpoint_uri = settings.PDF_SERVICE_ENDPOINT
+    def get_payload(self, request):
         json_dict = {}
         template_type = request.query_params.get('template_type')
 
@@ -119,20 +117,26 @@ class ReportingAccessView(APIView):
             """
             json_dict["file"] = get_daily_district_data()
 
-        print(json_dict)
-        request_data = json.dumps(json_dict)
-        res = requests.post(url=endpoint_uri, data=request_data, headers={'content-type': 'application/json'})
+        return json_dict
 
-        if res.status_code == 200:
-            pdf_file = requests.get(res.json()["url"])
+    def get(self, request):
+        # the slip is printed right after the incident is created, so it is not read from the replica
+        if request.query_params.get('template_type') == "slip":
+            json_dict = self.get_payload(request)
+        else:
+            with reporting_reads():
+                json_dict = self.get_payload(request)
 
-            response = HttpResponse(content=pdf_file.content, content_type='application/pdf')
-            response['Access-Control-Expose-Headers'] = 'Title'
-            response['Title'] = 'report_' + datetime.date.today().strftime("%Y%m%d%H%M%S") + ".pdf"
+        try:
+            pdf = get_pdf_service_client().open_pdf(json_dict)
+        except PdfServiceException as e:
+            return HttpResponse(status=e.status_code, content=e.text, content_type='application/json')
 
-            return response
-        else:
-            return HttpResponse(status=res.status_code, content=res.text, content_type='application/json')
+        response = FileResponse(pdf, content_type='application/pdf')
+        response['Access-Control-Expose-Headers'] = 'Title'
+        response['Title'] = 'report_' + datetime.date.today().strftime("%Y%m%d%H%M%S") + ".pdf"
+
+        return response
 
 
 class ReportingView(APIView):
@@ -163,83 +167,65 @@ class ReportingView(APIView):
         if param_report is None or param_report == "":
             return Response("No report specified", status=status.HTTP_400_BAD_REQUEST)
 
-        table_html = None
-        table_title = None
-        incident_type_string = incident_type_title(complain, inquiry)
-
-        # if param_report == "police_division_summary_report":
-        #     table_html = get_police_division_summary()
-        #     table_title = "Police Division Summary Report"
+        if param_report not in SUMMARY_REPORTS:
+            return Response("Report not found", status=status.HTTP_400_BAD_REQUEST)
 
-        layout = "A4 portrait"
-        title = """from %s to %s by """ % (start_date, end_date)
-        if param_report == "category_wise_summary_report":
-            table_html = get_category_summary(start_date, end_date, detailed_report, complain, inquiry)
-            if detailed_report:
-                table_title = title + "District and Category"
+        if parse_report_date(start_date) is None or parse_report_date(end_date) is None:
+            return Response("Invalid start_date or end_date", status=status.HTTP_400_BAD_REQUEST)
+
+        # large reports are rendered by the report workers when ?async=true is given
+        if self.request.query_params.get('async', 'false') == 'true':
+            job = submit_report_job(request.user, param_report, start_date, end_date, detailed_report, complain,
+                                    inquiry)
+            return Response(ReportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+        # the report tables are also served as data with ?output=csv or ?output=json
+        output = self.request.query_params.get('output', 'pdf')
+        with reporting_reads():
+            if output in ('csv', 'json'):
+                tables = get_summary_report_tables(param_report, start_date, end_date, detailed_report, complain,
+                                                   inquiry)
             else:
-                table_title = title + "Category"
+                table_html, title = get_summary_report_html(param_report, start_date, end_date, detailed_report,
+                                                            complain, inquiry)
 
-        elif param_report == "mode_wise_summary_report":
-            table_html = get_mode_summary(start_date, end_date, detailed_report, complain, inquiry)
-            if detailed_report:
-                layout = "A4 landscape"
-                table_title = title + "District and Mode"
-            else:
-                table_title = title + "Mode"
+        if output == 'csv':
+            response = HttpResponse(render_report_csv(tables), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="%s.csv"' % param_report
+            return response
+        if output == 'json':
+            return Response({"report": param_report, "tables": render_report_json(tables)})
 
-        elif param_report == "district_wise_summary_report":
-            table_html = get_district_summary(start_date, end_date, detailed_report, complain, inquiry)
-            table_title = title + "District"
+        # rendered in the pdf render pool, see reporting.pdf
+        response = HttpResponse(render_pdf(table_html), content_type='application/pdf')
+        response['Access-Control-Expose-Headers'] = 'Title'
+        response['Title'] = title
+        return response
 
-        elif param_report == "severity_wise_summary_report":
-            table_html = get_severity_summary(start_date, end_date, detailed_report, complain, inquiry)
-            if detailed_report:
-                table_title = title + "District and Severity"
-            else:
-                table_title = title + "Severity"
 
-        elif param_report == "subcategory_wise_summary_report":
-            table_html = get_subcategory_summary(start_date, end_date, detailed_report, complain, inquiry)
-            if detailed_report:
-                layout = "A3 landscape"
-                table_title = title + "District and Subcategory"
-            else:
-                table_title = title + "Subcategory"
+class ReportJobView(APIView):
+    """
+    Status of a report job
+    """
 
-        elif param_report == "incident_date_wise_summary_report":
-            table_html = get_incident_date_summary(start_date, end_date, detailed_report, complain, inquiry)
-            table_title = title + "Incident Date"
+    def get(self, request, job_id, format=None):
+        job = get_object_or_404(ReportJob, id=job_id)
+        return Response(ReportJobSerializer(job).data)
 
-        elif param_report == "status_wise_summary_report":
-            table_html = get_status_summary(start_date, end_date, detailed_report, complain, inquiry)
-            if detailed_report:
-                table_title = title + "District and Status"
-            else:
-                table_title = title + "Status"
 
-        if table_html is None:
-            return Response("Report not found", status=status.HTTP_400_BAD_REQUEST)
+class ReportJobDownloadView(APIView):
+    """
+    Rendered pdf of a finished report job
+    """
+
+    def get(self, request, job_id, format=None):
+        job = get_object_or_404(ReportJob, id=job_id, status=ReportJobStatus.DONE.name)
+
+        path = get_report_path(job.key)
+        if not os.path.exists(path):
+            return Response("Report is no longer available", status=status.HTTP_410_GONE)
 
-        # Prepare report header
-        sql3 = incident_type_query(complain, inquiry)
-        sql = """SELECT
-                     Count(id) as TotalCount
-                 FROM   incidents_incident WHERE %s""" % sql3
-        dataframe = pd.read_sql_query(sql, connection)
-        total_count = dataframe['TotalCount'][0]
-
-        table_html = apply_style(
-            decode_column_names(table_html)
-                .replace(".0", "", -1)
-                .replace("(Total No. of Incidents)",
-                         """<strong>(Total No. of Incidents from %s to %s)</strong>""" % (start_date, end_date), -1)
-                .replace("(Unassigned)", "<strong>(Unassigned)</strong>", -1)
-            , table_title, incident_type_string, layout, total_count)
-
-        response = HttpResponse(content_type='application/pdf')
+        response = FileResponse(open(path, "rb"), content_type='application/pdf')
         response['Access-Control-Expose-Headers'] = 'Title'
-        response['Title'] = """Incidents reported within the period %s %s %s.pdf""" % (
-            table_title, incident_type_string, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        pisa.CreatePDF(table_html, dest=response)
+        response['Title'] = job.title
         return response
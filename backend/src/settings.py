@@ -81,12 +81,42 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'src.urls'
 
-# TODO: need to use redis channel layer in prod
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+# notifications only reach sockets of other worker processes through redis,
+# the in memory layer is limited to a single process
+CHANNEL_REDIS_URL = env_var('CHANNEL_REDIS_URL')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [CHANNEL_REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# cache shared by all web and worker processes, the permission, count and category caches
+# are only invalidated across processes with a shared backend
+CACHE_REDIS_URL = env_var('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    # single process development servers only
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
 
 TEMPLATES = [
     {
@@ -121,6 +151,24 @@ DATABASES = {
     }
 }
 
+# report and export reads go to a read replica when REPORTING_DATABASE_HOST is set, see src.db_router.
+# Reads fall back to the primary while the replica is more than REPORTING_MAX_REPLICA_LAG seconds behind.
+if env_var('REPORTING_DATABASE_HOST'):
+    DATABASES['reporting'] = dict(
+        DATABASES['default'],
+        NAME=env_var('REPORTING_DATABASE_NAME', DATABASES['default']['NAME']),
+        USER=env_var('REPORTING_DATABASE_USER', DATABASES['default']['USER']),
+        PASSWORD=env_var('REPORTING_DATABASE_PWD', DATABASES['default']['PASSWORD']),
+        HOST=env_var('REPORTING_DATABASE_HOST'),
+        PORT=env_var('REPORTING_DATABASE_PORT', DATABASES['default']['PORT']),
+        # tests read the rows they write to the primary
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['src.db_router.ReportingRouter']
+REPORTING_MAX_REPLICA_LAG = int(env_var('REPORTING_MAX_REPLICA_LAG', 30))
+REPORTING_REPLICA_CHECK_INTERVAL = int(env_var('REPORTING_REPLICA_CHECK_INTERVAL', 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -192,6 +240,13 @@ X_FRAME_OPTIONS = "ALLOW ALL"
 MEDIA_URL = '/app/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# rendered pdf reports, see reporting.services.submit_report_job
+REPORT_ROOT = env_var('REPORT_ROOT', os.path.join(MEDIA_ROOT, 'reports'))
+
+# pdf render processes and the directory of their report fonts, see reporting.pdf
+PDF_RENDER_WORKERS = int(env_var('PDF_RENDER_WORKERS', os.cpu_count() or 1))
+PDF_FONT_ROOT = env_var('PDF_FONT_ROOT', os.path.join(BASE_DIR, 'fonts'))
+
 # set seeder folder for loaddata
 FIXTURE_DIRS = [
     "./seeddata/"
@@ -199,6 +254,12 @@ FIXTURE_DIRS = [
 
 # PDF endpoint for report generation
 PDF_SERVICE_ENDPOINT = env_var('PDF_SERVICE_ENDPOINT')
+# generated pdfs are cached by the hash of their payload, see reporting.pdf_service
+PDF_SERVICE_CACHE_ROOT = env_var('PDF_SERVICE_CACHE_ROOT', os.path.join(MEDIA_ROOT, 'pdf-service'))
+PDF_SERVICE_CONNECTIONS = int(env_var('PDF_SERVICE_CONNECTIONS', 4))
+# cached pdfs unused for this many seconds are evicted, as are the oldest ones above the size in bytes
+PDF_SERVICE_CACHE_MAX_AGE = int(env_var('PDF_SERVICE_CACHE_MAX_AGE', 7 * 24 * 60 * 60))
+PDF_SERVICE_CACHE_MAX_SIZE = int(env_var('PDF_SERVICE_CACHE_MAX_SIZE', 1024 * 1024 * 1024))
 
 # election constant - not in use
 # ELECTION = env_var('ELECTION')
@@ -214,3 +275,24 @@ EMAIL_USE_SSL = env_var('EMAIL_USE_SSL', False)
 
 SMS_GATEWAY_USER=env_var('SMS_GATEWAY_USER')
 SMS_GATEWAY_PASSWORD=env_var('SMS_GATEWAY_PASSWORD')
+SMS_GATEWAY_URL=env_var('SMS_GATEWAY_URL', 'http://lankagate.gov.lk:9080/services/GovSMSMTHandlerProxy?wsdl')
+# messages per second allowed towards the gateway, and concurrent connections
+SMS_GATEWAY_RATE=float(env_var('SMS_GATEWAY_RATE', 10))
+SMS_GATEWAY_CONNECTIONS=int(env_var('SMS_GATEWAY_CONNECTIONS', 4))
+
+# notification fan-out reports the timing of each batch at info level
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'src.notifications': {
+            'handlers': ['console'],
+            'level': env_var('NOTIFICATION_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
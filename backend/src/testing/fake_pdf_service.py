@@ -0,0 +1,67 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PDF_CONTENT = b"%PDF-1.4 fake pdf-service output\n" * 1024
+
+
+class FakePdfService:
+    """ Local stand-in for the pdf-service used by the tests. It records the payloads it
+        generated pdfs for, the number of connections opened and serves each pdf from /files/.
+        A body replaces the json response of the generate requests.
+    """
+
+    def __init__(self, status=200, body=None):
+        self.status = status
+        self.body = body
+        self.payloads = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with service.lock:
+                    service.connections += 1
+
+            def send_body(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+                if service.status != 200:
+                    self.send_body(service.status, "application/json", b'{"error": "failed"}')
+                    return
+
+                with service.lock:
+                    service.payloads.append(payload)
+                    number = len(service.payloads)
+                body = service.body or json.dumps({"url": "%s/files/%d.pdf" % (service.base_url, number)}).encode("utf-8")
+                self.send_body(200, "application/json", body)
+
+            def do_GET(self):
+                self.send_body(200, "application/pdf", PDF_CONTENT)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.url = "%s/generate" % self.base_url
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
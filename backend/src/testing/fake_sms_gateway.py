@@ -0,0 +1,66 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import unescape
+
+SMS_RESPONSE = b"""<?xml version='1.0' encoding='utf-8'?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><SMSResponse><status>OK</status></SMSResponse></soapenv:Body>
+</soapenv:Envelope>
+"""
+
+
+class FakeSmsGateway:
+    """ Local stand-in for the sms gateway used by the tests and benchmark_sms.
+        It records the delivered messages and the number of connections opened.
+    """
+
+    def __init__(self, status=200, delay=0):
+        self.status = status
+        self.delay = delay
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with gateway.lock:
+                    gateway.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+                if gateway.delay:
+                    threading.Event().wait(gateway.delay)
+
+                if gateway.status == 200:
+                    number = re.search(r"<v1:recepient>(.*?)</v1:recepient>", body, re.S).group(1)
+                    message = re.search(r"<v1:outSms>(.*?)</v1:outSms>", body, re.S).group(1)
+                    with gateway.lock:
+                        gateway.messages.append((unescape(number), unescape(message)))
+
+                self.send_response(gateway.status)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(SMS_RESPONSE)))
+                self.end_headers()
+                self.wfile.write(SMS_RESPONSE)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:%d/services/GovSMSMTHandlerProxy" % self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
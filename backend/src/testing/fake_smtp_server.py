@@ -0,0 +1,73 @@
+import socketserver
+import threading
+
+
+class FakeSmtpServer:
+    """ Minimal local smtp server used by the tests and benchmark_email. It records
+        the delivered messages and the number of connections opened.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        smtp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def reply(self, line):
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                with smtp.lock:
+                    smtp.connections += 1
+
+                recipients = []
+                self.reply("220 localhost ESMTP")
+                for raw in self.rfile:
+                    command = raw.decode("utf-8").strip()
+                    verb = command.split(" ", 1)[0].upper()
+
+                    if verb in ("EHLO", "HELO"):
+                        self.reply("250 localhost")
+                    elif verb == "MAIL":
+                        recipients = []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        address = command.split(":", 1)[1].strip().strip("<>")
+                        if address in smtp.reject:
+                            self.reply("550 Mailbox unavailable")
+                        else:
+                            recipients.append(address)
+                            self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = []
+                        for line in self.rfile:
+                            if line in (b".\r\n", b".\n"):
+                                break
+                            data.append(line)
+                        with smtp.lock:
+                            smtp.messages.append((recipients, b"".join(data).decode("utf-8")))
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        # RSET, NOOP
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -103,6 +103,14 @@ urlpatterns = [
         "reports/",
         report_views.ReportingView.as_view(),
     ),
+    path(
+        "reports/jobs/<uuid:job_id>",
+        report_views.ReportJobView.as_view(),
+    ),
+    path(
+        "reports/jobs/<uuid:job_id>/download",
+        report_views.ReportJobDownloadView.as_view(),
+    ),
     path(
         'pdfgen/',
         report_views.ReportingAccessView.as_view(),
@@ -115,6 +123,12 @@ urlpatterns = [
     path("notifications",
         notification_views.NotificationList.as_view()
     ),
+    path("notifications/unread-count",
+        notification_views.NotificationUnreadCount.as_view()
+    ),
+    path("notifications/read",
+        notification_views.NotificationBulkRead.as_view()
+    ),
     path("notifications/<uuid:notification_id>/read",
          notification_views.NotificationRead.as_view()
     ),
@@ -1,11 +1,43 @@
-from channels.auth import AuthMiddlewareStack
-from rest_framework.authtoken.models import Token
+import time
+
+from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser, User
+from django.db.models.signals import post_save, post_delete
 from rest_framework_jwt.settings import api_settings
 
 jwt_get_user_handler = api_settings.JWT_PAYLOAD_GET_USER_ID_HANDLER
 jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
 
+# websocket handshakes come in bursts when clients reconnect, so users are kept
+# in-process for a short while instead of being loaded on every connect
+WS_USER_CACHE_TIMEOUT = 60
+
+_user_cache = {}
+
+def invalidate_ws_user(user_id):
+    _user_cache.pop(user_id, None)
+
+def _invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_ws_user(instance.id)
+
+post_save.connect(_invalidate_cached_user, sender=User, dispatch_uid="ws_token_auth.user_saved")
+post_delete.connect(_invalidate_cached_user, sender=User, dispatch_uid="ws_token_auth.user_deleted")
+
+@database_sync_to_async
+def load_user(user_id):
+    return User.objects.filter(id=user_id).first()
+
+async def get_user(user_id):
+    """ Returns the user for a token, loaded off the event loop and cached for a short while """
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    user = await load_user(user_id)
+    _user_cache[user_id] = (now + WS_USER_CACHE_TIMEOUT, user)
+    return user
+
 class TokenAuthMiddleware:
     """
     Token authorization middleware for Django Channels 2
@@ -15,17 +47,33 @@ class TokenAuthMiddleware:
         self.inner = inner
 
     def __call__(self, scope):
+        return TokenAuthMiddlewareInstance(scope, self)
+
+class TokenAuthMiddlewareInstance:
+    """
+    Resolves the user of a single connection without blocking the event loop
+    """
+
+    def __init__(self, scope, middleware):
+        self.middleware = middleware
+        self.scope = dict(scope)
+        self.inner = self.middleware.inner
+
+    async def __call__(self, receive, send):
         try:
-            token_name, token_key = scope['query_string'].decode().split("=")
+            token_name, token_key = self.scope['query_string'].decode().split("=")
             payload = jwt_decode_handler(token_key)
-            
+
             if payload is not None:
-                scope['user'] = User.objects.get(id=payload['user_id'])
+                self.scope['user'] = await get_user(payload['user_id']) or AnonymousUser()
             else:
-                scope['user'] = None
+                self.scope['user'] = AnonymousUser()
         except Exception as e:
-            scope['user'] = None
-            
-        return self.inner(scope)
+            self.scope['user'] = AnonymousUser()
+
+        inner = self.inner(self.scope)
+        return await inner(receive, send)
 
-TokenAuthMiddlewareStack = lambda inner: TokenAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+# the token is the only credential of a notification socket, so the session and
+# auth middlewares (a session lookup per connect) are not part of the stack
+TokenAuthMiddlewareStack = lambda inner: TokenAuthMiddleware(inner)